@@ -0,0 +1,91 @@
+"""Benchmark brand detection: the linear KNOWN_BRANDS scan vs BrandMatcher.
+
+Usage: python benchmarks/bench_brands.py [--brands N] [--titles N]
+
+The brand list is KNOWN_BRANDS padded with generated names up to --brands,
+and the titles mix real brands, generated brands and filler words. The
+linear scan returns the first substring hit in list order; the matcher
+returns the longest whole-word brand, so the script also counts how often
+the two disagree.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+FILLER = ['men', 'women', 'cotton', 'slim', 'fit', 'shirt', 'running', 'shoe', 'pack', 'of', '2',
+          'bluetooth', 'headphone', 'black', 'solid', 'casual', 'kurti', 'mid-wash', 'jeans', '5G']
+
+
+def make_brands(count: int, rng: random.Random):
+    """KNOWN_BRANDS followed by generated names, one or two words each"""
+    brands = list(bot.KNOWN_BRANDS)
+    seen = {brand.lower() for brand in brands}
+    while len(brands) < count:
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).capitalize()
+                 for _ in range(rng.choice((1, 1, 1, 2)))]
+        name = ' '.join(words)
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            brands.append(name)
+    return brands
+
+
+def make_titles(count: int, brands, rng: random.Random):
+    """Product-like titles, most of them naming one brand"""
+    titles = []
+    for _ in range(count):
+        words = rng.sample(FILLER, rng.randint(4, 8))
+        if rng.random() < 0.8:
+            words.insert(rng.randint(0, 2), rng.choice(brands))
+        titles.append(' '.join(words))
+    return titles
+
+
+def linear_scan(title: str, brands) -> str:
+    """The previous lookup, first substring hit in list order"""
+    title_lower = title.lower()
+    for brand in brands:
+        if brand.lower() in title_lower:
+            return brand
+    return ''
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--brands', type=int, default=10000)
+    parser.add_argument('--titles', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    brands = make_brands(args.brands, rng)
+    titles = make_titles(args.titles, brands, rng)
+
+    start = time.perf_counter()
+    matcher = bot.BrandMatcher(brands)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear = [linear_scan(title, brands) for title in titles]
+    linear_us = (time.perf_counter() - start) / len(titles) * 1e6
+
+    start = time.perf_counter()
+    matched = [matcher.best(title) for title in titles]
+    matcher_us = (time.perf_counter() - start) / len(titles) * 1e6
+
+    differ = sum(1 for old, new in zip(linear, matched) if old != new)
+    print(f"{len(brands)} brands, {len(titles)} titles, automaton built in {build * 1000:.1f} ms")
+    print(f"linear scan {linear_us:9.1f} us per title")
+    print(f"matcher     {matcher_us:9.1f} us per title   speed-up {linear_us / matcher_us:.0f}x")
+    print(f"{differ} titles where the results differ (substring hits inside words, longer brands)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""A shop outage with and without the circuit breaker, against benchmarks/stand_in.py.
+
+Usage: python benchmarks/bench_breaker.py [--links N] [--latency-ms MS]
+
+Links cycle through the platforms and go through scrape_with_fallback
+with the bot's caches and limits, in three phases:
+
+warm      every product once, filling the product cache
+outage    Flipkart answers 503 to everything; half its links are products
+          from the warm phase whose cache entries have expired, half new
+recovery  Flipkart is back, once the breaker's open period is over (probes
+          failing during the outage may have doubled it); links that
+          arrive while the half-open probe is out still fail fast
+
+For each run: requests that reached Flipkart during the outage, ms per
+Flipkart and per other link, and how Flipkart links were answered (fresh
+scrape, stale cache, placeholder). With the breaker, the outage costs a
+handful of requests and known products are served stale.
+
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+from bench_pipeline import PLATFORMS  # noqa: E402
+
+OUTAGE = 'flipkart'
+OPEN_SECONDS = 1.0
+
+
+async def scrape_all(deal_bot, links):
+    """Scrape (platform, url) pairs concurrently the way _process_link does, returning per-link outcomes"""
+    semaphore = asyncio.Semaphore(bot.LINK_CONCURRENCY * 2)
+
+    async def one(platform: str, url: str):
+        async with semaphore:
+            start = time.perf_counter()
+            stale_before = bot.metrics._counters['fallbacks_total'].get(
+                (('kind', 'breaker_stale'), ('platform', platform)), 0)
+            info = await bot.ProductScraper.scrape_with_fallback(
+                url, deal_bot.session, cache=deal_bot.product_cache,
+                limiter=deal_bot.host_limiter, flight=deal_bot.scrape_flight
+            )
+            stale = bot.metrics._counters['fallbacks_total'].get(
+                (('kind', 'breaker_stale'), ('platform', platform)), 0) > stale_before
+            outcome = 'placeholder' if info.error else 'stale' if stale else 'fresh'
+            return platform, outcome, time.perf_counter() - start
+
+    return await asyncio.gather(*(one(platform, url) for platform, url in links))
+
+
+async def wait_until_not_open(breaker, patience: float):
+    """Sleep until no circuit is open, however far the outage's failed probes pushed its backoff"""
+    end = time.monotonic() + patience
+    while bot.CircuitBreaker.OPEN in breaker.states().values() and time.monotonic() < end:
+        await asyncio.sleep(0.05)
+
+
+def make_links(count: int, offset: int):
+    """(platform, cleaned product URL) cycling through the platforms"""
+    links = []
+    for n in range(offset, offset + count):
+        platform = PLATFORMS[n % len(PLATFORMS)]
+        links.append((platform, bot.SmartLinkProcessor.clean_affiliate_url_aggressive(
+            stand_in.product_url(platform, n))))
+    return links
+
+
+def summarize(results):
+    """ms per outage-platform link, ms per other link, outcome counts for the outage platform"""
+    outage = [seconds for platform, _, seconds in results if platform == OUTAGE]
+    others = [seconds for platform, _, seconds in results if platform != OUTAGE]
+    outcomes = {}
+    for platform, outcome, _ in results:
+        if platform == OUTAGE:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return (sum(outage) / max(1, len(outage)) * 1000, sum(others) / max(1, len(others)) * 1000, outcomes)
+
+
+async def run(args, breaker):
+    """The three phases with one breaker, returning printable numbers"""
+    bot.circuit_breaker = breaker
+    shop = stand_in.StandInShop(latency=args.latency_ms / 1000)
+    await shop.start()
+    deal_bot = bot.DealBot(dedup=bot.Deduplicator(content_window=0, db_path=None))
+    deal_bot.metrics_server = None
+    deal_bot.session = shop.make_session()
+    # Everything expires at once, so outage-phase hits on known products can only be stale ones
+    deal_bot.product_cache = bot.ProductCache(ttls={platform: 0.5 for platform in PLATFORMS})
+    await deal_bot.initialize()
+
+    warm = make_links(args.links, 0)
+    await scrape_all(deal_bot, warm)
+    await asyncio.sleep(0.6)
+
+    shop.failing[OUTAGE] = 503
+    requests_before = shop.platform_requests.get(OUTAGE, 0)
+    known = [link for link in warm if link[0] == OUTAGE]
+    outage = make_links(args.links, args.links)
+    outage += known[:len(known) // 2]
+    start = time.perf_counter()
+    outage_results = await scrape_all(deal_bot, outage)
+    outage_seconds = time.perf_counter() - start
+    outage_requests = shop.platform_requests.get(OUTAGE, 0) - requests_before
+
+    del shop.failing[OUTAGE]
+    await wait_until_not_open(breaker, OPEN_SECONDS * 2 ** 5)
+    recovery_results = await scrape_all(deal_bot, make_links(args.links, 2 * args.links))
+    closed = not breaker.states()
+
+    await deal_bot.cleanup()
+    await shop.stop()
+    return {
+        'outage_requests': outage_requests,
+        'outage_seconds': outage_seconds,
+        'outage': summarize(outage_results),
+        'recovery': summarize(recovery_results),
+        'known': len(known[:len(known) // 2]),
+        'closed': closed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=140, help='links per phase')
+    parser.add_argument('--latency-ms', type=float, default=50, help='stand-in response delay')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    bot.METRICS_PORT = None
+    os.chdir(tempfile.mkdtemp(prefix='bench_breaker_'))
+
+    results = {
+        'no breaker': await run(args, bot.CircuitBreaker(failure_threshold=10 ** 9)),
+        'breaker': await run(args, bot.CircuitBreaker(open_seconds=OPEN_SECONDS)),
+    }
+
+    for name, numbers in results.items():
+        outage_ms, other_ms, outcomes = numbers['outage']
+        recovery_ms, _, recovered = numbers['recovery']
+        print(f"{name:11s} outage: {numbers['outage_requests']:4d} requests to {OUTAGE}, "
+              f"{outage_ms:6.1f} ms per {OUTAGE} link, {other_ms:6.1f} ms per other link, "
+              f"{numbers['outage_seconds']:5.2f} s total, {OUTAGE} links {outcomes}")
+        print(f"{'':11s} recovery: {recovery_ms:6.1f} ms per {OUTAGE} link, {OUTAGE} links {recovered}")
+
+    failures = []
+    with_breaker, without = results['breaker'], results['no breaker']
+    if with_breaker['outage_requests'] > bot.BREAKER_FAILURE_THRESHOLD + bot.LINK_CONCURRENCY * 2:
+        failures.append(f"{with_breaker['outage_requests']} requests reached {OUTAGE} through an open circuit")
+    if with_breaker['outage'][2].get('stale', 0) < with_breaker['known'] // 2:
+        failures.append(f"known products were not served stale: {with_breaker['outage'][2]}")
+    # Links arriving while the half-open probe is out fail fast, the rest must be scraped again
+    recovered = with_breaker['recovery'][2]
+    if not with_breaker['closed'] or recovered.get('fresh', 0) < 0.8 * sum(recovered.values()):
+        failures.append(f"{OUTAGE} did not recover: {recovered}")
+    if with_breaker['outage_requests'] >= without['outage_requests']:
+        failures.append("the breaker did not cut requests to the failing shop")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   open circuit held requests back, served stale info and closed again")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,122 @@
+"""Bulk mode against benchmarks/stand_in.py: throughput, memory, and resuming after an interruption.
+
+Usage: python benchmarks/bench_bulk.py [--messages N] [--links-per-message N] [--page-kb KB]
+
+Writes a JSONL file of messages (a quarter of the links shortened), then
+runs BulkRunner over it twice: straight through, and stopped about half
+way then resumed from its checkpoint with a new runner, the way a killed
+process would be restarted. The two outputs must be identical and list
+every message once, in input order. Prints messages/s and links/s of the
+straight run and peak RSS, which should not grow with --messages.
+
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+from bench_pipeline import PLATFORMS, peak_rss_mb  # noqa: E402
+
+
+def write_messages(shop, path: str, count: int, per_message: int):
+    """One JSON object per message, links cycling through the platforms and every fourth one shortened"""
+    n = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            links = []
+            for _ in range(per_message):
+                platform = PLATFORMS[n % len(PLATFORMS)]
+                if n % 4 == 0 and platform in stand_in.SHORTLINK_HOSTS:
+                    short, target = stand_in.shortlink(platform, n)
+                    shop.add_shortlink(short, target)
+                    links.append(short)
+                else:
+                    links.append(stand_in.product_url(platform, n))
+                n += 1
+            f.write(json.dumps({'id': i, 'text': 'Deal of the day ' + ' '.join(links)}) + '\n')
+
+
+async def run(shop, messages: str, output: str, stop_after: int = 0):
+    """One BulkRunner pass with a fresh bot, cancelled once stop_after messages are written"""
+    deal_bot = bot.DealBot(dedup=bot.Deduplicator(content_window=0, db_path=None))
+    deal_bot.metrics_server = None
+    deal_bot.session = shop.make_session()
+    runner = bot.BulkRunner(deal_bot, output, checkpoint_every=50)
+    await deal_bot.initialize()
+
+    start = time.perf_counter()
+    task = asyncio.ensure_future(runner.run(messages))
+    if stop_after:
+        while not task.done() and runner.messages < stop_after:
+            await asyncio.sleep(0.01)
+        task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    elapsed = time.perf_counter() - start
+
+    # A new bot per run, the shared extraction pool is started again on first use
+    await deal_bot.cleanup()
+    return runner, elapsed
+
+
+def read_positions(path: str):
+    """Positions in an output file, in file order"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)['position'] for line in f]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--links-per-message', type=int, default=1)
+    parser.add_argument('--page-kb', type=int, default=0, help='pad fixtures to about this size')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.WARNING)
+    bot.METRICS_PORT = None
+    os.chdir(tempfile.mkdtemp(prefix='bench_bulk_'))
+    shop = stand_in.StandInShop(page_kb=args.page_kb)
+    await shop.start()
+    write_messages(shop, 'messages.jsonl', args.messages, args.links_per_message)
+
+    straight, elapsed = await run(shop, 'messages.jsonl', 'straight.jsonl')
+    interrupted, _ = await run(shop, 'messages.jsonl', 'resumed.jsonl', stop_after=args.messages // 2)
+    resumed, _ = await run(shop, 'messages.jsonl', 'resumed.jsonl')
+    await shop.stop()
+
+    links = args.messages * args.links_per_message
+    print(f"straight   {args.messages / elapsed:8.1f} messages/s {links / elapsed:8.1f} links/s   "
+          f"peak RSS {peak_rss_mb():.1f} MB")
+    print(f"resumed    stopped after {interrupted.messages} messages, resumed at position {interrupted.position}")
+
+    failures = []
+    if read_positions('straight.jsonl') != list(range(args.messages)):
+        failures.append("straight output is not every message once in order")
+    if Path('straight.jsonl').read_bytes() != Path('resumed.jsonl').read_bytes():
+        failures.append("resumed output differs from the straight run")
+    if not 0 < interrupted.messages < args.messages:
+        failures.append(f"interruption did not land mid-run ({interrupted.messages} messages)")
+    if straight.failed or resumed.messages != args.messages:
+        failures.append(f"{straight.failed} failed, resumed run counted {resumed.messages} messages")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   outputs identical and complete")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,133 @@
+"""Message deadline against hanging shops, using benchmarks/stand_in.py.
+
+Usage: python benchmarks/bench_deadline.py [--messages N] [--deadline S]
+
+Every message carries a price in its text and three links: an Amazon
+product that answers normally, a Snapdeal product whose shop hangs, and a
+Flipkart shortlink whose shortener hangs. With a deadline, each message
+must come back within it (plus a little scheduling slack): the Amazon
+link fully scraped, the two hung links as replies built from the
+message's own info. The hung requests must not count against the shops
+in the circuit breaker. Without a deadline the same message is still
+waiting when the harness gives up on it.
+
+A message with time to spare that joins a slow scrape started by one
+about to run out must still get the scraped product: the shared scrape
+does not inherit the first message's deadline.
+
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+
+HANG_SECONDS = 60
+SLACK = 0.5
+PATIENCE = 10
+SLOW_SECONDS = 1.0
+
+
+def make_message(shop, n: int) -> str:
+    """Message text with a price and three links, one healthy and two that hang"""
+    short, target = stand_in.shortlink('flipkart', n)
+    shop.add_shortlink(short, target)
+    return (f"Loot deal, grab it fast at ₹1299 only\n"
+            f"{stand_in.product_url('amazon', n)}\n{stand_in.product_url('snapdeal', n)}\n{short}")
+
+
+async def process(deal_bot, text: str, chat_id: int, deadline_seconds):
+    """_process_links for one message the way _handle_message runs it, returning results and seconds"""
+    start = time.perf_counter()
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    links = bot.SmartLinkProcessor.extract_all_links(text)
+    results = await deal_bot._process_links(links, text, chat_id, deadline)
+    return results, time.perf_counter() - start
+
+
+async def joined(deal_bot, shop, n: int):
+    """Replies to two messages for one slow product, the second with time to spare joining the first's scrape"""
+    shop.delays['flipkart'] = SLOW_SECONDS
+    url = stand_in.product_url('flipkart', n)
+
+    async def message(chat_id: int, budget: float, after: float):
+        await asyncio.sleep(after)
+        return await deal_bot._process_links([url], url, chat_id, time.monotonic() + budget)
+
+    try:
+        (short,), (spare,) = await asyncio.gather(message(n, SLOW_SECONDS / 2, 0), message(n + 1, 8, 0.1))
+    finally:
+        del shop.delays['flipkart']
+    return short, spare
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10, help='messages processed at the same time')
+    parser.add_argument('--deadline', type=float, default=3, help='seconds per message')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    bot.METRICS_PORT = None
+    os.chdir(tempfile.mkdtemp(prefix='bench_deadline_'))
+    shop = stand_in.StandInShop(latency=0.02, delays={'snapdeal': HANG_SECONDS, 'fkrt.it': HANG_SECONDS})
+    await shop.start()
+    deal_bot = bot.DealBot(dedup=bot.Deduplicator(content_window=0, db_path=None))
+    deal_bot.metrics_server = None
+    deal_bot.session = shop.make_session()
+    await deal_bot.initialize()
+
+    runs = await asyncio.gather(*(
+        process(deal_bot, make_message(shop, n), n, args.deadline) for n in range(args.messages)
+    ))
+    seconds = sorted(elapsed for _, elapsed in runs)
+    print(f"deadline {args.deadline:.1f} s  {args.messages} messages: "
+          f"fastest {seconds[0]:.2f} s, slowest {seconds[-1]:.2f} s")
+
+    failures = []
+    if seconds[-1] > args.deadline + SLACK:
+        failures.append(f"a message took {seconds[-1]:.2f} s")
+    for results, _ in runs:
+        amazon, snapdeal, flipkart = results
+        if 'Nike' not in amazon:
+            failures.append(f"healthy link was not scraped: {amazon!r}")
+        for partial in (snapdeal, flipkart):
+            if '1299' not in partial:
+                failures.append(f"hung link reply lacks the message's price: {partial!r}")
+    if bot.circuit_breaker.states():
+        failures.append(f"deadline cuts opened circuits: {bot.circuit_breaker.states()}")
+
+    short, spare = await joined(deal_bot, shop, 10 ** 6)
+    print(f"joined scrape          short budget: {short.splitlines()[0]!r}, spare budget: {spare.splitlines()[0]!r}")
+    if 'Galaxy' not in spare:
+        failures.append(f"a message with time left got the reply of the one without: {spare!r}")
+
+    try:
+        _, elapsed = await asyncio.wait_for(
+            process(deal_bot, make_message(shop, args.messages), args.messages, None), PATIENCE
+        )
+        print(f"no deadline            one message:  {elapsed:.2f} s")
+    except asyncio.TimeoutError:
+        print(f"no deadline            one message:  still waiting after {PATIENCE} s")
+
+    await deal_bot.cleanup()
+    await shop.stop()
+
+    for failure in failures[:10]:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   every message answered within its deadline, hung links from manual info")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,108 @@
+"""Reply time for a private chat while busy groups wait out Telegram's group pacing.
+
+Usage: python benchmarks/bench_group_pacing.py [--groups N] [--links N] [--page-delay-ms MS]
+
+--groups group chats each post a message of --links product links, and
+half a second later a private chat posts a one-link message. Everything
+goes through DealBot.process_message, the chat dispatcher and the real
+outbound scheduler with Telegram's limits, against benchmarks/stand_in.py
+and a recording stand-in for the Telegram bot. Groups get one message
+every 1 / SEND_GROUP_RATE seconds, so their replies take a while to go
+out.
+
+Checks, with progressive replies off and on, that the private chat's
+first reply does not wait for the groups' pacing: it has to arrive
+within --dm-budget seconds. The groups' pages go through the same
+extraction pool, so the private chat does wait for some of that work,
+a few seconds against the --links / SEND_GROUP_RATE seconds of pacing.
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+from bench_progressive import RecordingBot  # noqa: E402
+
+PLATFORMS = ('flipkart', 'snapdeal', 'meesho', 'generic')  # The private chat's link is on a host of its own
+DM_CHAT_ID = 42
+
+
+def post(deal_bot: bot.DealBot, context, chat_id: int, text: str):
+    """Hand a message to the bot the way the Telegram application does"""
+    message = SimpleNamespace(chat_id=chat_id, message_id=1, text=text, caption=None)
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=message, channel_post=None)
+    return deal_bot.process_message(update, context)
+
+
+async def run(shop, progressive: bool, groups: int, links: int):
+    """Seconds to the private chat's first reply, and to the last group reply"""
+    bot.PROGRESSIVE_REPLY = progressive
+    bot.send_scheduler = bot.OutboundScheduler()
+    deal_bot = bot.DealBot(dedup=bot.Deduplicator(content_window=0, db_path=None))
+    deal_bot.metrics_server = None
+    deal_bot.session = shop.make_session()
+    recording = RecordingBot()
+    context = SimpleNamespace(bot=recording)
+
+    products = iter(range(10 ** 6))
+    for group in range(groups):
+        text = "Loot deals @499 rs\n" + "\n".join(
+            stand_in.product_url(PLATFORMS[i % len(PLATFORMS)], next(products)) for i in range(links)
+        )
+        await post(deal_bot, context, -1001 - group, text)
+
+    await asyncio.sleep(0.5)
+    start = time.perf_counter()
+    await post(deal_bot, context, DM_CHAT_ID,
+               f"Just this one @299 rs {stand_in.product_url('ajio', next(products))}")
+    while DM_CHAT_ID not in recording.first_reply:
+        await asyncio.sleep(0.01)
+    dm_seconds = recording.first_reply[DM_CHAT_ID] - start
+    busy = deal_bot.dispatcher.in_flight
+
+    # Let the groups' replies go out before the next run
+    while deal_bot.dispatcher.in_flight or deal_bot.deliveries:
+        await asyncio.sleep(0.1)
+    groups_seconds = time.perf_counter() - start
+    await deal_bot.cleanup()
+    return dm_seconds, busy, groups_seconds
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--links', type=int, default=6)
+    parser.add_argument('--page-delay-ms', type=float, default=200, help='shop response time')
+    parser.add_argument('--dm-budget', type=float, default=5.0, help='seconds the private chat may wait')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    bot.METRICS_PORT = None
+    os.chdir(tempfile.mkdtemp(prefix='bench_group_pacing_'))
+    delay = args.page_delay_ms / 1000
+    shop = stand_in.StandInShop(delays={platform: delay for platform in stand_in.PRODUCT_URLS})
+    await shop.start()
+
+    failures = 0
+    for name, progressive in (('off', False), ('on', True)):
+        dm_seconds, busy, groups_seconds = await run(shop, progressive, args.groups, args.links)
+        ok = dm_seconds <= args.dm_budget
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} progressive {name:3s}  private chat first reply {dm_seconds:6.2f} s, "
+              f"{busy} dispatcher slots busy then, groups done after {groups_seconds:5.1f} s")
+    await shop.stop()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,102 @@
+"""Requests and time per successful scrape, fixed header order vs the learned one.
+
+Usage: python benchmarks/bench_headers.py [--pages N] [--latency-ms MS]
+
+The stand-in shop turns away desktop browsers on Meesho and Ajio and
+mobile ones on Amazon, the way real storefronts push one client type to
+an app or interstitial. Each platform's pages are scraped in order with:
+
+fixed     the configured variant order every time, as before HeaderStrategy
+learned   HeaderStrategy ordering, starting with no stats
+race      learned, and racing the two leading variants while the leader is unproven
+
+The old loop also slept 1 s before every retry, which the fixed column
+leaves out, so its numbers are a lower bound for the previous code.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+
+BLOCKED = {'meesho': 'Windows', 'ajio': 'Windows', 'amazon': 'iPhone'}
+
+
+class FixedOrder(bot.HeaderStrategy):
+    """Always the configured order, nothing learned"""
+
+    def order(self, url: str, platform: str):
+        return list(self.variants)
+
+    def should_race(self, url: str, platform: str) -> bool:
+        return False
+
+
+async def scrape_all(shop, pages: int):
+    """Scrape pages products per platform one after another, returning per-platform numbers"""
+    numbers = {}
+    async with shop.make_session() as session:
+        for platform in sorted(stand_in.PRODUCT_URLS):
+            requests_before = shop.requests
+            start = time.perf_counter()
+            found = 0
+            for n in range(pages):
+                info = await bot.ProductScraper._try_scraping_methods(
+                    stand_in.product_url(platform, n), session, platform
+                )
+                found += info.found
+            numbers[platform] = {
+                'found': found,
+                'requests': (shop.requests - requests_before) / pages,
+                'ms': (time.perf_counter() - start) / pages * 1000,
+            }
+    return numbers
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=50, help='products scraped per platform')
+    parser.add_argument('--latency-ms', type=float, default=20, help='stand-in response delay')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    os.chdir(tempfile.mkdtemp(prefix='bench_headers_'))
+    shop = stand_in.StandInShop(latency=args.latency_ms / 1000, blocked=BLOCKED)
+    await shop.start()
+
+    results = {}
+    for name, strategy, race in (('fixed', FixedOrder(), False),
+                                 ('learned', bot.HeaderStrategy(), False),
+                                 ('race', bot.HeaderStrategy(), True)):
+        bot.header_strategy = strategy
+        bot.HEADER_RACE = race
+        results[name] = await scrape_all(shop, args.pages)
+    await shop.stop()
+    bot.extraction_pool.shutdown()
+
+    print(f"{'platform':10s}" + ''.join(f"{name:>24s}" for name in results))
+    print(f"{'':10s}" + f"{'req/page   ms/page':>24s}" * len(results))
+    for platform in sorted(stand_in.PRODUCT_URLS):
+        row = ''.join(
+            f"{numbers[platform]['requests']:12.2f} {numbers[platform]['ms']:9.1f}"
+            + ('  ' if numbers[platform]['found'] == args.pages else ' !')
+            for numbers in results.values()
+        )
+        print(f"{platform:10s}{row}")
+    for name, numbers in results.items():
+        requests = sum(n['requests'] for n in numbers.values()) / len(numbers)
+        ms = sum(n['ms'] for n in numbers.values()) / len(numbers)
+        print(f"{name:8s} mean {requests:5.2f} requests and {ms:7.1f} ms per successful scrape")
+    print("(! marks platforms where some pages were not scraped)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
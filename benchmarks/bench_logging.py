@@ -0,0 +1,93 @@
+"""Caller-side cost of the bot's logging, writing from the caller vs through the listener queue.
+
+Usage: python benchmarks/bench_logging.py [--messages N] [--links N]
+
+Replays the records one deal message produces (message, links, unshorten,
+scrape and payload lines, at the bot's levels) through LogPipeline in 'sync'
+and 'queue' mode, with bot.log in a scratch directory and the console
+silenced. Reports per-record time spent in the logging call on the caller's
+thread, which is the time an event loop would be blocked.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+
+def replay(messages: int, links: int):
+    """Log one message's worth of records per message, returning per-record seconds"""
+    timings = []
+    manual_info = bot.ProductInfo(price='499', brand='Nike', gender='Men')
+    product_info = bot.ProductInfo(title="Nike Men's Revolution 6 Running Shoe", price='499', sizes=('7', '8', '9'),
+                                   brand='Nike', gender='Men', platform='amazon')
+
+    def timed(call, *args):
+        start = time.perf_counter()
+        call(*args)
+        timings.append(time.perf_counter() - start)
+
+    for m in range(messages):
+        timed(bot.logger.info, "Processing message: %s...", f"Deal {m} Nike shoes @499 https://amzn.to/x{m}")
+        timed(bot.logger.info, "Found %d links", links)
+        timed(bot.log_payload, "Manual info", manual_info)
+        for i in range(links):
+            url = f"https://www.amazon.in/dp/B{m:05d}{i:04d}"
+            timed(bot.logger.info, "Processing link %d/%d: %s", i + 1, links, url)
+            timed(bot.logger.debug, "Cleaned URL: %s", url)
+            timed(bot.logger.debug, "Scraping %s with %s headers", 'amazon', 'desktop')
+            timed(bot.logger.debug, "Read %d bytes of %s page (%s)", 131072, 'amazon', 'fields found')
+            timed(bot.log_payload, "Product info for %s", product_info, url)
+    return timings
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(mode: str, args) -> str:
+    """Replay through a pipeline in one mode and summarise"""
+    pipeline = bot.LogPipeline(mode=mode, level='DEBUG' if args.debug else 'INFO', file=f'{mode}.log')
+    pipeline.start()
+    # Console output would dominate and is the same in both modes
+    for handler in (pipeline.listener.handlers if pipeline.listener else pipeline._attached):
+        if type(handler) is logging.StreamHandler:
+            handler.setStream(io.StringIO())
+
+    start = time.perf_counter()
+    timings = replay(args.messages, args.links)
+    caller = time.perf_counter() - start
+    pipeline.stop()
+    drained = time.perf_counter() - start
+
+    return (f"{mode:5s}  {len(timings)} records   caller {caller * 1000:8.1f} ms "
+            f"(p50 {percentile(timings, 0.5) * 1e6:6.1f} us, p99 {percentile(timings, 0.99) * 1e6:7.1f} us)   "
+            f"written after {drained * 1000:8.1f} ms   {os.path.getsize(f'{mode}.log') // 1024} KB, "
+            f"{pipeline.dropped} dropped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--links', type=int, default=3)
+    parser.add_argument('--debug', action='store_true', help='log at DEBUG, with payload sampling')
+    args = parser.parse_args()
+
+    bot.log_pipeline.stop()
+    bot.LOG_PAYLOAD_SAMPLE_RATE = 0.05
+    os.chdir(tempfile.mkdtemp(prefix='bench_logging_'))
+    for mode in ('sync', 'queue'):
+        print(run(mode, args))
+
+
+if __name__ == '__main__':
+    main()
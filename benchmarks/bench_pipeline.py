@@ -0,0 +1,239 @@
+"""Offline benchmark suite: extraction alone and the full DealBot link pipeline.
+
+Usage: python benchmarks/bench_pipeline.py [--links N] [--repeat N] [--page-kb KB]
+                                           [--json results.json] [--compare baseline.json]
+
+extraction  every fixture through ProductScraper._timed_extract on one core:
+            pages/s, mean and p95 ms per platform, peak RSS
+pipeline    DealBot._process_links over messages of --links-per-message links
+            (a quarter of them shortlinks) against benchmarks/stand_in.py over
+            TLS: links/s, p50/p99 per stage from the metrics registry, peak
+            RSS of the bot and of the extraction workers
+
+Inputs are deterministic and every repeat uses new product ids, so caches
+start cold. Throughput is the median over --repeat runs. --json saves the
+numbers; --compare reads a saved run and exits non-zero when throughput
+drops, or a stage p99 grows, by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+
+PLATFORMS = sorted(stand_in.PRODUCT_URLS)
+
+
+def peak_rss_mb(pid='self') -> float:
+    """Peak resident set size of a process in MB, from /proc on Linux"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Start a new peak RSS window where the kernel allows it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def bench_extraction(pages, rounds: int):
+    """Time extraction of every fixture, in this process"""
+    reset_peak_rss()
+    timings = {platform: [] for platform in pages}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for platform, html in pages.items():
+            _, _, parse_seconds = bot.ProductScraper._timed_extract(html, platform)
+            timings[platform].append(parse_seconds)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pages_per_sec': round(rounds * len(pages) / elapsed, 1),
+        'platform_ms': {
+            platform: {
+                'mean': round(statistics.mean(values) * 1000, 3),
+                'p95': round(percentile(values, 0.95) * 1000, 3),
+            }
+            for platform, values in timings.items()
+        },
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def make_messages(shop, count: int, per_message: int, offset: int):
+    """Messages of per_message links cycling through the platforms, every fourth link shortened"""
+    messages = []
+    n = offset
+    for _ in range(count):
+        links = []
+        for _ in range(per_message):
+            platform = PLATFORMS[n % len(PLATFORMS)]
+            if n % 4 == 0 and platform in stand_in.SHORTLINK_HOSTS:
+                short, target = stand_in.shortlink(platform, n)
+                shop.add_shortlink(short, target)
+                links.append(short)
+            else:
+                links.append(stand_in.product_url(platform, n))
+            n += 1
+        messages.append(links)
+    return messages
+
+
+async def run_pipeline(deal_bot, messages, offset: int) -> float:
+    """Process messages with the dispatcher's concurrency cap, returning wall seconds"""
+    semaphore = asyncio.Semaphore(bot.MAX_CONCURRENT_MESSAGES)
+
+    async def handle(i: int, links):
+        async with semaphore:
+            # Distinct chats, so content dedup never skips a link
+            results = await deal_bot._process_links(links, ' '.join(links), offset + i)
+            assert all(results), f"link dropped in message {i}"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(i, links) for i, links in enumerate(messages)))
+    return time.perf_counter() - start
+
+
+async def bench_pipeline(args):
+    """Full link pipeline against the stand-in shop"""
+    shop = stand_in.StandInShop(page_kb=args.page_kb, latency=args.latency_ms / 1000)
+    await shop.start()
+
+    deal_bot = bot.DealBot()
+    deal_bot.session = shop.make_session()
+    await deal_bot.initialize()
+
+    # Warm up connections and the extraction workers
+    await run_pipeline(deal_bot, make_messages(shop, 4, args.links_per_message, 10 ** 8), 10 ** 8)
+    reset_peak_rss()
+
+    count = max(1, args.links // args.links_per_message)
+    rates = []
+    for repeat in range(args.repeat):
+        offset = (repeat + 1) * 10 ** 6
+        messages = make_messages(shop, count, args.links_per_message, offset)
+        elapsed = await run_pipeline(deal_bot, messages, offset)
+        rates.append(count * args.links_per_message / elapsed)
+
+    stages = {}
+    for labels in bot.metrics.series('stage_seconds'):
+        key = f"{labels['stage']}/{labels['platform']}"
+        stages[key] = {
+            'p50_ms': round(bot.metrics.quantile('stage_seconds', 0.5, **labels) * 1000, 2),
+            'p99_ms': round(bot.metrics.quantile('stage_seconds', 0.99, **labels) * 1000, 2),
+        }
+
+    executor = bot.extraction_pool._executor
+    worker_pids = list(getattr(executor, '_processes', None) or {})
+    result = {
+        'links_per_sec': round(statistics.median(rates), 1),
+        'links_per_sec_runs': [round(rate, 1) for rate in rates],
+        'stages': dict(sorted(stages.items())),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'worker_peak_rss_mb': [round(peak_rss_mb(pid), 1) for pid in worker_pids],
+        'requests_served': shop.requests,
+    }
+
+    await deal_bot.cleanup()
+    await shop.stop()
+    return result
+
+
+def compare(results, baseline, tolerance: float) -> int:
+    """Print regressions against a saved run, returns how many there are"""
+    regressions = []
+    for section, key in (('extraction', 'pages_per_sec'), ('pipeline', 'links_per_sec')):
+        old, new = baseline.get(section, {}).get(key), results[section][key]
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"{section} {key}: {old} -> {new}")
+
+    old_stages = baseline.get('pipeline', {}).get('stages', {})
+    for stage, numbers in results['pipeline']['stages'].items():
+        old = old_stages.get(stage, {}).get('p99_ms')
+        # Sub-millisecond stages are all bucket noise
+        if old and old >= 1 and numbers['p99_ms'] > old * (1 + tolerance):
+            regressions.append(f"stage {stage} p99: {old} -> {numbers['p99_ms']} ms")
+
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"no regressions beyond {tolerance:.0%}")
+    return len(regressions)
+
+
+def report(results):
+    """Print the numbers of one run"""
+    extraction, pipeline = results['extraction'], results['pipeline']
+    print(f"extraction  {extraction['pages_per_sec']:8.1f} pages/s   peak RSS {extraction['peak_rss_mb']} MB")
+    for platform, numbers in extraction['platform_ms'].items():
+        print(f"  {platform:10s} mean {numbers['mean']:8.3f} ms   p95 {numbers['p95']:8.3f} ms")
+    print(f"pipeline    {pipeline['links_per_sec']:8.1f} links/s  runs {pipeline['links_per_sec_runs']}   "
+          f"peak RSS {pipeline['peak_rss_mb']} MB, workers {pipeline['worker_peak_rss_mb']} MB")
+    for stage, numbers in pipeline['stages'].items():
+        print(f"  {stage:22s} p50 {numbers['p50_ms']:9.2f} ms   p99 {numbers['p99_ms']:9.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=300, help='links per pipeline run')
+    parser.add_argument('--links-per-message', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=30, help='extraction passes over the fixtures')
+    parser.add_argument('--page-kb', type=int, default=64, help='pad fixtures to about this size')
+    parser.add_argument('--latency-ms', type=float, default=0, help='stand-in response delay')
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--compare', help='saved results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--log', action='store_true', help="keep the bot's INFO logging on")
+    args = parser.parse_args()
+
+    if not args.log:
+        bot.logger.setLevel(logging.WARNING)
+    # No metrics listener, and the bot's SQLite files go to a scratch directory
+    bot.METRICS_PORT = None
+    args.json = args.json and Path(args.json).resolve()
+    args.compare = args.compare and Path(args.compare).resolve()
+    os.chdir(tempfile.mkdtemp(prefix='bench_pipeline_'))
+
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'log')},
+        'extraction': bench_extraction(stand_in.load_fixtures(args.page_kb), args.rounds),
+        'pipeline': await bench_pipeline(args),
+    }
+    report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        return 1 if compare(results, json.loads(Path(args.compare).read_text()), args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,171 @@
+"""Time to first reply and to finished deals with and without progressive replies, against stand_in.py.
+
+Usage: python benchmarks/bench_progressive.py [--messages N] [--groups N] [--page-delay-ms MS]
+
+Messages of three links go through DealBot._handle_message with a
+recording stand-in for the Telegram bot, --messages private chats and
+--groups group chats, with the real outbound scheduler and Telegram's
+limits. Shop pages take --page-delay-ms to answer, like real
+storefronts. There are few groups, so their replies are bound by
+SEND_GROUP_RATE rather than by scraping.
+
+off   every link scraped, then the results sent
+on    results ready within PROGRESSIVE_REPLY_AFTER sent as they are, the
+      other links as placeholders, each edited into its result when done
+
+Checks that with progressive replies the chat ends up with the same
+texts, in the same order, as without, that no placeholder is left over,
+that no placeholder posts the message's affiliate shortlink and that
+groups, paced to SEND_GROUP_RATE, get their finished deals no later
+than without progressive replies. Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+
+
+class RecordingBot:
+    """The Bot API calls the deal pipeline makes, kept as a chat log per chat"""
+
+    def __init__(self):
+        self.chats = {}
+        self.sent_texts = []
+        self.first_reply = {}
+        self.finished = {}
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        self.first_reply.setdefault(chat_id, time.perf_counter())
+        self.sent_texts.append(text)
+        message = SimpleNamespace(chat_id=chat_id, message_id=next(self._ids), text=text)
+        self.chats.setdefault(chat_id, []).append(message)
+        self._record_finished(chat_id)
+        return message
+
+    async def edit_message_text(self, chat_id, text, message_id, **kwargs):
+        self.calls += 1
+        message = next(m for m in self.chats[chat_id] if m.message_id == message_id)
+        message.text = text
+        self._record_finished(chat_id)
+        return message
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls += 1
+        self.chats[chat_id] = [m for m in self.chats[chat_id] if m.message_id != message_id]
+        return True
+
+    def _record_finished(self, chat_id):
+        """When the chat's messages last changed, as long as none is a placeholder"""
+        if not any(bot.PROGRESSIVE_PLACEHOLDER_NOTE in m.text for m in self.chats[chat_id]):
+            self.finished[chat_id] = time.perf_counter()
+
+
+def make_text(shop, n: int) -> str:
+    """A message with a price, a product of each of three platforms and a shortlink among them"""
+    short, target = stand_in.shortlink('myntra', n)
+    shop.add_shortlink(short, target)
+    return (f"Deal of the day at ₹799\n{stand_in.product_url('flipkart', n)}\n{short}\n"
+            f"{stand_in.product_url('snapdeal', n)}")
+
+
+async def run(shop, progressive: bool, chat_ids):
+    """Handle a message in each chat, returning the recording bot and seconds to first reply and to finished deals"""
+    bot.PROGRESSIVE_REPLY = progressive
+    bot.send_scheduler = bot.OutboundScheduler()
+    deal_bot = bot.DealBot(dedup=bot.Deduplicator(content_window=0, db_path=None))
+    deal_bot.metrics_server = None
+    deal_bot.session = shop.make_session()
+    recording = RecordingBot()
+    context = SimpleNamespace(bot=recording)
+
+    async def handle(chat_id: int):
+        text = make_text(shop, abs(chat_id))
+        message = SimpleNamespace(chat_id=chat_id, message_id=1, text=text, caption=None)
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=message)
+        start = time.perf_counter()
+        await deal_bot._handle_message(update, context, message)
+        return chat_id, start
+
+    starts = dict(await asyncio.gather(*(handle(chat_id) for chat_id in chat_ids)))
+    await deal_bot.cleanup()
+    first = {chat_id: recording.first_reply[chat_id] - start for chat_id, start in starts.items()}
+    finished = {chat_id: recording.finished[chat_id] - start for chat_id, start in starts.items()}
+    return recording, first, finished
+
+
+def compare(off: RecordingBot, on: RecordingBot):
+    """Differences between the chats without and with progressive replies"""
+    failures = []
+    for chat_id, messages in off.chats.items():
+        expected = [m.text for m in messages]
+        got = [m.text for m in on.chats.get(chat_id, [])]
+        if got != expected:
+            failures.append(f"chat {chat_id}: {got} != {expected}")
+    if any(bot.PROGRESSIVE_PLACEHOLDER_NOTE in m.text for messages in on.chats.values() for m in messages):
+        failures.append("placeholders left in a chat")
+    if any(host in text for text in on.sent_texts for host in stand_in.SHORTLINK_HOSTS.values()):
+        failures.append("a placeholder posted a shortlink")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20, help='private chats, one message each')
+    parser.add_argument('--groups', type=int, default=3, help='group chats, one message each')
+    parser.add_argument('--page-delay-ms', type=float, default=1500, help='shop response time')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    bot.METRICS_PORT = None
+    os.chdir(tempfile.mkdtemp(prefix='bench_progressive_'))
+    delay = args.page_delay_ms / 1000
+    shop = stand_in.StandInShop(delays={platform: delay for platform in stand_in.PRODUCT_URLS})
+    await shop.start()
+
+    # The same products every time, the product cache is per DealBot so every run scrapes
+    chats = {'private': [n + 1 for n in range(args.messages)], 'group': [-1001 - n for n in range(args.groups)]}
+    results = {}
+    for kind, chat_ids in chats.items():
+        for name, progressive in (('off', False), ('on', True)):
+            results[kind, name] = await run(shop, progressive, chat_ids)
+    await shop.stop()
+
+    for (kind, name), (recording, first, finished) in results.items():
+        seconds, done = sorted(first.values()), sorted(finished.values())
+        print(f"{kind:7s} {name:4s} first reply p50 {statistics.median(seconds) * 1000:7.1f} ms, "
+              f"max {seconds[-1] * 1000:7.1f} ms, deals finished max {done[-1] * 1000:7.1f} ms, "
+              f"{recording.calls / len(chats[kind]):.1f} Bot API calls per message")
+
+    failures = []
+    for kind in chats:
+        failures += compare(results[kind, 'off'][0], results[kind, 'on'][0])
+    group_off, group_on = max(results['group', 'off'][2].values()), max(results['group', 'on'][2].values())
+    # Same scraping both times, the slack covers its jitter
+    if group_on > group_off + 0.5:
+        failures.append(f"groups finished after {group_on:.1f} s with progressive replies, {group_off:.1f} s without")
+
+    for failure in failures[:5]:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("ok   same final texts in the same order, no placeholders left, no shortlinks posted, "
+              "groups not slowed down")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
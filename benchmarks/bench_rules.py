@@ -0,0 +1,189 @@
+"""Micro-benchmark: per-message cost of the regex rules, raw pattern strings vs the compiled registry.
+
+Usage: python benchmarks/bench_rules.py [--rounds N]
+
+The "legacy" functions are the pre-registry MessageParser.extract_manual_info
+and ProductScraper._clean_title, kept here as the baseline. Brand lookup is
+not a regex rule, so both sides share BrandMatcher. Both sides are checked
+to give identical results on the corpus before timing, and every platform's
+URL cleaner must drop the tracking parameters from the URL corpus.
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+MESSAGES = [
+    "Nike Men's Running Shoe @1299 rs https://amzn.to/3xYzAbC",
+    "🔥 Loot deal! Puma Women Sneakers ₹899 only https://fkrt.it/abcDEF",
+    "Samsung Galaxy M14 5G 6GB/128GB Rs. 13,490 https://www.flipkart.com/p/itm123 pin 560001",
+    "Kurti for girls pack of 2 @349 rs https://meesho.com/s/p/3x9kzq 110001",
+    "boAt Rockerz 450 headphone price: 1299 https://www.amazon.in/dp/B07PR1CL3S?tag=xyz-21",
+    "Men's cotton t-shirt combo 3 pcs 499rs https://myntr.it/AbC12",
+    "Kids school bag 25 L @ 650 rs https://bit.ly/4deal",
+    "Allen Solly formal shirt for men just ₹ 799 https://ajio.me/xyz 400001",
+]
+
+TITLES = [
+    "Nike Men's Revolution 6 Next Nature Running Shoe : Amazon.in: Fashion",
+    "Samsung Galaxy M14 5G (Smoky Teal, 128 GB) Online at Best Price On Flipkart.com",
+    "Buy Roadster Men Black Solid Casual Shirt - Shirts for Men 2290315 | Myntra",
+    "Trendy Women Cotton Kurti - Meesho",
+    "boAt Rockerz 450 Bluetooth Headphone - Buy boAt Rockerz 450 Online at Low Price - Snapdeal",
+    "Prestige Svachh 5 L Pressure Cooker | HomeKart Store MRP ₹2,470 Save ₹821 33% off",
+    "Best Deal Exclusive Original Levi's 511 Slim Fit Jeans discount 50",
+]
+
+# Product URLs with tracking parameters, and what clean_affiliate_url_aggressive must leave of them
+URLS = [
+    ("https://www.amazon.in/boAt-Rockerz-450/dp/B07PR1CL3S?tag=xyz-21&ref=sr_1_3&th=1",
+     "https://www.amazon.in/dp/B07PR1CL3S"),
+    ("https://www.amazon.in/s?k=shoes&field-keywords=nike&tag=xyz-21",
+     "https://www.amazon.in/s?field-keywords=nike"),
+    ("https://www.flipkart.com/galaxy-m14/p/itm123?pid=MOBGZ4&affid=deals&lid=LSTMOB&cmpid=x",
+     "https://www.flipkart.com/p/MOBGZ4"),
+    ("https://www.meesho.com/kurti/p/3x9kzq?utm_source=telegram&utm_medium=share",
+     "https://www.meesho.com/kurti/p/3x9kzq"),
+    ("https://shop.example.in/item/42?utm_source=tg&ref=deal&color=red&fbclid=abc&size=M",
+     "https://shop.example.in/item/42?color=red&size=M"),
+]
+
+
+def legacy_extract_manual_info(message):
+    info = {'title': '', 'price': '', 'brand': '', 'gender': '', 'quantity': '', 'pin': ''}
+    price_patterns = [
+        r'@\s*(\d+)\s*rs',
+        r'₹\s*(\d+(?:,\d+)*)',
+        r'Rs\.?\s*(\d+(?:,\d+)*)',
+        r'price[:\s]+(\d+(?:,\d+)*)',
+        r'(\d+)\s*rs\b'
+    ]
+    for pattern in price_patterns:
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            price_str = match.group(1).replace(',', '')
+            try:
+                price_num = int(price_str)
+                if 10 <= price_num <= 1000000:
+                    info['price'] = str(price_num)
+                    break
+            except:  # noqa: E722
+                continue
+    pin_pattern = r'\b([1-9]\d{5})\b'
+    pin_matches = re.findall(pin_pattern, message)
+    for pin in pin_matches:
+        if pin[0] in '123456789':
+            info['pin'] = pin
+            break
+    info['brand'] = bot.brand_matcher.best(message)
+    for gender, patterns in bot.GENDER_KEYWORDS.items():
+        for pattern in patterns:
+            if re.search(pattern, message, re.IGNORECASE):
+                info['gender'] = gender
+                break
+        if info['gender']:
+            break
+    for pattern in bot.QUANTITY_PATTERNS:
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            if len(match.groups()) > 0:
+                quantity = match.group(1)
+            else:
+                quantity = match.group(0)
+            info['quantity'] = quantity.strip()
+            break
+    title = message
+    title = re.sub(r'https?://[^\s]+', '', title)
+    for pattern in price_patterns:
+        title = re.sub(pattern, '', title, flags=re.IGNORECASE)
+    title = re.sub(r'\b\d{6}\b', '', title)
+    title = ' '.join(title.split())
+    if title and len(title) > 3:
+        info['title'] = title[:60].strip()
+    return info
+
+
+def manual_fields(info):
+    """The fields of the legacy manual info dict, read from a ProductInfo"""
+    return {name: getattr(info, name) for name in ('title', 'price', 'brand', 'gender', 'quantity', 'pin')}
+
+
+def legacy_clean_title(title):
+    if not title:
+        return ''
+    noise_patterns = [
+        r'\s*-\s*Amazon\.in.*$', r'\s*:\s*Amazon\.in.*$', r'\s*\|\s*Flipkart\.com.*$',
+        r'\s*-\s*Buy.*$', r'\s*\|\s*Buy.*$', r'Buy\s+.*?online.*?at.*?price.*?$',
+        r'Shop\s+.*?online.*?$', r'\s*\|\s*Myntra.*$', r'\s*-\s*Meesho.*$',
+        r'\s*\|\s*.*\.com.*$', r'\s*-\s*.*\.in.*$', r'MRP.*?₹.*?\d+', r'Price.*?₹.*?\d+',
+        r'₹\d+.*?off', r'\d+%.*?off', r'discount.*?\d+', r'save.*?₹.*?\d+'
+    ]
+    clean = title
+    for pattern in noise_patterns:
+        clean = re.sub(pattern, '', clean, flags=re.IGNORECASE)
+    clean = ' '.join(clean.split())
+    promo_words = {
+        "deal", "offer", "sale", "special", "discount", "free",
+        "limited", "new", "buy", "shop", "trending", "exclusive",
+        "best", "lowest", "original", "authentic", "genuine", "brand", "hot"
+    }
+    words = clean.split()
+    filtered_words = [w for w in words if w.lower() not in promo_words and not re.match(r'^\W+$', w)]
+    seen = set()
+    final_words = [w for w in filtered_words if not (w.lower() in seen or seen.add(w.lower()))]
+    clean_title_str = " ".join(final_words).strip()
+    if len(clean_title_str) > 60:
+        clean_title_str = clean_title_str[:60]
+        if ' ' in clean_title_str:
+            clean_title_str = clean_title_str.rsplit(' ', 1)[0] + '...'
+    return clean_title_str
+
+
+def per_call(fn, inputs, rounds):
+    """Mean microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in inputs:
+            fn(item)
+    return (time.perf_counter() - start) / (rounds * len(inputs)) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    cases = [
+        ('extract_manual_info', legacy_extract_manual_info, bot.MessageParser.extract_manual_info, manual_fields,
+         MESSAGES),
+        ('_clean_title', legacy_clean_title, bot.ProductScraper._clean_title, str, TITLES),
+    ]
+
+    failed = False
+    for url, expected in URLS:
+        cleaned = bot.SmartLinkProcessor.clean_affiliate_url_aggressive(url)
+        if cleaned != expected:
+            print(f"MISMATCH clean_affiliate_url_aggressive: {url!r}\n  expected {expected!r}\n  got      {cleaned!r}")
+            failed = True
+
+    for name, legacy, current, comparable, inputs in cases:
+        for item in inputs:
+            if legacy(item) != comparable(current(item)):
+                print(f"MISMATCH {name}: {item!r}\n  legacy  {legacy(item)!r}\n  current {current(item)!r}")
+                failed = True
+
+        legacy_us = per_call(legacy, inputs, args.rounds)
+        current_us = per_call(current, inputs, args.rounds)
+        print(f"{name:20s} legacy {legacy_us:7.1f} us   compiled {current_us:7.1f} us   "
+              f"speed-up {legacy_us / current_us:4.2f}x")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
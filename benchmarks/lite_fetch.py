@@ -0,0 +1,203 @@
+"""Checks and numbers for the lite fetch tier, against benchmarks/stand_in.py.
+
+Usage: python benchmarks/lite_fetch.py [--pages N] [--page-kb KB]
+
+checks   for every platform, scraping through _scrape_product finds the
+         same title and price as extracting the full fixture page, when
+         the lite endpoint answers with its recorded response, a 404 or a
+         truncated body. Platforms with a lite tier must make one request
+         when it answers and fall back to the page when it does not. A lite
+         API answering 503 opens its own circuit, and the shop's pages
+         are still scraped. A lite endpoint that hangs leaves the page
+         fetch time within the message deadline, and one that keeps
+         missing stops being asked after LITE_SKIP_AFTER_MISSES requests.
+numbers  requests, response kilobytes sent by the stand-in and milliseconds per product with
+         the lite tier and with LITE_FETCH off
+
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+import stand_in  # noqa: E402
+
+PLATFORMS = sorted(stand_in.PRODUCT_URLS)
+
+
+async def scrape(shop, platform: str, pages: int, offset: int):
+    """Scrape pages products of one platform, returning results, requests, bytes and seconds"""
+    requests_before, bytes_before = shop.requests, shop.bytes_sent
+    start = time.perf_counter()
+    async with shop.make_session() as session:
+        results = [
+            await bot.ProductScraper._scrape_product(
+                bot.SmartLinkProcessor.clean_affiliate_url_aggressive(stand_in.product_url(platform, offset + n)),
+                session, platform
+            )
+            for n in range(pages)
+        ]
+    return results, shop.requests - requests_before, shop.bytes_sent - bytes_before, time.perf_counter() - start
+
+
+def reset_learning():
+    """Forget circuits and lite misses, so each check starts from a bot that just started"""
+    bot.circuit_breaker = bot.CircuitBreaker()
+    bot.lite_strategy = bot.LiteStrategy()
+
+
+def lite_platforms():
+    return [platform for platform in PLATFORMS if bot.platforms.get(platform).lite_kind]
+
+
+def report(mode: str, platform: str, summary: str, problems) -> int:
+    """Print one check line, returning 1 when it failed"""
+    print(f"{'FAIL' if problems else 'ok  '} {mode:8s} {platform:9s} {summary}  {'; '.join(problems)}")
+    return int(bool(problems))
+
+
+async def check(pages_html) -> int:
+    """Compare lite results with full-page extraction in every lite mode, returns the failure count"""
+    failures = 0
+    for mode in ('recorded', 'missing', 'broken'):
+        reset_learning()
+        shop = stand_in.StandInShop(lite=mode)
+        await shop.start()
+        for platform in PLATFORMS:
+            expected = bot.ProductScraper._extract_from_html(pages_html[platform], platform)
+            (info,), requests, _, _ = await scrape(shop, platform, 1, 0)
+            has_lite = bool(bot.platforms.get(platform).lite_kind)
+            wanted_requests = 1 if not has_lite or mode == 'recorded' else 2
+
+            problems = []
+            for field in ('title', 'price'):
+                if getattr(info, field) != getattr(expected, field):
+                    problems.append(f"{field} {getattr(info, field)!r} != page {getattr(expected, field)!r}")
+            if requests != wanted_requests:
+                problems.append(f"{requests} requests, expected {wanted_requests}")
+
+            failures += bool(problems)
+            print(f"{'FAIL' if problems else 'ok  '} {mode:8s} {platform:9s} {info.title[:40]!r:44s} "
+                  f"{info.price:>6s}  {'; '.join(problems)}")
+        await shop.stop()
+    return failures
+
+
+async def check_failing_api() -> int:
+    """Lite APIs answering 503 must open their own circuits and leave page scraping alone, returns the failure count"""
+    reset_learning()
+    shop = stand_in.StandInShop(lite='failing')
+    await shop.start()
+    failures = 0
+    count = bot.BREAKER_FAILURE_THRESHOLD * 2
+    for platform in lite_platforms():
+        site = bot.platforms.get(platform)
+        results, requests, _, _ = await scrape(shop, platform, count, 0)
+        page_url = bot.SmartLinkProcessor.clean_affiliate_url_aggressive(stand_in.product_url(platform, 0))
+        scraped = sum(bool(info.title and info.price) for info in results)
+        problems = []
+        if scraped != count:
+            problems.append(f"{count - scraped} products not scraped")
+        if not bot.circuit_breaker.blocked(site.lite_url(page_url), 'lite'):
+            problems.append("lite circuit still closed")
+        if bot.circuit_breaker.blocked(page_url):
+            problems.append("page circuit opened")
+        failures += report('failing', platform, f"{scraped}/{count} scraped, {requests} requests", problems)
+    await shop.stop()
+    reset_learning()
+    return failures
+
+
+async def check_hanging_api() -> int:
+    """A lite endpoint that never answers must leave time for the page within the message deadline"""
+    reset_learning()
+    shop = stand_in.StandInShop(lite='hanging')
+    await shop.start()
+    failures = 0
+    for platform in lite_platforms():
+        token = bot.current_deadline.set(time.monotonic() + bot.MESSAGE_DEADLINE)
+        try:
+            (info,), _, _, seconds = await scrape(shop, platform, 1, 0)
+        finally:
+            bot.current_deadline.reset(token)
+        problems = []
+        if not (info.title and info.price):
+            problems.append("page not scraped")
+        if seconds > bot.MESSAGE_DEADLINE:
+            problems.append("past the message deadline")
+        failures += report('hanging', platform, f"{info.title[:30]!r:34s} in {seconds:.2f} s", problems)
+    await shop.stop()
+    reset_learning()
+    return failures
+
+
+async def check_skipping() -> int:
+    """A lite endpoint that keeps answering 404 must stop being asked, the products still scraped from pages"""
+    reset_learning()
+    shop = stand_in.StandInShop(lite='missing')
+    await shop.start()
+    failures = 0
+    count = bot.LITE_SKIP_AFTER_MISSES * 2
+    for platform in lite_platforms():
+        lite_before = shop.lite_requests
+        results, _, _, _ = await scrape(shop, platform, count, 0)
+        asked = shop.lite_requests - lite_before
+        scraped = sum(bool(info.title and info.price) for info in results)
+        problems = []
+        if asked != bot.LITE_SKIP_AFTER_MISSES:
+            problems.append(f"lite asked {asked} times, expected {bot.LITE_SKIP_AFTER_MISSES}")
+        if scraped != count:
+            problems.append(f"{count - scraped} products not scraped")
+        failures += report('skipping', platform, f"{scraped}/{count} scraped, lite asked {asked} times", problems)
+    await shop.stop()
+    reset_learning()
+    return failures
+
+
+async def measure(page_kb: int, pages: int):
+    """Requests, KB and ms per product with and without the lite tier"""
+    shop = stand_in.StandInShop(page_kb=page_kb)
+    await shop.start()
+    rows = {}
+    for lite in (True, False):
+        bot.LITE_FETCH = lite
+        for platform in PLATFORMS:
+            # New ids per pass so nothing is shared between runs
+            _, requests, sent, seconds = await scrape(shop, platform, pages, 1000 * lite)
+            rows.setdefault(platform, []).append((requests / pages, sent / pages / 1024, seconds / pages * 1000))
+    bot.LITE_FETCH = True
+    await shop.stop()
+
+    print(f"\n{'platform':10s}{'lite tier':>30s}{'page only':>30s}")
+    print(f"{'':10s}" + f"{'req     KB      ms':>30s}" * 2)
+    for platform, columns in rows.items():
+        print(f"{platform:10s}" + ''.join(f"{req:14.2f} {kb:7.1f} {ms:7.1f}" for req, kb, ms in columns))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help='products per platform for the numbers')
+    parser.add_argument('--page-kb', type=int, default=64, help='pad full pages to about this size')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.ERROR)
+    os.chdir(tempfile.mkdtemp(prefix='lite_fetch_'))
+    failures = await check(stand_in.load_fixtures())
+    failures += await check_failing_api()
+    failures += await check_hanging_api()
+    failures += await check_skipping()
+    await measure(args.page_kb, args.pages)
+    bot.extraction_pool.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,69 @@
+"""Measure how much HTML extraction blocks the event loop in each executor mode.
+
+Usage: python benchmarks/loop_blocking.py [--pages N] [--page-kb KB]
+
+Every fixture is padded to roughly --page-kb kilobytes, which is closer to
+real product pages, and extracted --pages times concurrently through an
+ExtractionPool in 'inline', 'thread' and 'process' mode. A LoopLagMonitor
+probes the loop meanwhile. Time blocked is the number to watch: inline mode
+blocks for about the whole CPU cost, and the pools should block for close
+to nothing.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+FILLER = '<div class="reco-card"><a href="/item">Customers also bought this related item</a><span class="tag">popular</span></div>\n'
+
+
+def load_pages(page_kb: int):
+    """Fixtures padded with filler markup before </body>"""
+    pages = []
+    for path in sorted(FIXTURES_DIR.glob('*.html')):
+        html = path.read_text(encoding='utf-8')
+        padding = FILLER * max(0, page_kb * 1024 // len(FILLER))
+        pages.append((path.stem, html.replace('</body>', padding + '</body>', 1)))
+    return pages
+
+
+async def run_mode(mode: str, pages, count: int):
+    """Extract count pages concurrently and report wall time and loop lag"""
+    pool = bot.ExtractionPool(mode=mode)
+    monitor = bot.LoopLagMonitor(interval=0.005, log_interval=float('inf'))
+
+    # Start worker processes before measuring
+    await pool.extract(pages[0][1], pages[0][0])
+
+    monitor.start()
+    start = time.perf_counter()
+    jobs = [pool.extract(html, platform) for platform, html in (pages[i % len(pages)] for i in range(count))]
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    pool.shutdown()
+
+    print(f"{mode:8s} wall {elapsed:7.2f} s   blocked {monitor.blocked_seconds:7.2f} s   "
+          f"max lag {monitor.max_lag * 1000:8.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=28, help='extractions per mode')
+    parser.add_argument('--page-kb', type=int, default=1024, help='approximate size of each page')
+    args = parser.parse_args()
+
+    pages = load_pages(args.page_kb)
+    for mode in ('inline', 'thread', 'process'):
+        await run_mode(mode, pages, args.pages)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
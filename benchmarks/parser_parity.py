@@ -0,0 +1,79 @@
+"""Check that every parser engine extracts the same product info from the saved fixtures.
+
+Usage: python benchmarks/parser_parity.py [--repeat N]
+
+html.parser is the reference engine. The script exits non-zero when lxml or
+selectolax (whichever are installed) disagree with it on any fixture, and
+prints the mean extraction time per engine so the speed-up is visible too.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+REFERENCE_ENGINE = 'html.parser'
+
+
+def load_fixtures():
+    """Yield (platform, html) for every saved page, named after its platform"""
+    for path in sorted(FIXTURES_DIR.glob('*.html')):
+        yield path.stem, path.read_text(encoding='utf-8')
+
+
+def extract(html: str, platform: str, engine: str):
+    """Run the extractor with a specific engine"""
+    previous = bot.ACTIVE_PARSER_ENGINE
+    bot.ACTIVE_PARSER_ENGINE = engine
+    try:
+        return bot.ProductScraper._extract_from_html(html, platform)
+    finally:
+        bot.ACTIVE_PARSER_ENGINE = previous
+
+
+def available_engines():
+    """Engines whose backend is installed"""
+    return [engine for engine in bot.PARSER_ENGINES if bot.resolve_parser_engine(engine) == engine]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='extractions per fixture for timing')
+    args = parser.parse_args()
+
+    engines = available_engines()
+    fixtures = list(load_fixtures())
+    mismatches = 0
+
+    for platform, html in fixtures:
+        expected = extract(html, platform, REFERENCE_ENGINE)
+        for engine in engines:
+            if engine == REFERENCE_ENGINE:
+                continue
+            actual = extract(html, platform, engine)
+            if actual != expected:
+                mismatches += 1
+                print(f"MISMATCH {platform} [{engine}]\n  expected {expected}\n  actual   {actual}")
+        print(f"ok {platform}: {expected}")
+
+    print()
+    for engine in engines:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for platform, html in fixtures:
+                extract(html, platform, engine)
+        elapsed = (time.perf_counter() - start) / (args.repeat * len(fixtures))
+        print(f"{engine:12s} {elapsed * 1000:8.3f} ms per page")
+
+    if mismatches:
+        print(f"\n{mismatches} mismatches")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
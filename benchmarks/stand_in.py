@@ -0,0 +1,215 @@
+"""Local stand-in for the shops and shorteners, so pipeline benchmarks run offline.
+
+StandInShop serves the saved fixture of whichever platform the Host header
+names, over plain HTTP and over TLS with a throwaway self-signed certificate
+(needs the openssl CLI). Shortener hosts answer with a redirect to a product
+URL registered with add_shortlink(). make_session() returns a ClientSession
+whose resolver sends every hostname to the stand-in, so the bot's real URLs
+(https://www.amazon.in/dp/..., https://amzn.to/...) work unchanged.
+
+The lite endpoints the bot tries first (Myntra's product API, Ajio's
+product API, Amazon's mobile detail page) answer with the recorded
+responses in fixtures/lite, or with a 404 or a truncated body to exercise
+the fallback to the full page.
+"""
+import asyncio
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Tuple
+
+import aiohttp
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+LITE_FIXTURES = {               # Path prefix of a lite endpoint -> recorded response
+    '/gateway/v2/product/': 'myntra.json',
+    '/api/p/': 'ajio.json',
+    '/gp/aw/d/': 'amazon.html',
+}
+FILLER = '<div class="reco-card"><a href="/item">Customers also bought this related item</a><span class="tag">popular</span></div>\n'
+SHORTENER_HOSTS = ('amzn.to', 'fkrt.it', 'myntr.it', 'bit.ly')
+
+
+def load_fixtures(page_kb: int = 0) -> Dict[str, str]:
+    """Fixture HTML per platform, padded before </body> to roughly page_kb kilobytes"""
+    pages = {}
+    for path in sorted(FIXTURES_DIR.glob('*.html')):
+        html = path.read_text(encoding='utf-8')
+        padding = FILLER * max(0, (page_kb * 1024 - len(html)) // len(FILLER))
+        pages[path.stem] = html.replace('</body>', padding + '</body>', 1)
+    return pages
+
+
+def make_certificate(directory: str) -> ssl.SSLContext:
+    """Server context with a fresh self-signed certificate"""
+    cert, key = f'{directory}/cert.pem', f'{directory}/key.pem'
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class StandInResolver(AbstractResolver):
+    """Resolves every host to localhost, moving ports 80 and 443 to the stand-in's ports"""
+
+    def __init__(self, ports: Dict[int, int]):
+        self.ports = ports
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+        return [{
+            'hostname': host, 'host': '127.0.0.1', 'port': self.ports.get(port, port),
+            'family': socket.AF_INET, 'proto': 0, 'flags': socket.AI_NUMERICHOST,
+        }]
+
+    async def close(self):
+        pass
+
+
+class StandInShop:
+    """Serves fixture pages by platform, redirects registered shortlinks and can refuse some clients"""
+
+    def __init__(self, page_kb: int = 0, latency: float = 0.0, blocked: Dict[str, str] = None,
+                 lite: str = 'recorded', failing: Dict[str, int] = None, delays: Dict[str, float] = None):
+        self.pages = load_fixtures(page_kb)
+        self.latency = latency
+        # 'recorded' serves fixtures/lite, 'missing' answers 404, 'failing' 503, 'hanging' never answers
+        # and 'broken' cuts the responses in half
+        self.lite = lite
+        self.lite_requests = 0
+        # platform -> User-Agent substring answered with 403, like a shop turning away desktop or mobile clients
+        self.blocked = blocked or {}
+        # platform -> status every request to it gets, like a shop shedding load; change it while running
+        self.failing = failing or {}
+        # platform or shortener host -> seconds added to its responses, like a shop that hangs
+        self.delays = delays or {}
+        self.platform_requests: Dict[str, int] = {}
+        self.shortlinks: Dict[str, str] = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.ports: Dict[int, int] = {}
+        self._runner = None
+        self._tmp = tempfile.TemporaryDirectory(prefix='stand_in_')
+
+    def add_shortlink(self, url: str, target: str):
+        """Make url (on a shortener host) redirect to target"""
+        self.shortlinks[url.split('://', 1)[-1]] = target
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        """Redirect a shortlink or serve the page for the requested host"""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        host = request.host.split(':')[0]
+        platform = bot.ProductScraper.detect_platform(f'https://{host}/')
+        delay = self.delays.get(host, self.delays.get(platform))
+        if delay:
+            await asyncio.sleep(delay)
+        target = self.shortlinks.get(f'{host}{request.path_qs}')
+        if target:
+            raise web.HTTPMovedPermanently(location=target)
+        if host in SHORTENER_HOSTS:
+            raise web.HTTPNotFound()
+
+        self.platform_requests[platform] = self.platform_requests.get(platform, 0) + 1
+        if platform in self.failing:
+            return web.Response(status=self.failing[platform], text='Service Unavailable')
+
+        for prefix, name in LITE_FIXTURES.items():
+            if request.path.startswith(prefix):
+                if self.lite == 'hanging':
+                    self.lite_requests += 1
+                    await asyncio.sleep(3600)
+                return self._lite_response(name)
+
+        if platform in self.blocked and self.blocked[platform] in request.headers.get('User-Agent', ''):
+            raise web.HTTPForbidden()
+        body = self.pages[platform].encode('utf-8')
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type='text/html', charset='utf-8')
+
+    def _lite_response(self, name: str) -> web.Response:
+        """A recorded lite response, or the failure the shop is set up to give"""
+        self.lite_requests += 1
+        if self.lite == 'missing':
+            raise web.HTTPNotFound()
+        if self.lite == 'failing':
+            return web.Response(status=503, text='Service Unavailable')
+        body = (FIXTURES_DIR / 'lite' / name).read_bytes()
+        if self.lite == 'broken':
+            body = body[:len(body) // 2]
+        self.bytes_sent += len(body)
+        content_type = 'application/json' if name.endswith('.json') else 'text/html'
+        return web.Response(body=body, content_type=content_type, charset='utf-8')
+
+    async def start(self):
+        """Listen on two free localhost ports, plain HTTP and TLS"""
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+
+        plain = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await plain.start()
+        tls = web.TCPSite(self._runner, '127.0.0.1', 0, ssl_context=make_certificate(self._tmp.name))
+        await tls.start()
+
+        http_port, tls_port = (address[1] for address in self._runner.addresses)
+        self.ports = {80: http_port, 443: tls_port}
+
+    async def stop(self):
+        """Stop listening and remove the certificate"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        self._tmp.cleanup()
+
+    def make_session(self) -> aiohttp.ClientSession:
+        """A session shaped like DealBot's, but talking to the stand-in without verifying its certificate"""
+        connector = aiohttp.TCPConnector(
+            limit=bot.CONNECTOR_LIMIT,
+            limit_per_host=bot.CONNECTOR_LIMIT_PER_HOST,
+            resolver=StandInResolver(self.ports),
+            ssl=False
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30, connect=10),
+            headers={'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'}
+        )
+
+
+# Product URLs per platform, shaped like real links so cleaning and platform detection run as usual
+PRODUCT_URLS: Dict[str, str] = {
+    'amazon': 'https://www.amazon.in/dp/B{n:09d}?tag=deals-21',
+    'flipkart': 'https://www.flipkart.com/item/p/itm{n:013d}?pid=MOB{n:013d}&affid=deals',
+    'meesho': 'https://www.meesho.com/kurti/p/{n}?utm_source=deals',
+    'myntra': 'https://www.myntra.com/shirts/roadster/{n}/buy',
+    'ajio': 'https://www.ajio.com/p/{n}?utm_source=deals',
+    'snapdeal': 'https://www.snapdeal.com/product/item/{n}',
+    'generic': 'https://shop.example.com/product/{n}?ref=deals',
+}
+SHORTLINK_HOSTS: Dict[str, str] = {'amazon': 'amzn.to', 'flipkart': 'fkrt.it', 'myntra': 'myntr.it'}
+
+
+def product_url(platform: str, n: int) -> str:
+    """Product URL number n of a platform"""
+    return PRODUCT_URLS[platform].format(n=n)
+
+
+def shortlink(platform: str, n: int) -> Tuple[str, str]:
+    """(shortlink, product URL) for a platform that has a shortener"""
+    return f'https://{SHORTLINK_HOSTS[platform]}/s{n}', product_url(platform, n)
@@ -0,0 +1,199 @@
+"""Drive the bot in webhook mode against a local fake Telegram, fully offline.
+
+Usage: python benchmarks/webhook_load.py [--updates N] [--chats N] [--products N] [--concurrency N]
+
+A small aiohttp app plays both sides the bot talks to: the Bot API (getMe,
+sendMessage, ...) at TELEGRAM_API_BASE_URL and the shop serving product
+pages. The bot runs in-process with a WebhookServer, and the harness posts
+--updates deal messages to it, linking --products distinct product pages
+(fewer products than updates mimics a deal reposted across channels). It
+reports intake rate, end-to-end throughput (update posted to deal sent) and
+latency percentiles, and checks that a wrong secret token is refused.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+SECRET_TOKEN = 'harness-secret'
+ITEM_RE = re.compile(r'\bDeal (\d+)\b')
+
+
+class FakeTelegram:
+    """Bot API and shop stand-in that records when each deal comes back"""
+
+    def __init__(self, expected: int):
+        self.page = (FIXTURES_DIR / 'generic.html').read_text(encoding='utf-8')
+        self.expected = expected
+        self.sent_at = {}
+        self.other_messages = 0
+        self.done = asyncio.Event()
+        self._message_id = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.bot_api)
+        app.router.add_get('/product/{item}', self.product)
+        return app
+
+    async def bot_api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        data = await request.post()
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Deal Bot', 'username': bot.BOT_USERNAME}
+        elif method == 'sendMessage':
+            result = self._record(data)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def _record(self, data) -> dict:
+        text = data.get('text', '')
+        match = ITEM_RE.search(text)
+        if match:
+            self.sent_at.setdefault(int(match.group(1)), time.perf_counter())
+        else:
+            self.other_messages += 1
+        if len(self.sent_at) >= self.expected:
+            self.done.set()
+
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'},
+            'text': text,
+        }
+
+    async def product(self, request: web.Request) -> web.Response:
+        item = request.match_info['item']
+        html = self.page.replace('Prestige Svachh 5 L Pressure Cooker', f'Harness Item {item}')
+        return web.Response(text=html, content_type='text/html')
+
+
+def make_update(i: int, chats: int, products: int, shop: str) -> dict:
+    """A text message with one product link"""
+    chat_id = 1000 + i % chats
+    return {
+        'update_id': i + 1,
+        'message': {
+            'message_id': i + 1,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': f'Deal {i} @499 rs {shop}/product/{i % products}',
+        },
+    }
+
+
+async def start_site(app: web.Application, port: int = 0):
+    """Serve app on localhost, returning the runner and the bound port"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--products', type=int, default=0, help='distinct product pages, 0 for one per update')
+    parser.add_argument('--concurrency', type=int, default=50, help='webhook POSTs in flight')
+    parser.add_argument('--port', type=int, default=8443, help='webhook listener port')
+    args = parser.parse_args()
+    products = args.products or args.updates
+    # A chat getting the same product twice within the dedup window gets one reply
+    expected = len({(i % args.chats, i % products) for i in range(args.updates)})
+
+    fake = FakeTelegram(expected)
+    fake_runner, fake_port = await start_site(fake.app())
+    shop = f'http://127.0.0.1:{fake_port}'
+
+    # Keep the bot's SQLite files out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix='webhook_load_'))
+
+    bot.RUN_MODE = 'webhook'
+    bot.BOT_TOKEN = bot.BOT_TOKEN or '123456:stand-in'
+    bot.TELEGRAM_API_BASE_URL = f'{shop}/bot'
+    deal_bot = bot.DealBot()
+    application = bot.build_application(deal_bot)
+    server = bot.WebhookServer(application, listen='127.0.0.1', port=args.port, secret_token=SECRET_TOKEN)
+    webhook = f'http://127.0.0.1:{args.port}{server.path}'
+
+    await application.initialize()
+    await application.start()
+    await server.start()
+
+    posted_at = {}
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with ClientSession() as client:
+        async with client.post(webhook, json=make_update(0, 1, 1, shop),
+                               headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'}) as response:
+            print(f"wrong secret token -> HTTP {response.status}")
+
+        async def post(i: int):
+            async with semaphore:
+                posted_at[i] = time.perf_counter()
+                async with client.post(webhook, json=make_update(i, args.chats, products, shop),
+                                       headers={'X-Telegram-Bot-Api-Secret-Token': SECRET_TOKEN}) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(args.updates)))
+        intake = time.perf_counter() - start
+        try:
+            await asyncio.wait_for(fake.done.wait(), timeout=max(60, args.updates / 5))
+        except asyncio.TimeoutError:
+            print("timed out waiting for replies")
+        elapsed = time.perf_counter() - start
+
+    async with ClientSession() as client:
+        async with client.get(f'http://{bot.METRICS_LISTEN}:{bot.METRICS_PORT}/metrics') as response:
+            exposition = await response.text()
+
+    await server.stop()
+    await application.stop()
+    await deal_bot.cleanup()
+    await application.shutdown()
+    await fake_runner.cleanup()
+
+    latencies = sorted(fake.sent_at[i] - posted_at[i] for i in fake.sent_at)
+    print(f"/metrics   {len(exposition.splitlines())} lines")
+    print(f"{args.updates} updates over {args.chats} chats and {products} products, HTTP statuses {statuses}")
+    print(f"intake     {args.updates / intake:8.0f} updates/s")
+    print(f"end-to-end {len(latencies) / elapsed:8.1f} deals/s   ({len(latencies)}/{expected} deals, "
+          f"{fake.other_messages} other replies)")
+    if latencies:
+        pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000  # noqa: E731
+        print(f"latency    p50 {pick(0.5):7.1f} ms   p95 {pick(0.95):7.1f} ms   max {latencies[-1] * 1000:7.1f} ms")
+    print(f"webhook    received {server.received}  processed {server.processed}  rejected {server.rejected}")
+    print(f"outbound   {bot.send_scheduler.stats()}")
+    print(f"dedup      {deal_bot.dedup.duplicate_messages} duplicate messages, "
+          f"{deal_bot.dedup.duplicate_content} duplicate products")
+    print(f"scrapes    {deal_bot.scrape_flight.shared} coalesced, "
+          f"{deal_bot.product_cache.hits} product cache hits")
+    print("stage      p50 / p99 ms from the metrics registry")
+    for labels in sorted(bot.metrics.series('stage_seconds'), key=lambda labels: (labels['stage'], labels['platform'])):
+        p50 = bot.metrics.quantile('stage_seconds', 0.5, **labels) * 1000
+        p99 = bot.metrics.quantile('stage_seconds', 0.99, **labels) * 1000
+        print(f"  {labels['stage']:13s} {labels['platform']:8s} {p50:9.2f} {p99:9.2f}")
+    return 0 if len(latencies) == expected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -1,15 +1,58 @@
+import argparse
 import asyncio
+import atexit
+import bisect
+import codecs
+import contextvars
+import csv
+import hmac
+import itertools
+import json
 import logging
+import queue
+import random
 import re
-from typing import List, Dict, Optional
-from urllib.parse import urlparse, urlunparse
+import secrets
+import sqlite3
+import threading
+import time
+import heapq
+import multiprocessing
+import os
+import signal
+import sys
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # External Libraries (Lightweight)
 import requests
 from bs4 import BeautifulSoup
+import soupsieve
 import aiohttp
+from aiohttp import web
+
+# Optional parser backends
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -18,366 +61,341 @@ from telegram.ext import (
     ContextTypes,
 )
 
-# Setup Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("bot.log"), logging.StreamHandler()]
-)
+# Setup Logging (handlers are attached by log_pipeline, after the settings below)
 logger = logging.getLogger(__name__)
 
+# Bot credentials, from the environment so they stay out of the source
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
+BOT_USERNAME = os.environ.get("BOT_USERNAME", "")
+
 # Constants
 DEFAULT_PIN = "110001"
 ADVANCED_MODE = False
 REVIEWCHECKK_TAG = "@reviewcheckk"
 
+# HTML parser engine: 'html.parser' (pure Python), 'lxml' or 'selectolax'
+PARSER_ENGINE = 'lxml'
+
+# Structured data (JSON-LD, meta tags) is searched in the <head>, or this many characters without one
+HEAD_SCAN_CHARS = 256 * 1024
+STATE_JSON_MAX_NODES = 20000    # Nodes visited when searching embedded state JSON for a price
+
+# Streaming page download
+STREAMING_FETCH = True          # Read pages in chunks and stop early instead of buffering them whole
+FETCH_CHUNK_SIZE = 64 * 1024
+MARKER_OVERLAP = 4096           # Characters of the previous chunk scanned again, for markers split across chunks
+PLATFORM_BYTE_BUDGETS = {       # Most bytes read per page, title/og/JSON-LD/price sit well inside these
+    'amazon': 1536 * 1024,
+    'flipkart': 1024 * 1024,
+    'meesho': 512 * 1024,
+    'myntra': 512 * 1024,
+    'ajio': 512 * 1024,
+    'snapdeal': 768 * 1024,
+    'generic': 1024 * 1024
+}
+
+# Scraping strategy
+SCRAPE_HEADER_VARIANTS = {      # Header sets a page can be requested with, tried best first per platform/domain
+    'desktop': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9,hi;q=0.8',
+        'Connection': 'keep-alive'
+    },
+    'mobile': {
+        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+    }
+}
+HEADER_STATS_DECAY = 0.98       # Weight older outcomes keep on each new one, so a site changing its mind is noticed
+HEADER_STATS_MIN_ATTEMPTS = 5   # Outcomes a domain needs before its own stats override its platform's
+HEADER_STATS_MAX_DOMAINS = 2000 # Domains with their own stats, least recently used ones are forgotten
+HEADER_RACE = False             # Request with the two leading variants at once while the leader is unproven
+HEADER_RACE_CONFIDENCE = 0.8    # Leader success rate from which a single variant is tried at a time
+LITE_FETCH = True               # Try a platform's JSON API or lite page before downloading the full product page
+LITE_FETCH_TIMEOUT = 2          # Seconds for a lite request, APIs answer fast and the full page is the fallback
+LITE_DEADLINE_SHARE = 0.25      # Share of a message's remaining time a lite request may use, the page keeps the rest
+LITE_SKIP_AFTER_MISSES = 5      # Consecutive misses after which a platform's lite tier is skipped
+LITE_SKIP_SECONDS = 600         # How long it is skipped before one request tries it again
+LITE_MAX_BYTES = 256 * 1024     # Lite responses larger than this are abandoned for the full page
+
+# Circuit breaker per domain: failing shops get no requests for a while instead of tying up connections
+BREAKER_FAILURE_THRESHOLD = 5   # Consecutive 429/5xx, timeouts or slow responses that open a domain's circuit
+BREAKER_SLOW_SECONDS = 5        # Responses slower than this count as failures, kept under MESSAGE_DEADLINE
+BREAKER_OPEN_SECONDS = 30       # First open period, doubled each time the probe after it fails
+BREAKER_MAX_OPEN_SECONDS = 600  # Longest open period, also caps what a Retry-After header can ask for
+BREAKER_PROBE_TIMEOUT = 30      # Seconds a half-open probe holds the slot before another request may probe
+
+# Where HTML extraction runs: 'process' pool, 'thread' pool or 'inline' on the event loop
+EXTRACTION_EXECUTOR = 'process'
+EXTRACTION_WORKERS = 2          # Pool size for the extraction executor
+EXTRACTION_MAX_PENDING = 8      # Extractions queued or running before callers wait
+LOOP_LAG_INTERVAL = 0.1         # Seconds between event loop lag probes
+LOOP_LAG_LOG_INTERVAL = 300     # Seconds between event loop lag log lines
+
+# Concurrency
+MAX_CONCURRENT_MESSAGES = 10    # Global cap on messages processed at the same time
+CHAT_QUEUE_WARN_DEPTH = 20      # Log a warning when a chat backs up past this
+CHAT_WORKER_IDLE_TIMEOUT = 60   # Seconds before an idle per-chat worker exits
+CONNECTOR_LIMIT = 30            # Total open connections in the shared session
+CONNECTOR_LIMIT_PER_HOST = 10   # Open connections per host in the shared session
+LINK_CONCURRENCY = 5            # Links of one message processed at the same time
+LINK_LIMIT_PER_HOST = 3         # Links per host in the pipeline across all messages
+
+# Time budget: every stage fits its timeout into what is left of the message's deadline
+MESSAGE_DEADLINE = 8            # Seconds from receiving a message to its replies, links out of time get manual info only; None to wait
+DEADLINE_MIN_STAGE_SECONDS = 0.3    # A request is not started with less time than this left
+UNSHORTEN_HEAD_TIMEOUT = 10     # Seconds for the HEAD request of an unshorten attempt
+UNSHORTEN_GET_TIMEOUT = 15      # Seconds for the GET request it falls back to
+SCRAPE_TIMEOUT = 20             # Seconds for one product page request
+
+# Caching
+URL_CACHE_TTL = 24 * 3600       # Seconds a resolved shortlink stays valid
+URL_CACHE_MAX_ENTRIES = 20000   # Resolved shortlinks kept in memory
+URL_CACHE_DB_PATH = "url_cache.db"  # SQLite file backing the URL cache, None to disable
+PRODUCT_CACHE_MAX_ENTRIES = 5000    # Scraped products kept in memory
+PRODUCT_CACHE_STALE_TTL = 6 * 3600  # Seconds expired products are still served while their shop's circuit is open
+PRODUCT_CACHE_TTLS = {              # Seconds scraped info stays fresh, prices move fastest on the big stores
+    'amazon': 10 * 60,
+    'flipkart': 10 * 60,
+    'meesho': 30 * 60,
+    'myntra': 30 * 60,
+    'ajio': 30 * 60,
+    'snapdeal': 30 * 60,
+    'generic': 60 * 60
+}
+
+# Deduplication
+DEDUP_MESSAGE_TTL = 6 * 3600    # Seconds a seen message id is remembered, covers redeliveries after restarts
+DEDUP_CONTENT_WINDOW = 30 * 60  # The same product in the same chat within this many seconds is skipped, 0 to allow
+DEDUP_MAX_ENTRIES = 200000      # Seen ids and products kept in memory
+DEDUP_DB_PATH = "dedup.db"      # SQLite file keeping dedup across restarts, None to disable
+DEDUP_FLUSH_BATCH = 100         # Pending writes that trigger a flush to SQLite
+DEDUP_FLUSH_INTERVAL = 5        # Seconds pending writes wait at most
+
+# Metrics
+METRICS_PORT = 9108             # Local Prometheus text endpoint at /metrics, None to disable
+METRICS_LISTEN = "127.0.0.1"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Runtime: 'polling' pulls updates with getUpdates, 'webhook' has Telegram push them to a local HTTP listener
+RUN_MODE = 'polling'
+DROP_PENDING_UPDATES = False    # Keep deals posted while the bot was down
+TELEGRAM_API_BASE_URL = "https://api.telegram.org/bot"
+WEBHOOK_URL = ""                # Public HTTPS URL registered with setWebhook, empty to leave it as is
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET_TOKEN = ""       # Expected X-Telegram-Bot-Api-Secret-Token header, empty to generate one with WEBHOOK_URL
+WEBHOOK_QUEUE_SIZE = 1000       # Updates accepted but not processed yet, Telegram retries when it is full
+WEBHOOK_WORKERS = 4             # Tasks feeding queued updates to the application
+
+# Bulk mode: python bot.py bulk <messages.jsonl|csv> -o <results.jsonl>
+BULK_CONCURRENCY = 20           # Messages processed at the same time
+BULK_REORDER_WINDOW = 200       # Messages started but not written yet, bounds memory while output keeps input order
+BULK_CHECKPOINT_EVERY = 500     # Messages written between checkpoints
+
+# Outbound sends, kept under Telegram's limits instead of running into RetryAfter
+SEND_GLOBAL_RATE = 30           # Messages per second across all chats
+SEND_CHAT_RATE = 1.0            # Messages per second to one private chat
+SEND_CHAT_BURST = 3
+SEND_GROUP_RATE = 20 / 60       # Messages per second to one group or channel
+SEND_GROUP_BURST = 1
+SEND_MAX_RETRIES = 3            # RetryAfter waits per message before giving up
+SEND_PRIORITY_HIGH = 0          # Command replies
+SEND_PRIORITY_NORMAL = 1        # Deal results
+SEND_PRIORITY_LOW = 2           # Error notices
+PROGRESSIVE_REPLY = True        # Private chats get the link and manual info at once, edited into the full deal when scraped
+PROGRESSIVE_REPLY_AFTER = 0.3   # Links done within this many seconds are sent finished, without a placeholder
+PROGRESSIVE_PLACEHOLDER_NOTE = "⏳ Fetching product details..."
+
+# Logging
+LOG_LEVEL = 'INFO'
+LOG_MODE = 'queue'              # 'queue' hands records to a listener thread, 'sync' writes them from the caller
+LOG_FILE = "bot.log"            # None for console only
+LOG_FORMAT = 'json'             # bot.log lines: 'json' objects or 'text', the console is always text
+LOG_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 10 * 1024 * 1024    # bot.log size that triggers rotation, 0 to never rotate
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000          # Records waiting for the listener, newer ones are dropped and counted past this
+LOG_PAYLOAD_SAMPLE_RATE = 0.01  # Fraction of per-link manual/product payloads logged at DEBUG
+
 # Store user states
 user_states = {}
 
 # ----------------------------
-# Utility Functions
-# ----------------------------
-
-def safe_async(func):
-    """Decorator to wrap async functions with exception handling."""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        try:
-            return await func(*args, **kwargs)
-        except Exception as e:
-            logger.error(f"Error in {func.__name__}: {e}")
-            return None
-    return wrapper
-
-async def unshorten_url(url: str) -> str:
-    """Unshortens a given URL using HTTP HEAD request."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.head(url, allow_redirects=True, timeout=10) as response:
-                return str(response.url)
-    except Exception as e:
-        logger.error(f"Failed to unshorten URL: {url} - {e}")
-        return url
-
-def remove_duplicate_words(text: str) -> str:
-    """Remove repeated words from a string."""
-    words = text.split()
-    seen = set()
-    result = []
-    for word in words:
-        if word.lower() not in seen:
-            seen.add(word.lower())
-            result.append(word)
-    return ' '.join(result)
-
-def extract_domain(url: str) -> str:
-    """Extract domain from URL."""
-    parsed = urlparse(url)
-    return parsed.netloc
-
-def is_clothing_product(title: str) -> bool:
-    """Detect if a product is clothing based on keywords."""
-    clothing_keywords = ["shirt", "t-shirt", "jeans", "dress", "skirt", "top", "pants", "jacket"]
-    return any(keyword in title.lower() for keyword in clothing_keywords)
-
-# ----------------------------
-# Parsing Logic
+# Logging
 # ----------------------------
 
-@safe_async
-async def parse_amazon(url: str) -> Optional[Dict]:
-    """Parse Amazon product details."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
-                content = await resp.text()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # Extract title
-                title_elem = soup.find('span', {'id': 'productTitle'})
-                title = title_elem.get_text(strip=True) if title_elem else "Unknown Product"
-
-                # Extract price
-                price_elem = soup.find('span', {'class': 'a-price-whole'})
-                price = price_elem.get_text(strip=True) if price_elem else "N/A"
-
-                # Extract image
-                img_elem = soup.find('img', {'id': 'landingImage'})
-                image_url = img_elem.get('src') if img_elem else None
-
-                # Extract sizes
-                size_elem = soup.find('select', {'id': 'native_dropdown_selected_size_name'})
-                sizes = []
-                if size_elem:
-                    options = size_elem.find_all('option')
-                    sizes = [opt.get_text(strip=True) for opt in options if opt.get('value') != '']
-
-                return {
-                    "title": f"Amazon {title}",
-                    "price": price,
-                    "image": image_url,
-                    "sizes": sizes if sizes else ["Size – All"],
-                    "link": url
-                }
-    except Exception as e:
-        logger.error(f"Error parsing Amazon: {e}")
-        return None
-
-@safe_async
-async def parse_flipkart(url: str) -> Optional[Dict]:
-    """Parse Flipkart product details."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
-                content = await resp.text()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # Extract title
-                title_elem = soup.find('span', {'class': '_35KyD6'})
-                title = title_elem.get_text(strip=True) if title_elem else "Unknown Product"
-
-                # Extract price
-                price_elem = soup.find('div', {'class': '_1vC4OE _3qQ9m1'})
-                price = price_elem.get_text(strip=True) if price_elem else "N/A"
-
-                # Extract image
-                img_elem = soup.find('img', {'class': '_396cs4'})
-                image_url = img_elem.get('src') if img_elem else None
-
-                # Extract sizes
-                sizes = []
-                size_elements = soup.find_all('li', {'class': '_2MImiq'})
-                sizes = [elem.get_text(strip=True) for elem in size_elements]
-
-                return {
-                    "title": f"Flipkart {title}",
-                    "price": price,
-                    "image": image_url,
-                    "sizes": sizes if sizes else ["Size – All"],
-                    "link": url
-                }
-    except Exception as e:
-        logger.error(f"Error parsing Flipkart: {e}")
-        return None
-
-@safe_async
-async def parse_meesho(url: str) -> Optional[Dict]:
-    """Parse Meesho product details."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
-                content = await resp.text()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # Extract title
-                title_elem = soup.find('h1', {'class': 'product-title'})
-                title = title_elem.get_text(strip=True) if title_elem else "Unknown Product"
-
-                # Extract price
-                price_elem = soup.find('div', {'class': 'price'})
-                price = price_elem.get_text(strip=True) if price_elem else "N/A"
-
-                # Extract image
-                img_elem = soup.find('img', {'class': 'product-image'})
-                image_url = img_elem.get('src') if img_elem else None
-
-                # Extract sizes
-                sizes = []
-                size_elements = soup.find_all('button', {'class': 'size-button'})
-                sizes = [elem.get_text(strip=True) for elem in size_elements]
-
-                # Get pincode
-                pincode = DEFAULT_PIN
-                pin_input = soup.find('input', {'placeholder': 'Enter Pincode'})
-                if pin_input and pin_input.get('value'):
-                    pincode = pin_input['value']
-
-                # Format title
-                formatted_title = f"{pincode} {title} @{price} rs"
-                return {
-                    "title": formatted_title,
-                    "price": price,
-                    "image": image_url,
-                    "sizes": sizes if sizes else ["Size – All"],
-                    "link": url
-                }
-    except Exception as e:
-        logger.error(f"Error parsing Meesho: {e}")
-        return None
-
-@safe_async
-async def parse_generic(url: str) -> Optional[Dict]:
-    """Fallback parser for other stores."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
-                content = await resp.text()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                # Try to find title
-                title_elem = soup.find('title')
-                title = title_elem.get_text(strip=True) if title_elem else "Unknown Product"
-
-                # Try to find price
-                price_elem = soup.find(['span', 'div'], text=re.compile(r'₹|Rs\.?'))
-                price = price_elem.get_text(strip=True) if price_elem else "N/A"
-
-                # Try to find image
-                img_elem = soup.find('img')
-                image_url = img_elem.get('src') if img_elem else None
-
-                return {
-                    "title": f"Generic {title}",
-                    "price": price,
-                    "image": image_url,
-                    "sizes": ["Size – All"],
-                    "link": url
-                }
-    except Exception as e:
-        logger.error(f"Error parsing generic site: {e}")
-        return None
+# Argument types that cannot change between the log call and the listener formatting the record
+LOG_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
 
-# ----------------------------
-# Main Handler Functions
-# ----------------------------
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'where': f"{record.funcName}:{record.lineno}",
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops records instead of blocking"""
+    
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mutable arguments are rendered now, everything else waits for the listener thread
+        args = record.args.values() if isinstance(record.args, dict) else record.args or ()
+        if not all(isinstance(arg, LOG_IMMUTABLE_ARGS) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
-async def handle_link(url: str, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle a single product link."""
-    try:
-        # Unshorten URL
-        unshortened_url = await unshorten_url(url)
-        domain = extract_domain(unshortened_url)
-
-        # Select parser based on domain
-        if "amazon" in domain:
-            data = await parse_amazon(unshortened_url)
-        elif "flipkart" in domain:
-            data = await parse_flipkart(unshortened_url)
-        elif "meesho" in domain:
-            data = await parse_meesho(unshortened_url)
-        else:
-            data = await parse_generic(unshortened_url)
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue instead of failing"""
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
 
-        if not 
-            await context.bot.send_message(chat_id=context.effective_chat.id, text="❌ Failed to process link.")
+class LogPipeline:
+    """Root logger handlers, written from the caller ('sync') or by a listener thread ('queue')"""
+    
+    def __init__(self, mode: str = LOG_MODE, level: str = LOG_LEVEL, file: Optional[str] = LOG_FILE,
+                 file_format: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE):
+        self.mode = mode
+        self.level = level
+        self.file = file
+        self.file_format = file_format
+        self.queue_size = queue_size
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.listener: Optional[DrainingQueueListener] = None
+        self._attached: List[logging.Handler] = []
+    
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped if self.handler else 0
+    
+    def _handlers(self) -> List[logging.Handler]:
+        """Console handler, plus the rotating bot.log handler when a file is set"""
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(LOG_TEXT_FORMAT))
+        if not self.file:
+            return [console]
+        
+        file_handler = RotatingFileHandler(
+            self.file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+        )
+        file_handler.setFormatter(JsonFormatter() if self.file_format == 'json' else logging.Formatter(LOG_TEXT_FORMAT))
+        return [file_handler, console]
+    
+    def start(self):
+        """Attach handlers to the root logger, unless something else configured it already"""
+        root = logging.getLogger()
+        if root.handlers:
             return
-
-        # Format output
-        title = remove_duplicate_words(data["title"])
-        price = data["price"]
-        sizes = data["sizes"]
-        link = data["link"]
-
-        # Build message
-        message_parts = [
-            f"{title}",
-            f"Price: ₹{price}",
-            f"Sizes: {', '.join(sizes)}",
-            f"Link: {link}",
-            REVIEWCHECKK_TAG
-        ]
-        message = "\n".join(message_parts)
-
-        # Send image if available
-        if data["image"]:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(data["image"]) as resp:
-                        image_data = await resp.read()
-                        await context.bot.send_photo(
-                            chat_id=context.effective_chat.id,
-                            photo=image_data,
-                            caption=message
-                        )
-            except Exception as e:
-                logger.warning(f"Could not send image: {e}")
-                await context.bot.send_message(chat_id=context.effective_chat.id, text=message)
-        else:
-            await context.bot.send_message(chat_id=context.effective_chat.id, text=message)
-
-    except Exception as e:
-        logger.error(f"Error handling link: {e}")
-        await context.bot.send_message(chat_id=context.effective_chat.id, text="❌ Failed to process link.")
-
-async def process_links(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Process multiple links in a single message."""
-    message_text = update.message.text
-    urls = re.findall(r'https?://[^\s]+', message_text)
+        root.setLevel(self.level)
+        
+        # Extraction workers only log to the console, bot.log is written and rotated by the main process
+        if multiprocessing.parent_process() is not None:
+            self.file = None
+            self.mode = 'sync'
+        
+        handlers = self._handlers()
+        if self.mode == 'queue':
+            self.handler = NonBlockingQueueHandler(queue.Queue(self.queue_size))
+            self.listener = DrainingQueueListener(self.handler.queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+            handlers = [self.handler]
+        
+        for handler in handlers:
+            root.addHandler(handler)
+        self._attached = handlers
     
-    if not urls:
-        await context.bot.send_message(chat_id=update.effective_chat.id, text="No valid URLs found.")
-        return
-
-    for url in urls:
-        await handle_link(url, context)
-
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send welcome message."""
-    welcome_text = (
-        "🤖 Welcome to Affiliate Product Bot!\n\n"
-        "Send any product link (Amazon, Flipkart, Meesho, etc.) and I'll extract:\n"
-        "✅ Title\n✅ Price\n✅ Sizes\n✅ Full Link\n\n"
-        "Use /help for more info."
-    )
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=welcome_text)
-
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send help message."""
-    help_text = (
-        "📖 Help & Rules:\n\n"
-        "🔹 Send any product link to get formatted deal.\n"
-        "🔹 Supports Amazon, Flipkart, Meesho, and more.\n"
-        "🔹 Out-of-stock detection.\n"
-        "🔹 Size listing.\n"
-        "🔹 Image support.\n"
-        "🔹 Clean formatting with @reviewcheckk tag.\n\n"
-        "Commands:\n"
-        "/start - Start bot\n"
-        "/help - Show this message\n"
-        "/advancing - Enable advanced features\n"
-        "/off_advancing - Disable advanced features"
-    )
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=help_text)
-
-async def toggle_advanced_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, enable: bool) -> None:
-    """Toggle advanced mode."""
-    global ADVANCED_MODE
-    ADVANCED_MODE = enable
-    status = "enabled" if enable else "disabled"
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Advanced mode {status}.")
+    def stop(self):
+        """Write out queued records, then detach and close the handlers"""
+        root = logging.getLogger()
+        for handler in self._attached:
+            root.removeHandler(handler)
+        handlers, self._attached = self._attached, []
+        
+        if self.listener:
+            self.listener.stop()
+            handlers = list(self.listener.handlers)
+            self.listener = None
+        for handler in handlers:
+            handler.close()
+
+log_pipeline = LogPipeline()
+log_pipeline.start()
+atexit.register(log_pipeline.stop)
+
+def log_payload(message: str, payload: Dict[str, Any], *args):
+    """Log a per-link payload at DEBUG for a LOG_PAYLOAD_SAMPLE_RATE sample of calls"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.debug(f"{message}: %s", *args, payload)
 
 # ----------------------------
-# Entry Point
+# Link and Product Rules
 # ----------------------------
 
-def main():
-    """Start the bot."""
-    application = Application.builder().token("YOUR_BOT_TOKEN").build()
-
-    # Register handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("advancing", lambda u, c: toggle_advanced_mode(u, c, True)))
-    application.add_handler(CommandHandler("off_advancing", lambda u, c: toggle_advanced_mode(u, c, False)))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_links))
-
-    # Run the bot
-    application.run_polling()
-
-if __name__ == '__main__':
-    main()        
+# Hosts whose links redirect to the product page
+SHORTENERS = [
+    'amzn.to', 'amzn.in', 'fkrt.it', 'fkrt.cc', 'dl.flipkart.com', 'myntr.it', 'ajio.me',
+    'meesho.page.link', 'bit.ly', 'tinyurl.com', 'cutt.ly', 'rb.gy', 'shorturl.at',
+    'clnk.in', 'ekaro.in', 'bitli.in', 'wishlink.com'
+]
+
+KNOWN_BRANDS = [
+    'Nike', 'Adidas', 'Puma', 'Reebok', 'Skechers', 'Bata', 'Campus', 'Sparx', 'Woodland', 'Red Tape',
+    "Levi's", 'Levi', 'Wrangler', 'Lee', 'Pepe Jeans', 'Flying Machine', 'Roadster', 'HRX', 'H&M', 'Zara',
+    'Allen Solly', 'Van Heusen', 'Louis Philippe', 'Peter England', 'Raymond', 'Arrow', 'U.S. Polo Assn.',
+    'Tommy Hilfiger', 'Jack & Jones', 'Biba', 'Libas', 'Fabindia', 'Jockey',
+    'Samsung', 'Apple', 'OnePlus', 'Xiaomi', 'Redmi', 'Mi', 'Realme', 'Oppo', 'Vivo', 'Motorola', 'Nokia',
+    'Lenovo', 'HP', 'Dell', 'Asus', 'Acer', 'Sony', 'LG', 'boAt', 'JBL', 'Noise', 'Fire-Boltt', 'Boult',
+    'Philips', 'Havells', 'Bajaj', 'Prestige', 'Pigeon', 'Milton', 'Cello', 'Borosil',
+    'Lakme', 'Maybelline', "L'Oreal", 'Nivea', 'Mamaearth', 'Himalaya', 'Dabur', 'Patanjali'
+]
+
+# Regex alternatives per gender, searched in message text and product titles
+GENDER_KEYWORDS = {
+    'Men': [r'\bmen\b', r'\bmens\b', r"\bmen's\b", r'\bmale\b', r'\bboys?\b'],
+    'Women': [r'\bwomen\b', r'\bwomens\b', r"\bwomen's\b", r'\bfemale\b', r'\bgirls?\b', r'\bladies\b'],
+    'Kids': [r'\bkids?\b', r'\bchildren\b', r'\binfant\b'],
+}
+
+QUANTITY_PATTERNS = [
+    r'(\d+\s*(?:ml|l|g|kg|gm|pcs|pieces|pack))\b',
+    r'\bpack\s+of\s+(\d+)',
+    r'\b(\d+)\s*(?:combo|set)\b',
+]
+
+class SmartLinkProcessor:
+    """Find, unshorten and clean product links"""
+    
+    @staticmethod
+    def extract_all_links(text: str) -> List[str]:
+        """Extract every link in a message, full URLs and bare shortener links"""
+        urls = []
+        
+        # Full URLs
+        domain_patterns = [r'https?://[^\s<>"{}|\\^`\[\]]+']
         for pattern in domain_patterns:
             found_urls = re.findall(pattern, text, re.IGNORECASE)
             for url in found_urls:
@@ -386,8 +404,7 @@ if __name__ == '__main__':
                 urls.append(url)
         
         # Shortened URLs
-        short_pattern = r'(?:https?://)?(?:' + '|'.join(re.escape(s) for s in SHORTENERS) + r')/[^\s<>"{}|\\^`\[\]]+'
-        shortened_urls = re.findall(short_pattern, text, re.IGNORECASE)
+        shortened_urls = Rules.SHORT_URL.findall(text)
         
         for url in shortened_urls:
             if not url.startswith('http'):
@@ -399,12 +416,12 @@ if __name__ == '__main__':
         seen = set()
         
         for url in urls:
-            url = re.sub(r'[.,;:!?\)\]]+$', '', url)
+            url = Rules.TRAILING_PUNCT.sub('', url)
             if url and url not in seen and len(url) > 10 and '.' in url:
                 cleaned_urls.append(url)
                 seen.add(url)
         
-        logger.info(f"Extracted {len(cleaned_urls)} unique URLs")
+        logger.debug("Extracted %d unique URLs", len(cleaned_urls))
         return cleaned_urls
     
     @staticmethod
@@ -423,8 +440,11 @@ if __name__ == '__main__':
         current_url = url
         
         for attempt in range(max_attempts):
+            if not stage_timeout(UNSHORTEN_HEAD_TIMEOUT):
+                logger.debug("Out of time unshortening %s", url)
+                break
             try:
-                logger.info(f"Unshortening attempt {attempt + 1}: {current_url}")
+                logger.debug("Unshortening attempt %d: %s", attempt + 1, current_url)
                 
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
@@ -438,38 +458,41 @@ if __name__ == '__main__':
                     async with session.head(
                         current_url, 
                         allow_redirects=True, 
-                        timeout=aiohttp.ClientTimeout(total=10),
+                        timeout=aiohttp.ClientTimeout(total=stage_timeout(UNSHORTEN_HEAD_TIMEOUT)),
                         headers=headers
                     ) as response:
                         final_url = str(response.url)
                         if final_url != current_url and len(final_url) > len(current_url):
-                            logger.info(f"HEAD unshorten successful: {final_url}")
+                            logger.debug("HEAD unshorten successful: %s", final_url)
                             current_url = final_url
                             break
                 except:
                     pass
                 
                 # Fallback to GET
+                timeout = stage_timeout(UNSHORTEN_GET_TIMEOUT)
+                if not timeout:
+                    break
                 try:
                     async with session.get(
                         current_url,
                         allow_redirects=True,
-                        timeout=aiohttp.ClientTimeout(total=15),
+                        timeout=aiohttp.ClientTimeout(total=timeout),
                         headers=headers
                     ) as response:
                         final_url = str(response.url)
                         if final_url != current_url and len(final_url) > len(current_url):
-                            logger.info(f"GET unshorten successful: {final_url}")
+                            logger.debug("GET unshorten successful: %s", final_url)
                             current_url = final_url
                             break
                 except:
                     pass
                 
-                await asyncio.sleep(1)
+                await asyncio.sleep(stage_timeout(1))
                 
             except Exception as e:
                 logger.warning(f"Unshorten attempt {attempt + 1} failed: {e}")
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(stage_timeout(0.5))
         
         return current_url
     
@@ -478,491 +501,1722 @@ if __name__ == '__main__':
         """Clean affiliate parameters from URL"""
         try:
             parsed = urlparse(url)
-            domain = parsed.netloc.lower()
-            
-            # Amazon cleaning
-            if 'amazon' in domain:
-                asin_patterns = [
-                    r'/dp/([A-Z0-9]{10})(?:/|$|\?)',
-                    r'/product/([A-Z0-9]{10})(?:/|$|\?)',
-                    r'/([A-Z0-9]{10})(?:/|$|\?)',
-                    r'asin=([A-Z0-9]{10})',
-                    r'/gp/product/([A-Z0-9]{10})'
-                ]
-                
-                full_path = parsed.path + '?' + parsed.query
-                for pattern in asin_patterns:
-                    match = re.search(pattern, full_path)
-                    if match:
-                        asin = match.group(1)
-                        return f"https://www.amazon.in/dp/{asin}"
-                
-                # Fallback clean
-                query_params = parse_qs(parsed.query)
-                essential_params = {}
-                for key, value in query_params.items():
-                    if key.lower() in ['keywords', 'field-keywords']:
-                        essential_params[key] = value[0]
-                
-                clean_query = urlencode(essential_params)
-                return urlunparse(parsed._replace(query=clean_query))
-            
-            # Flipkart cleaning
-            elif 'flipkart' in domain:
-                pid_patterns = [
-                    r'/p/[^/]+/([^/?]+)',
-                    r'pid=([A-Z0-9]+)',
-                    r'/([A-Z0-9]{16})(?:/|\?|$)'
-                ]
-                
-                full_path = parsed.path + '?' + parsed.query
-                for pattern in pid_patterns:
-                    match = re.search(pattern, full_path)
-                    if match:
-                        pid = match.group(1)
-                        return f"https://www.flipkart.com/p/{pid}"
-                
-                query_params = parse_qs(parsed.query)
-                essential_params = {}
-                for key, value in query_params.items():
-                    if key.lower() in ['pid', 'lid']:
-                        essential_params[key] = value[0]
-                
-                clean_query = urlencode(essential_params)
-                return urlunparse(parsed._replace(query=clean_query))
-            
-            # Meesho cleaning
-            elif 'meesho' in domain:
-                return urlunparse(parsed._replace(query=''))
-            
-            # Myntra cleaning
-            elif 'myntra' in domain:
-                product_match = re.search(r'/(\d+)', parsed.path)
-                if product_match:
-                    product_id = product_match.group(1)
-                    return f"https://www.myntra.com/{product_id}"
-                return urlunparse(parsed._replace(query=''))
-            
-            # Ajio cleaning
-            elif 'ajio' in domain:
-                return urlunparse(parsed._replace(query=''))
-            
-            # Generic cleaning
-            else:
-                query_params = parse_qs(parsed.query)
-                affiliate_keywords = [
-                    'utm_', 'ref', 'tag', 'affiliate', 'aff', 'partner', 
-                    'source', 'medium', 'campaign', 'tracking', 'fbclid',
-                    'gclid', 'mc_', 'zanpid', 'ranMID', 'ranEAID'
-                ]
-                
-                clean_params = {}
-                for key, value in query_params.items():
-                    if not any(keyword in key.lower() for keyword in affiliate_keywords):
-                        clean_params[key] = value[0]
-                
-                clean_query = urlencode(clean_params)
-                return urlunparse(parsed._replace(query=clean_query))
-            
+            return platforms.for_host(parsed.hostname or '').canonical_url(parsed)
         except Exception as e:
             logger.warning(f"Error cleaning URL {url}: {e}")
             return url
         
         return url
 
+def _merge_patterns(patterns: List[str], flags: int = 0) -> re.Pattern:
+    """Compile several patterns into one alternation"""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), flags)
+
+class Rules:
+    """Regex rule sets, compiled once at startup"""
+    
+    # Links
+    URL = re.compile(r'https?://[^\s]+')
+    SHORT_URL = re.compile(
+        r'(?:https?://)?(?:' + '|'.join(re.escape(s) for s in SHORTENERS) + r')/[^\s<>"{}|\\^`\[\]]+',
+        re.IGNORECASE
+    )
+    TRAILING_PUNCT = re.compile(r'[.,;:!?\)\]]+$')
+    
+    # URL canonicalisation
+    ASIN = [re.compile(pattern) for pattern in (
+        r'/dp/([A-Z0-9]{10})(?:/|$|\?)',
+        r'/product/([A-Z0-9]{10})(?:/|$|\?)',
+        r'/([A-Z0-9]{10})(?:/|$|\?)',
+        r'asin=([A-Z0-9]{10})',
+        r'/gp/product/([A-Z0-9]{10})'
+    )]
+    FLIPKART_PID = [re.compile(pattern) for pattern in (
+        r'/p/[^/]+/([^/?]+)',
+        r'pid=([A-Z0-9]+)',
+        r'/([A-Z0-9]{16})(?:/|\?|$)'
+    )]
+    MYNTRA_ID = re.compile(r'/(\d+)')
+    AJIO_CODE = re.compile(r'/p/([\w-]+)')
+    
+    # Message text
+    MANUAL_PRICE = [re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'@\s*(\d+)\s*rs',
+        r'₹\s*(\d+(?:,\d+)*)',
+        r'Rs\.?\s*(\d+(?:,\d+)*)',
+        r'price[:\s]+(\d+(?:,\d+)*)',
+        r'(\d+)\s*rs\b'
+    )]
+    PIN = re.compile(r'\b([1-9]\d{5})\b')
+    SIX_DIGITS = re.compile(r'\b\d{6}\b')
+    
+    # Each gender's keywords merged into one pattern. The page extractor searches lowercased
+    # titles without IGNORECASE, so it gets a case-sensitive copy
+    GENDER = [(gender, _merge_patterns(patterns, re.IGNORECASE)) for gender, patterns in GENDER_KEYWORDS.items()]
+    GENDER_EXACT = [(gender, _merge_patterns(patterns)) for gender, patterns in GENDER_KEYWORDS.items()]
+    QUANTITY = [re.compile(pattern, re.IGNORECASE) for pattern in QUANTITY_PATTERNS]
+    
+    # Page text, last-resort price patterns
+    PAGE_PRICE = [re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'[₹]\s*(\d+(?:,\d+)*)',
+        r'"price"[:\s]*"?(\d+(?:,\d+)*)',
+        r'₹(\d+(?:,\d+)*)',
+        r'Rs\.?\s*(\d+(?:,\d+)*)',
+        r'\bprice["\s]*[:=]\s*["\s]*(\d+(?:,\d+)*)',
+        r'MRP[:\s]*[₹Rs\.]*\s*(\d+(?:,\d+)*)',
+        r'current[_\s]*price["\s]*[:=]\s*["\s]*(\d+(?:,\d+)*)'
+    )]
+    NUMBER = re.compile(r'(\d+(?:,\d+)*)')
+    DIGIT = re.compile(r'\d')
+    SIZE = [re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'\b(XS|S|M|L|XL|XXL|XXXL|2XL|3XL)\b',
+        r'\bSize[:\s]+(XS|S|M|L|XL|XXL|XXXL|2XL|3XL)\b'
+    )]
+    
+    # Title noise, applied in order
+    TITLE_NOISE_EACH = [re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'\s*-\s*Amazon\.in.*$',
+        r'\s*:\s*Amazon\.in.*$',
+        r'\s*\|\s*Flipkart\.com.*$',
+        r'\s*-\s*Buy.*$',
+        r'\s*\|\s*Buy.*$',
+        r'Buy\s+.*?online.*?at.*?price.*?$',
+        r'Shop\s+.*?online.*?$',
+        r'\s*\|\s*Myntra.*$',
+        r'\s*-\s*Meesho.*$',
+        r'\s*\|\s*.*\.com.*$',
+        r'\s*-\s*.*\.in.*$',
+        r'MRP.*?₹.*?\d+',
+        r'Price.*?₹.*?\d+',
+        r'₹\d+.*?off',
+        r'\d+%.*?off',
+        r'discount.*?\d+',
+        r'save.*?₹.*?\d+'
+    )]
+    # The same rules for single-line titles, with runs of "<separator> <literal>.*$" suffix
+    # strippers merged. Each one cuts from its first match to the end, so applying them in turn
+    # cuts at the earliest match of any of them, which the alternation finds in one pass. That
+    # only holds without newlines, where '.*$' cannot reach the end. The lazy multi-part and
+    # in-line patterns depend on what earlier ones removed and stay separate.
+    TITLE_NOISE = [
+        _merge_patterns([
+            r'\s*-\s*Amazon\.in.*$',
+            r'\s*:\s*Amazon\.in.*$',
+            r'\s*\|\s*Flipkart\.com.*$',
+            r'\s*-\s*Buy.*$',
+            r'\s*\|\s*Buy.*$'
+        ], re.IGNORECASE),
+        re.compile(r'Buy\s+.*?online.*?at.*?price.*?$', re.IGNORECASE),
+        re.compile(r'Shop\s+.*?online.*?$', re.IGNORECASE),
+        _merge_patterns([
+            r'\s*\|\s*Myntra.*$',
+            r'\s*-\s*Meesho.*$'
+        ], re.IGNORECASE),
+        re.compile(r'\s*\|\s*.*\.com.*$', re.IGNORECASE),
+        re.compile(r'\s*-\s*.*\.in.*$', re.IGNORECASE),
+        re.compile(r'MRP.*?₹.*?\d+', re.IGNORECASE),
+        re.compile(r'Price.*?₹.*?\d+', re.IGNORECASE),
+        re.compile(r'₹\d+.*?off', re.IGNORECASE),
+        re.compile(r'\d+%.*?off', re.IGNORECASE),
+        re.compile(r'discount.*?\d+', re.IGNORECASE),
+        re.compile(r'save.*?₹.*?\d+', re.IGNORECASE)
+    ]
+    NON_WORD = re.compile(r'^\W+$')
+    PROMO_WORDS = frozenset({
+        "deal", "offer", "sale", "special", "discount", "free",
+        "limited", "new", "buy", "shop", "trending", "exclusive",
+        "best", "lowest", "original", "authentic", "genuine", "brand", "hot"
+    })
+
+class BrandMatcher:
+    """Find known brands in text in one pass, with an Aho-Corasick automaton over the lowercased names"""
+    
+    def __init__(self, brands: List[str]):
+        self.brands: List[str] = []
+        # Node i: goto transitions, failure link and the (length, brand index) matches ending there,
+        # longest first, including those inherited through the failure link
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[int, int], ...]] = [()]
+        
+        seen = set()
+        for brand in brands:
+            key = brand.strip().lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            self._add(key, len(self.brands))
+            self.brands.append(brand.strip())
+        self._link()
+    
+    def _add(self, key: str, index: int):
+        """Insert one lowercased brand into the trie"""
+        node = 0
+        for char in key:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = next_node
+        self._out[node] = ((len(key), index),)
+    
+    def _link(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                if self._out[fail]:
+                    self._out[child] = tuple(sorted(self._out[child] + self._out[fail], reverse=True))
+                queue.append(child)
+    
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """Return (start, end, brand) for every whole-word brand in the lowercased text, leftmost-longest and non-overlapping"""
+        if not text or not self.brands:
+            return []
+        
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not out[node]:
+                continue
+            
+            # Only whole words count, so "mi" does not match inside "mid-wash"
+            if end < len(text) and (text[end].isalnum() or text[end] == '_'):
+                continue
+            for length, index in out[node]:
+                start = end - length
+                if start and (text[start - 1].isalnum() or text[start - 1] == '_'):
+                    continue
+                candidates.append((start, -length, index))
+        
+        matches = []
+        last_end = 0
+        for start, neg_length, index in sorted(candidates):
+            if start >= last_end:
+                last_end = start - neg_length
+                matches.append((start, last_end, self.brands[index]))
+        return matches
+    
+    def best(self, text: str) -> str:
+        """Return the longest brand in the text, the earliest one on ties, or ''"""
+        matches = self.find_all(text)
+        if not matches:
+            return ''
+        return max(matches, key=lambda match: (match[1] - match[0], -match[0]))[2]
+
+brand_matcher = BrandMatcher(KNOWN_BRANDS)
+
+class ProductInfo:
+    """Product fields for one link, from the message text, a scrape or both"""
+    
+    # Slots keep the many short-lived records small; their order is the order of to_dict()
+    __slots__ = ('title', 'price', 'sizes', 'brand', 'gender', 'quantity', 'pin', 'platform', 'error')
+    
+    def __init__(self, title: str = '', price: str = '', sizes: Tuple[str, ...] = (), brand: str = '',
+                 gender: str = '', quantity: str = '', pin: str = '', platform: str = '', error: Optional[str] = None):
+        self.title = title
+        self.price = price
+        self.sizes = tuple(sizes)
+        self.brand = brand
+        self.gender = gender
+        self.quantity = quantity
+        self.pin = pin
+        self.platform = platform
+        self.error = error
+    
+    @property
+    def found(self) -> bool:
+        """Whether a title or a price is known"""
+        return bool(self.title or self.price)
+    
+    def merge(self, other: Optional['ProductInfo'], overwrite: bool = False) -> 'ProductInfo':
+        """Take other's non-empty fields, only where this record has none unless overwrite is set"""
+        if other is not None:
+            for name in ProductInfo.__slots__:
+                value = getattr(other, name)
+                if value and (overwrite or not getattr(self, name)):
+                    setattr(self, name, value)
+        return self
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Every field under its own name, in a fixed order, sizes as a list"""
+        data = {name: getattr(self, name) for name in ProductInfo.__slots__}
+        data['sizes'] = list(self.sizes)
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProductInfo':
+        """Rebuild a record from to_dict() output, ignoring keys it does not know"""
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+    
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ProductInfo):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in ProductInfo.__slots__)
+    
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in ProductInfo.__slots__ if getattr(self, name))
+        return f"ProductInfo({fields})"
+
 class MessageParser:
     """Parse manual product info from messages"""
     
     @staticmethod
-    def extract_manual_info(message: str) -> Dict[str, Any]:
+    def extract_manual_info(message: str) -> ProductInfo:
         """Extract product info from message text"""
-        info = {
-            'title': '',
-            'price': '',
-            'brand': '',
-            'gender': '',
-            'quantity': '',
-            'pin': ''
-        }
+        info = ProductInfo()
         
         # Extract price
-        price_patterns = [
-            r'@\s*(\d+)\s*rs',
-            r'₹\s*(\d+(?:,\d+)*)',
-            r'Rs\.?\s*(\d+(?:,\d+)*)',
-            r'price[:\s]+(\d+(?:,\d+)*)',
-            r'(\d+)\s*rs\b'
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
+        for pattern in Rules.MANUAL_PRICE:
+            match = pattern.search(message)
             if match:
                 price_str = match.group(1).replace(',', '')
                 try:
                     price_num = int(price_str)
                     if 10 <= price_num <= 1000000:
-                        info['price'] = str(price_num)
+                        info.price = str(price_num)
                         break
                 except:
                     continue
         
         # Extract PIN
-        pin_pattern = r'\b([1-9]\d{5})\b'
-        pin_matches = re.findall(pin_pattern, message)
-        for pin in pin_matches:
-            if pin[0] in '123456789':
-                info['pin'] = pin
-                break
+        pin_match = Rules.PIN.search(message)
+        if pin_match:
+            info.pin = pin_match.group(1)
         
         # Extract brand
-        message_lower = message.lower()
-        for brand in KNOWN_BRANDS:
-            if brand.lower() in message_lower:
-                info['brand'] = brand
-                break
+        info.brand = brand_matcher.best(message)
         
         # Extract gender
-        for gender, patterns in GENDER_KEYWORDS.items():
-            for pattern in patterns:
-                if re.search(pattern, message, re.IGNORECASE):
-                    info['gender'] = gender
-                    break
-            if info['gender']:
+        for gender, pattern in Rules.GENDER:
+            if pattern.search(message):
+                info.gender = gender
                 break
         
         # Extract quantity
-        for pattern in QUANTITY_PATTERNS:
-            match = re.search(pattern, message, re.IGNORECASE)
+        for pattern in Rules.QUANTITY:
+            match = pattern.search(message)
             if match:
                 if len(match.groups()) > 0:
                     quantity = match.group(1)
                 else:
                     quantity = match.group(0)
-                info['quantity'] = quantity.strip()
+                info.quantity = quantity.strip()
                 break
         
         # Extract title
         title = message
-        title = re.sub(r'https?://[^\s]+', '', title)
-        for pattern in price_patterns:
-            title = re.sub(pattern, '', title, flags=re.IGNORECASE)
-        title = re.sub(r'\b\d{6}\b', '', title)
+        title = Rules.URL.sub('', title)
+        for pattern in Rules.MANUAL_PRICE:
+            title = pattern.sub('', title)
+        title = Rules.SIX_DIGITS.sub('', title)
         title = ' '.join(title.split())
         
         if title and len(title) > 3:
-            info['title'] = title[:60].strip()
+            info.title = title[:60].strip()
         
         return info
 
-class ProductScraper:
-    """Product information scraper"""
+PARSER_ENGINES = ('html.parser', 'lxml', 'selectolax')
+
+def resolve_parser_engine(engine: str) -> str:
+    """Return the engine to use, falling back to html.parser when a backend is missing"""
+    if engine == 'lxml' and lxml is None:
+        logger.warning("lxml is not installed, falling back to html.parser")
+        return 'html.parser'
+    if engine == 'selectolax' and SelectolaxParser is None:
+        logger.warning("selectolax is not installed, falling back to html.parser")
+        return 'html.parser'
+    if engine not in PARSER_ENGINES:
+        logger.warning(f"Unknown parser engine {engine}, falling back to html.parser")
+        return 'html.parser'
+    return engine
+
+class HtmlDocument:
+    """Parsed page exposing the CSS lookups the extractors need, whatever the engine"""
     
-    @staticmethod
-    def detect_platform(url: str) -> str:
-        """Detect platform from URL"""
-        domain = urlparse(url).netloc.lower()
-        
-        if 'amazon' in domain:
-            return 'amazon'
-        elif 'flipkart' in domain:
-            return 'flipkart'
-        elif 'meesho' in domain:
-            return 'meesho'
-        elif 'myntra' in domain:
-            return 'myntra'
-        elif 'ajio' in domain:
-            return 'ajio'
-        elif 'snapdeal' in domain:
-            return 'snapdeal'
+    def __init__(self, html: str, engine: str = None):
+        self.engine = engine or ACTIVE_PARSER_ENGINE
+        if self.engine == 'selectolax':
+            self._tree = SelectolaxParser(html)
         else:
-            return 'generic'
+            self._soup = BeautifulSoup(html, self.engine)
     
-    @staticmethod
-    async def scrape_with_fallback(url: str, session: aiohttp.ClientSession, manual_info: Dict = None) -> Dict[str, Any]:
-        """Scrape product info with fallbacks"""
-        platform = ProductScraper.detect_platform(url)
-        
-        result = {
-            'title': '',
-            'price': '',
-            'sizes': [],
-            'brand': '',
-            'gender': '',
-            'quantity': '',
-            'pin': '',
-            'platform': platform,
-            'error': None
-        }
-        
-        # Apply manual info first
-        if manual_info:
-            for key, value in manual_info.items():
-                if value:
-                    result[key] = value
-        
-        # Try scraping
-        scraped_info = await ProductScraper._try_scraping_methods(url, session, platform)
+    def select_texts(self, selector: 'str | CssSelector', attr: str = None) -> List[str]:
+        """Stripped text (or attribute value) of every element matching a CSS selector"""
+        if isinstance(selector, CssSelector):
+            attr = attr or selector.attr
+            css, compiled = selector.selector, selector.compiled
+        else:
+            css = compiled = selector
         
-        # Merge scraped info
-        for key, value in scraped_info.items():
-            if value and not result.get(key):
-                result[key] = value
+        if self.engine == 'selectolax':
+            nodes = self._tree.css(css)
+            if attr:
+                return [(node.attributes.get(attr) or '').strip() for node in nodes]
+            return [node.text(strip=True) for node in nodes]
         
-        # Validate result
-        if not result.get('title') and not result.get('price'):
-            result['error'] = 'Could not extract product information'
-            if 'amazon' in url:
-                result['title'] = 'Amazon Product'
-            elif 'flipkart' in url:
-                result['title'] = 'Flipkart Product'
-            elif 'meesho' in url:
-                result['title'] = 'Meesho Product'
+        elements = self._soup.select(compiled)
+        if attr:
+            return [element.get(attr, '').strip() for element in elements]
+        return [element.get_text(strip=True) for element in elements]
+
+ACTIVE_PARSER_ENGINE = resolve_parser_engine(PARSER_ENGINE)
+
+# Structured data locators
+JSON_LD_RE = re.compile(
+    r'<script[^>]+type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+META_TAG_RE = re.compile(r'<meta\s[^>]*>', re.IGNORECASE)
+META_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+NEXT_DATA_RE = re.compile(
+    r'<script[^>]+id\s*=\s*["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+INITIAL_STATE_RE = re.compile(r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.DOTALL)
+META_PRICE_PROPERTIES = ('product:price:amount', 'og:price:amount', 'product:sale_price:amount')
+STATE_PRICE_KEYS = ('finalPrice', 'sellingPrice', 'discountedPrice', 'offerPrice', 'discounted', 'price')
+
+SELECTOR_PART_RE = re.compile(r'([#.]?)([\w-]+)|\[([\w-]+)="([^"]*)"\]')
+
+class SimpleSelector:
+    """The last compound of a CSS selector (tag, #id, .classes, [attr="value"]), matched on start tags"""
+    
+    def __init__(self, selector: str):
+        self.tag = None
+        self.id = None
+        self.classes = set()
+        self.attrs = {}
+        for prefix, name, attr, value in SELECTOR_PART_RE.findall(selector.split()[-1]):
+            if attr:
+                self.attrs[attr] = value
+            elif prefix == '#':
+                self.id = name
+            elif prefix == '.':
+                self.classes.add(name)
             else:
-                result['title'] = 'Product Deal'
-        
-        return result
+                self.tag = name.lower()
     
-    @staticmethod
-    async def _try_scraping_methods(url: str, session: aiohttp.ClientSession, platform: str) -> Dict[str, Any]:
-        """Try multiple scraping methods"""
-        info = {
-            'title': '',
-            'price': '',
-            'sizes': [],
-            'brand': '',
-            'gender': '',
-            'quantity': '',
-            'pin': ''
-        }
-        
-        headers_list = [
-            {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9,hi;q=0.8',
-                'Connection': 'keep-alive'
-            },
-            {
-                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-            }
-        ]
-        
-        for i, headers in enumerate(headers_list):
-            try:
-                logger.info(f"Scraping attempt {i+1} for {platform}")
-                
-                async with session.get(
-                    url, 
-                    headers=headers, 
-                    timeout=aiohttp.ClientTimeout(total=20)
-                ) as response:
-                    
-                    if response.status == 200:
-                        html = await response.text()
-                        
-                        if len(html) > 1000:
-                            extracted_info = ProductScraper._extract_from_html(html, platform, url)
-                            
-                            for key, value in extracted_info.items():
-                                if value and not info.get(key):
-                                    info[key] = value
-                            
-                            if info.get('title') or info.get('price'):
-                                logger.info(f"Successfully extracted data on attempt {i+1}")
-                                break
-                    else:
-                        logger.warning(f"HTTP {response.status} for {url}")
-                        
-            except Exception as e:
-                logger.warning(f"Scraping attempt {i+1} failed: {e}")
-                continue
+    def start_tag_pattern(self) -> str:
+        """Regex for a start tag this selector matches, attributes in any order"""
+        parts = [rf'<{re.escape(self.tag)}\b' if self.tag else r'<[\w-]+\b']
+        if self.id:
+            parts.append(rf'''(?=[^>]*\bid=["']{re.escape(self.id)}["'])''')
+        for name in sorted(self.classes):
+            parts.append(rf'''(?=[^>]*\bclass=["'](?:[^"']*\s)?{re.escape(name)}[\s"'])''')
+        for name, value in sorted(self.attrs.items()):
+            parts.append(rf'''(?=[^>]*\b{re.escape(name)}=["']{re.escape(value)}["'])''')
+        return ''.join(parts) + '[^>]*>'
+
+class CssSelector:
+    """A CSS selector compiled once, for the parsed-page lookups and for the streaming marker scan"""
+    
+    def __init__(self, selector: str):
+        self.selector = selector
+        self.attr = 'content' if selector.startswith('meta') else None
+        self.compiled = soupsieve.compile(selector)
+        self.simple = SimpleSelector(selector)
+
+# Signs in raw HTML that a page has its title or price, looked for while it downloads. They mirror what
+# the extractor reads: og:title and price meta tags, JSON-LD and embedded state JSON
+TITLE_MARKERS = [
+    r'''<meta\b(?=[^>]*\b(?:property|name)=["']og:title["'])[^>]*\bcontent=["']\s*[^"'\s][^"']{5,}''',
+    r'''application/ld\+json["'][^>]*>[^<]*"name"\s*:\s*"\s*[^"\s][^"]{5,}'''
+]
+PRICE_MARKERS = [
+    r'''<meta\b(?=[^>]*\b(?:property|name)=["'](?:''' + '|'.join(re.escape(name) for name in META_PRICE_PROPERTIES)
+    + r''')["'])[^>]*\bcontent=["'][^"']*\d''',
+    r'''application/ld\+json["'][^>]*>[^<]*"(?:price|lowPrice)"\s*:\s*"?\s*\d''',
+    r'''(?:__NEXT_DATA__["'][^>]*>|__INITIAL_STATE__\s*=)[^<]*?"(?:''' + '|'.join(STATE_PRICE_KEYS)
+    + r''')"\s*:\s*(?:\{[^{}<]*?)?"?\d'''
+]
+# The first text inside a selector's element, through nested start tags
+TITLE_TEXT = r'(?:\s*<[^/>][^>]*>)*\s*[^<\s][^<]{5,}'
+PRICE_TEXT = r'(?:\s*<[^/>][^>]*>)*[^<]*\d'
+
+# ----------------------------
+# Platforms
+# ----------------------------
+
+# Query parameter fragments dropped from URLs of shops without their own canonicaliser
+AFFILIATE_PARAM_KEYWORDS = (
+    'utm_', 'ref', 'tag', 'affiliate', 'aff', 'partner',
+    'source', 'medium', 'campaign', 'tracking', 'fbclid',
+    'gclid', 'mc_', 'zanpid', 'ranMID', 'ranEAID'
+)
+
+class Platform:
+    """A shop: its domains, URL canonicaliser, prebuilt selectors, byte budget and deal formatting hooks"""
+    
+    name = 'generic'
+    domains: Tuple[str, ...] = ()   # Registered domains, subdomains match too
+    title_selectors: Tuple[str, ...] = (
+        'h1',
+        '.product-name',
+        '.product-title',
+        'meta[property="og:title"]',
+        'title'
+    )
+    price_selectors: Tuple[str, ...] = ()
+    fallback_title = 'Product Deal'     # Title used when nothing could be scraped
+    lite_kind: Optional[str] = None     # 'json' API or 'html' lite page, when the shop has a lighter representation
+    lite_variant = 'desktop'            # Header variant lite requests are sent with
+    
+    def __init__(self):
+        self.byte_budget = PLATFORM_BYTE_BUDGETS.get(self.name, PLATFORM_BYTE_BUDGETS['generic'])
+        self.lite_headers = dict(SCRAPE_HEADER_VARIANTS[self.lite_variant])
+        if self.lite_kind == 'json':
+            self.lite_headers['Accept'] = 'application/json'
+        self.title_rules = [CssSelector(selector) for selector in self.title_selectors]
+        self.price_rules = [CssSelector(selector) for selector in self.price_selectors]
+        # What _read_page looks for in each chunk while the page downloads, one regex per field
+        self.title_marker = _merge_patterns(TITLE_MARKERS + [
+            rule.simple.start_tag_pattern() + TITLE_TEXT for rule in self.title_rules if not rule.attr
+        ], re.IGNORECASE)
+        self.price_marker = _merge_patterns(PRICE_MARKERS + [
+            rule.simple.start_tag_pattern() + PRICE_TEXT for rule in self.price_rules
+        ], re.IGNORECASE)
+    
+    def canonical_url(self, parsed) -> str:
+        """The product URL without affiliate and tracking parameters"""
+        query_params = parse_qs(parsed.query)
+        clean_params = {}
+        for key, value in query_params.items():
+            if not any(keyword in key.lower() for keyword in AFFILIATE_PARAM_KEYWORDS):
+                clean_params[key] = value[0]
+        
+        clean_query = urlencode(clean_params)
+        return urlunparse(parsed._replace(query=clean_query))
+    
+    def lite_url(self, url: str) -> Optional[str]:
+        """URL of the lighter representation of a canonical product URL, None when there is none"""
+        return None
+    
+    def parse_lite(self, data: Any) -> Dict[str, Any]:
+        """Raw title, price, brand and gender from a decoded 'json' lite response"""
+        return {}
+    
+    def extract_extras(self, html: str, structured: Dict[str, Any], info: ProductInfo, sources: Dict[str, str]):
+        """Fill platform-only fields of an extraction, after title and price"""
+    
+    def deal_lines(self, product_info: ProductInfo) -> List[str]:
+        """Lines a formatted deal gets between the URL and the channel tag"""
+        return []
+
+class AmazonPlatform(Platform):
+    name = 'amazon'
+    domains = ('amazon.in', 'amazon.com')
+    title_selectors = (
+        '#productTitle',
+        'h1.a-size-large.a-spacing-none.a-color-base',
+        'span#productTitle',
+        '.product-title',
+        'meta[property="og:title"]'
+    )
+    price_selectors = ('.a-price-whole', '.a-price .a-offscreen', '.a-price-range')
+    fallback_title = 'Amazon Product'
+    lite_kind = 'html'
+    lite_variant = 'mobile'
+    
+    def lite_url(self, url: str) -> Optional[str]:
+        # The mobile detail page carries title and price at a fraction of the desktop page's size
+        match = Rules.ASIN[0].search(urlparse(url).path)
+        return f"https://www.amazon.in/gp/aw/d/{match.group(1)}" if match else None
+    
+    def canonical_url(self, parsed) -> str:
+        full_path = parsed.path + '?' + parsed.query
+        for pattern in Rules.ASIN:
+            match = pattern.search(full_path)
+            if match:
+                return f"https://www.amazon.in/dp/{match.group(1)}"
+        
+        # No ASIN: keep search keywords only
+        query_params = parse_qs(parsed.query)
+        essential_params = {}
+        for key, value in query_params.items():
+            if key.lower() in ('keywords', 'field-keywords'):
+                essential_params[key] = value[0]
+        return urlunparse(parsed._replace(query=urlencode(essential_params)))
+
+class FlipkartPlatform(Platform):
+    name = 'flipkart'
+    domains = ('flipkart.com',)
+    title_selectors = (
+        '.B_NuCI',
+        '._35KyD6',
+        'h1.yhB1nd',
+        '.fsXA5P',
+        'h1',
+        'meta[property="og:title"]'
+    )
+    price_selectors = ('._30jeq3', '._1_WHN1', '.CEmiEU')
+    fallback_title = 'Flipkart Product'
+    
+    def canonical_url(self, parsed) -> str:
+        full_path = parsed.path + '?' + parsed.query
+        for pattern in Rules.FLIPKART_PID:
+            match = pattern.search(full_path)
+            if match:
+                return f"https://www.flipkart.com/p/{match.group(1)}"
+        
+        query_params = parse_qs(parsed.query)
+        essential_params = {}
+        for key, value in query_params.items():
+            if key.lower() in ('pid', 'lid'):
+                essential_params[key] = value[0]
+        return urlunparse(parsed._replace(query=urlencode(essential_params)))
+
+class MeeshoPlatform(Platform):
+    name = 'meesho'
+    domains = ('meesho.com',)
+    title_selectors = (
+        '[data-testid="product-title"]',
+        '.product-title',
+        'h1',
+        '.sc-bcXHqe',
+        'meta[property="og:title"]'
+    )
+    price_selectors = ('.price', '.current-price')
+    fallback_title = 'Meesho Product'
+    
+    def canonical_url(self, parsed) -> str:
+        return urlunparse(parsed._replace(query=''))
+    
+    def extract_extras(self, html: str, structured: Dict[str, Any], info: ProductInfo, sources: Dict[str, str]):
+        # Sizes, from the embedded state when there is one
+        for stage, text in (('state_json', structured.get('state_text', '')), ('regex', html)):
+            sizes = set()
+            for pattern in Rules.SIZE:
+                for match in pattern.finditer(text):
+                    sizes.add(match.group(1).upper())
+                    if len(sizes) >= 5:
+                        break
             
-            await asyncio.sleep(1)
+            if sizes:
+                info.sizes = tuple(sorted(sizes))
+                sources['sizes'] = stage
+                break
         
-        return info
+        # PIN, only the first few candidates are ever looked at
+        for match in itertools.islice(Rules.PIN.finditer(html), 3):
+            pin = match.group(1)
+            if pin.startswith(tuple('123456789')):
+                info.pin = pin
+                sources['pin'] = 'regex'
+                break
     
-    @staticmethod
-    def _extract_from_html(html: str, platform: str, url: str = '') -> Dict[str, Any]:
-        """Extract product info from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        info = {}
-        
-        # Title extraction
-        title_selectors = {
-            'amazon': [
-                '#productTitle',
-                'h1.a-size-large.a-spacing-none.a-color-base',
-                'span#productTitle',
-                '.product-title',
-                'meta[property="og:title"]'
-            ],
-            'flipkart': [
-                '.B_NuCI',
-                '._35KyD6',
-                'h1.yhB1nd',
-                '.fsXA5P',
-                'h1',
-                'meta[property="og:title"]'
-            ],
-            'meesho': [
-                '[data-testid="product-title"]',
-                '.product-title',
-                'h1',
-                '.sc-bcXHqe',
-                'meta[property="og:title"]'
-            ],
-            'myntra': [
-                '.pdp-name',
-                '.pdp-title',
-                'h1.pdp-name',
-                '.product-brand-name',
-                'meta[property="og:title"]'
-            ],
-            'ajio': [
-                '.prod-name',
-                '.product-name',
-                'h1.prod-title',
-                'meta[property="og:title"]'
-            ],
-            'generic': [
-                'h1',
-                '.product-name',
-                '.product-title',
-                'meta[property="og:title"]',
-                'title'
-            ]
+    def deal_lines(self, product_info: ProductInfo) -> List[str]:
+        sizes = product_info.sizes
+        if sizes and len(sizes) < 5:
+            size_line = f"Size - {', '.join(sizes)}"
+        else:
+            size_line = 'Size - All'
+        return [size_line, f"Pin - {product_info.pin}", '']
+
+class MyntraPlatform(Platform):
+    name = 'myntra'
+    domains = ('myntra.com',)
+    title_selectors = (
+        '.pdp-name',
+        '.pdp-title',
+        'h1.pdp-name',
+        '.product-brand-name',
+        'meta[property="og:title"]'
+    )
+    price_selectors = ('.pdp-price', '.price-current')
+    lite_kind = 'json'
+    
+    def lite_url(self, url: str) -> Optional[str]:
+        match = Rules.MYNTRA_ID.search(urlparse(url).path)
+        return f"https://www.myntra.com/gateway/v2/product/{match.group(1)}" if match else None
+    
+    def parse_lite(self, data: Any) -> Dict[str, Any]:
+        style = data.get('style') or {}
+        price = style.get('price') or {}
+        brand = style.get('brand') or {}
+        return {
+            'title': style.get('name'),
+            'price': price.get('discounted') or price.get('mrp'),
+            'brand': brand.get('name') if isinstance(brand, dict) else brand,
+            'gender': style.get('gender')
         }
-        
-        selectors = title_selectors.get(platform, title_selectors['generic'])
-        for selector in selectors:
-            try:
-                elements = soup.select(selector)
-                for element in elements:
-                    if selector.startswith('meta'):
-                        text = element.get('content', '').strip()
-                    else:
-                        text = element.get_text(strip=True)
-                    
-                    if text and len(text) > 5 and len(text) < 200:
-                        cleaned_title = ProductScraper._clean_title(text)
-                        if cleaned_title:
-                            info['title'] = cleaned_title
-                            break
-                
-                if info.get('title'):
-                    break
-            except:
-                continue
-        
-        # Price extraction
-        price_patterns = [
-            r'[₹]\s*(\d+(?:,\d+)*)',
-            r'"price"[:\s]*"?(\d+(?:,\d+)*)',
-            r'₹(\d+(?:,\d+)*)',
-            r'Rs\.?\s*(\d+(?:,\d+)*)',
-            r'\bprice["\s]*[:=]\s*["\s]*(\d+(?:,\d+)*)',
-            r'MRP[:\s]*[₹Rs\.]*\s*(\d+(?:,\d+)*)',
-            r'current[_\s]*price["\s]*[:=]\s*["\s]*(\d+(?:,\d+)*)'
-        ]
-        
-        # Try selector-based extraction first
-        price_selectors = {
-            'amazon': ['.a-price-whole', '.a-price .a-offscreen', '.a-price-range'],
-            'flipkart': ['._30jeq3', '._1_WHN1', '.CEmiEU'],
-            'meesho': ['.price', '.current-price'],
-            'myntra': ['.pdp-price', '.price-current'],
-            'ajio': ['.prod-price', '.price-current']
+    
+    def canonical_url(self, parsed) -> str:
+        product_match = Rules.MYNTRA_ID.search(parsed.path)
+        if product_match:
+            return f"https://www.myntra.com/{product_match.group(1)}"
+        return urlunparse(parsed._replace(query=''))
+
+class AjioPlatform(Platform):
+    name = 'ajio'
+    domains = ('ajio.com',)
+    title_selectors = (
+        '.prod-name',
+        '.product-name',
+        'h1.prod-title',
+        'meta[property="og:title"]'
+    )
+    price_selectors = ('.prod-price', '.price-current')
+    lite_kind = 'json'
+    
+    def lite_url(self, url: str) -> Optional[str]:
+        match = Rules.AJIO_CODE.search(urlparse(url).path)
+        return f"https://www.ajio.com/api/p/{match.group(1)}" if match else None
+    
+    def parse_lite(self, data: Any) -> Dict[str, Any]:
+        price = data.get('price') or {}
+        return {
+            'title': data.get('name'),
+            'price': price.get('value') if isinstance(price, dict) else price,
+            'brand': data.get('brandName')
         }
-        
-        if platform in price_selectors:
-            for selector in price_selectors[platform]:
-                try:
-                    elements = soup.select(selector)
-                    for element in elements:
-                        text = element.get_text(strip=True)
-                        price_match = re.search(r'(\d+(?:,\d+)*)', text)
-                        if price_match:
-                            price_num = int(price_match.group(1).replace(',', ''))
-                            if 10 <= price_num <= 1000000:
-                                info['price'] = str(price_num)
-                                break
-                    if info.get('price'):
-                        break
+    
+    def canonical_url(self, parsed) -> str:
+        return urlunparse(parsed._replace(query=''))
+
+class SnapdealPlatform(Platform):
+    name = 'snapdeal'
+    domains = ('snapdeal.com',)
+
+class PlatformRegistry:
+    """Platforms by name, and a domain suffix index to find the one a URL belongs to"""
+    
+    def __init__(self, default: Platform):
+        self.default = default
+        self._by_name: Dict[str, Platform] = {default.name: default}
+        self._by_domain: Dict[str, Platform] = {}
+    
+    def register(self, platform: Platform) -> Platform:
+        """Add a platform, its domains and their subdomains resolve to it from now on"""
+        self._by_name[platform.name] = platform
+        for domain in platform.domains:
+            self._by_domain[domain] = platform
+        return platform
+    
+    def get(self, name: str) -> Platform:
+        """Platform by name, the generic one for unknown names"""
+        return self._by_name.get(name, self.default)
+    
+    def for_host(self, host: str) -> Platform:
+        """Platform of a host, matching it and then each parent domain against the index"""
+        host = host.lower().rstrip('.')
+        while host:
+            platform = self._by_domain.get(host)
+            if platform:
+                return platform
+            host = host.partition('.')[2]
+        return self.default
+    
+    def for_url(self, url: str) -> Platform:
+        """Platform a URL belongs to"""
+        try:
+            return self.for_host(urlparse(url).hostname or '')
+        except ValueError:
+            return self.default
+    
+    def names(self) -> List[str]:
+        return list(self._by_name)
+
+platforms = PlatformRegistry(Platform())
+platforms.register(AmazonPlatform())
+platforms.register(FlipkartPlatform())
+platforms.register(MeeshoPlatform())
+platforms.register(MyntraPlatform())
+platforms.register(AjioPlatform())
+platforms.register(SnapdealPlatform())
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set"""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+    
+    def observe(self, value: float, labels: Tuple[Tuple[str, str], ...]):
+        """Add one observation, stored as per-bucket counts followed by sum and count"""
+        series = self.series.get(labels)
+        if series is None:
+            series = [0.0] * (len(self.buckets) + 2)
+            self.series[labels] = series
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+    
+    def quantile(self, q: float, labels: Tuple[Tuple[str, str], ...]) -> float:
+        """Estimate a quantile by interpolating inside its bucket, like Prometheus' histogram_quantile"""
+        series = self.series.get(labels)
+        if not series or not series[-1]:
+            return 0.0
+        
+        rank = q * series[-1]
+        seen = 0.0
+        lower = 0.0
+        for bound, count in zip(self.buckets, series):
+            if seen + count >= rank and count:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+class Metrics:
+    """Process-wide counters, histograms and pulled gauges, rendered in the Prometheus text format"""
+    
+    def __init__(self, prefix: str = 'dealbot'):
+        self.prefix = prefix
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Any]] = {}
+    
+    def counter(self, name: str, help_text: str):
+        """Declare a counter"""
+        self._help[name] = ('counter', help_text)
+        self._counters.setdefault(name, {})
+    
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """Declare a histogram"""
+        self._help[name] = ('histogram', help_text)
+        self._histograms.setdefault(name, Histogram(buckets))
+    
+    def collector(self, name: str, kind: str, help_text: str, read: Callable[[], Any]):
+        """Declare a counter or gauge kept elsewhere, read() returns a number or {label tuple: number}"""
+        self._help[name] = (kind, help_text)
+        self._collectors[name] = read
+    
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Increment a counter"""
+        series = self._counters[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+    
+    def observe(self, name: str, value: float, **labels):
+        """Record one histogram observation"""
+        self._histograms[name].observe(value, tuple(sorted(labels.items())))
+    
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Observe the wall time of the block, awaits inside it included"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def quantile(self, name: str, q: float, **labels) -> float:
+        """Estimated quantile of one histogram series"""
+        return self._histograms[name].quantile(q, tuple(sorted(labels.items())))
+    
+    def series(self, name: str) -> List[Dict[str, str]]:
+        """Label sets recorded for a histogram"""
+        return [dict(labels) for labels in self._histograms[name].series]
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, (kind, help_text) in sorted(self._help.items()):
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            
+            if name in self._collectors:
+                try:
+                    value = self._collectors[name]()
+                except Exception as e:
+                    logger.warning(f"Failed to collect metric {name}: {e}")
+                    continue
+                if isinstance(value, dict):
+                    for labels, item in sorted(value.items()):
+                        lines.append(f"{full_name}{_format_labels(labels)} {item:g}")
+                else:
+                    lines.append(f"{full_name} {value:g}")
+            elif kind == 'counter':
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full_name}{_format_labels(labels)} {value:g}")
+            elif kind == 'histogram':
+                histogram = self._histograms[name]
+                for labels, series in sorted(histogram.series.items()):
+                    cumulative = 0.0
+                    for bound, count in zip(histogram.buckets, series):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative:g}")
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]:g}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {series[-2]:.6f}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {series[-1]:g}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Render a label set as {a="1",b="2"}, escaped per the text format"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+def _escape_label(value: Any) -> str:
+    """Escape backslashes, quotes and newlines in a label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+metrics.histogram('stage_seconds', 'Wall time per pipeline stage and platform')
+metrics.counter('fallbacks_total', 'Fallback paths taken by kind and platform')
+metrics.counter('errors_total', 'Errors by stage and platform')
+metrics.counter('scrape_requests_total', 'Product page requests by platform, header variant and result')
+metrics.counter('lite_requests_total', 'Lite JSON/page requests by platform and result')
+metrics.counter('breaker_rejected_total', 'Requests not sent because the domain circuit was open, by platform')
+
+class ExtractionStats:
+    """Counts which extraction stage produced each field"""
+    
+    def __init__(self, log_every: int = 500):
+        self.log_every = log_every
+        self.pages = 0
+        self.hits: Counter = Counter()
+    
+    def record(self, sources: Dict[str, str]):
+        """Record the stage that filled each field of one page"""
+        self.pages += 1
+        for field, stage in sources.items():
+            self.hits[(field, stage)] += 1
+        
+        if self.pages % self.log_every == 0:
+            logger.info(f"Extraction stage hit rates after {self.pages} pages: {self.hit_rates()}")
+    
+    def hit_rates(self) -> Dict[str, Dict[str, float]]:
+        """Share of pages where each stage produced each field"""
+        rates: Dict[str, Dict[str, float]] = {}
+        for (field, stage), count in sorted(self.hits.items()):
+            rates.setdefault(field, {})[stage] = round(count / self.pages, 3)
+        return rates
+
+extraction_stats = ExtractionStats()
+
+class HeaderStrategy:
+    """Learns which header variant gets product pages through, per platform and per domain"""
+    
+    def __init__(self, variants: Dict[str, Dict[str, str]] = SCRAPE_HEADER_VARIANTS,
+                 decay: float = HEADER_STATS_DECAY, min_attempts: int = HEADER_STATS_MIN_ATTEMPTS,
+                 max_domains: int = HEADER_STATS_MAX_DOMAINS):
+        self.variants = variants
+        self.decay = decay
+        self.min_attempts = min_attempts
+        self.max_domains = max_domains
+        # Scope ('platform:amazon' or 'domain:www.amazon.in') -> variant -> [successes, attempts, success seconds]
+        self.platforms: Dict[str, Dict[str, List[float]]] = {}
+        self.domains: "OrderedDict[str, Dict[str, List[float]]]" = OrderedDict()
+    
+    def _scope_stats(self, url: str, platform: str) -> Dict[str, List[float]]:
+        """The domain's stats once it has enough outcomes, its platform's until then"""
+        domain = self.domains.get(urlparse(url).netloc.lower())
+        if domain and sum(entry[1] for entry in domain.values()) >= self.min_attempts:
+            return domain
+        return self.platforms.get(platform, {})
+    
+    @staticmethod
+    def _success_rate(entry: Optional[List[float]]) -> float:
+        """Smoothed success rate, 0.5 for a variant never tried"""
+        successes, attempts = (entry[0], entry[1]) if entry else (0.0, 0.0)
+        return (successes + 1) / (attempts + 2)
+    
+    def order(self, url: str, platform: str) -> List[str]:
+        """Variants to try, most likely to succeed first, faster first among equals"""
+        stats = self._scope_stats(url, platform)
+        return sorted(
+            self.variants,
+            key=lambda variant: (-self._success_rate(stats.get(variant)), (stats.get(variant) or [0, 0, 0])[2])
+        )
+    
+    def should_race(self, url: str, platform: str) -> bool:
+        """Whether to request with the two leading variants at once"""
+        if not HEADER_RACE or len(self.variants) < 2:
+            return False
+        stats = self._scope_stats(url, platform)
+        return max(self._success_rate(stats.get(variant)) for variant in self.variants) < HEADER_RACE_CONFIDENCE
+    
+    def record(self, url: str, platform: str, variant: str, success: bool, seconds: float):
+        """Count one request's outcome for its platform and its domain"""
+        domain = urlparse(url).netloc.lower()
+        if domain not in self.domains:
+            self.domains[domain] = {}
+            while len(self.domains) > self.max_domains:
+                self.domains.popitem(last=False)
+        self.domains.move_to_end(domain)
+        
+        for stats in (self.platforms.setdefault(platform, {}), self.domains[domain]):
+            entry = stats.setdefault(variant, [0.0, 0.0, 0.0])
+            entry[0] = entry[0] * self.decay + success
+            entry[1] = entry[1] * self.decay + 1
+            if success:
+                entry[2] = seconds if not entry[2] else 0.8 * entry[2] + 0.2 * seconds
+    
+    def success_rates(self) -> Dict[Tuple[str, str], float]:
+        """Smoothed success rate per (platform, variant)"""
+        return {
+            (platform, variant): round(self._success_rate(entry), 3)
+            for platform, stats in self.platforms.items()
+            for variant, entry in stats.items()
+        }
+
+header_strategy = HeaderStrategy()
+
+class LiteStrategy:
+    """Skips a platform's lite tier while it keeps missing, letting one request try it again now and then"""
+    
+    def __init__(self, skip_after: int = LITE_SKIP_AFTER_MISSES, skip_seconds: float = LITE_SKIP_SECONDS):
+        self.skip_after = skip_after
+        self.skip_seconds = skip_seconds
+        self.misses: Dict[str, int] = {}        # Platform -> consecutive misses
+        self.skip_until: Dict[str, float] = {}  # Platform -> monotonic time its lite tier is tried again
+    
+    def should_try(self, platform: str) -> bool:
+        """Whether to send a lite request, the first one after a skip period being the retry"""
+        until = self.skip_until.get(platform)
+        if until is None:
+            return True
+        now = time.monotonic()
+        if now < until:
+            return False
+        self.skip_until[platform] = now + self.skip_seconds
+        return True
+    
+    def record(self, platform: str, success: bool):
+        """Count a lite request that gave title and price, or did not"""
+        if success:
+            if self.skip_until.pop(platform, None) is not None:
+                logger.info(f"Lite tier for {platform} answers again")
+            self.misses.pop(platform, None)
+            return
+        self.misses[platform] = self.misses.get(platform, 0) + 1
+        if self.misses[platform] >= self.skip_after and platform not in self.skip_until:
+            logger.warning(f"Lite tier for {platform} missed {self.misses[platform]} times, "
+                           f"skipping it for {self.skip_seconds:.0f}s")
+            self.skip_until[platform] = time.monotonic() + self.skip_seconds
+
+lite_strategy = LiteStrategy()
+
+class BreakerState:
+    """Circuit state of one domain"""
+    
+    def __init__(self):
+        self.failures = 0           # Consecutive failed requests while closed
+        self.trips = 0              # Times opened since it last closed, drives the backoff
+        self.open_until = 0.0       # Monotonic time the open period ends, 0 while closed
+        self.probe_started = 0.0    # Monotonic time a half-open probe was let through, 0 when none is out
+        self.reason = ''
+
+class CircuitBreaker:
+    """Stops requests to a domain that keeps failing, letting a probe through after an exponential backoff"""
+    
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+    
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, slow_seconds: float = BREAKER_SLOW_SECONDS,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, max_open_seconds: float = BREAKER_MAX_OPEN_SECONDS,
+                 probe_timeout: float = BREAKER_PROBE_TIMEOUT, max_domains: int = HEADER_STATS_MAX_DOMAINS):
+        self.failure_threshold = failure_threshold
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self.max_domains = max_domains
+        self.circuits: "OrderedDict[Tuple[str, str], BreakerState]" = OrderedDict()
+    
+    @staticmethod
+    def _key(url: str, tier: str) -> Tuple[str, str]:
+        """Circuit of a request: the URL's domain and 'page' or 'lite', so a failing lite API does not hold pages back"""
+        return urlparse(url).netloc.lower(), tier
+    
+    def _state_of(self, state: BreakerState, now: float) -> int:
+        """CLOSED, HALF_OPEN once the open period is over, or OPEN"""
+        if not state.open_until:
+            return self.CLOSED
+        return self.OPEN if now < state.open_until else self.HALF_OPEN
+    
+    def blocked(self, url: str, tier: str = 'page') -> bool:
+        """Whether a request to the URL's domain would be refused right now, without taking a probe"""
+        state = self.circuits.get(self._key(url, tier))
+        if state is None:
+            return False
+        now = time.monotonic()
+        circuit = self._state_of(state, now)
+        if circuit == self.HALF_OPEN:
+            return bool(state.probe_started) and now - state.probe_started < self.probe_timeout
+        return circuit == self.OPEN
+    
+    def allow(self, url: str, tier: str = 'page') -> bool:
+        """Whether to send a request, taking the probe slot of a half-open domain"""
+        state = self.circuits.get(self._key(url, tier))
+        if state is None or not state.open_until:
+            return True
+        if self.blocked(url, tier):
+            return False
+        # Half-open: this request is the probe, an abandoned probe frees the slot after probe_timeout
+        state.probe_started = time.monotonic()
+        return True
+    
+    def record(self, url: str, status: Optional[int], seconds: float, retry_after: Optional[float] = None,
+               tier: str = 'page'):
+        """Count a finished request: status None for a network error or timeout"""
+        key = self._key(url, tier)
+        if status is None:
+            reason = 'no response'
+        elif status == 429 or status >= 500:
+            reason = f'HTTP {status}'
+        elif seconds > self.slow_seconds:
+            reason = f'{seconds:.1f}s response'
+        else:
+            reason = ''
+        
+        state = self.circuits.get(key)
+        if not reason:
+            if state is not None and (state.failures or state.open_until):
+                if state.open_until:
+                    logger.info(f"Circuit for {key[0]} ({key[1]}) closed again")
+                del self.circuits[key]
+            return
+        
+        if state is None:
+            state = self.circuits[key] = BreakerState()
+            while len(self.circuits) > self.max_domains:
+                self.circuits.popitem(last=False)
+        self.circuits.move_to_end(key)
+        state.reason = reason
+        
+        now = time.monotonic()
+        if state.open_until:
+            # A failed probe, or a request that was already out when the circuit opened
+            if state.probe_started:
+                self._open(key, state, now, retry_after)
+            return
+        state.failures += 1
+        if state.failures >= self.failure_threshold or retry_after:
+            self._open(key, state, now, retry_after)
+    
+    def _open(self, key: Tuple[str, str], state: BreakerState, now: float, retry_after: Optional[float]):
+        """Open the circuit for the next backoff step, or longer when the server asked for it"""
+        backoff = min(self.max_open_seconds, self.open_seconds * 2 ** state.trips) * random.uniform(0.9, 1.1)
+        seconds = min(self.max_open_seconds, max(backoff, retry_after or 0))
+        state.trips += 1
+        state.open_until = now + seconds
+        state.probe_started = 0.0
+        logger.warning(f"Circuit for {key[0]} ({key[1]}) open for {seconds:.0f}s after {state.reason} (trip {state.trips})")
+    
+    def states(self) -> Dict[Tuple[str, str], int]:
+        """(domain, tier) of circuits that are not closed -> HALF_OPEN or OPEN"""
+        now = time.monotonic()
+        return {
+            key: self._state_of(state, now)
+            for key, state in self.circuits.items()
+            if state.open_until
+        }
+
+circuit_breaker = CircuitBreaker()
+
+# time.monotonic() by which the message being processed should have its replies, None for no limit.
+# Set around a message's links, tasks they start inherit it.
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('current_deadline', default=None)
+
+def deadline_remaining() -> Optional[float]:
+    """Seconds left before the current message's deadline, None when it has none"""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def stage_timeout(limit: float) -> float:
+    """A stage's own timeout cut to the time left, 0 when too little is left to start it"""
+    remaining = deadline_remaining()
+    if remaining is None:
+        return limit
+    return min(limit, remaining) if remaining >= DEADLINE_MIN_STAGE_SECONDS else 0.0
+
+class ProductScraper:
+    """Product information scraper"""
+    
+    @staticmethod
+    def detect_platform(url: str) -> str:
+        """Detect platform from URL"""
+        return platforms.for_url(url).name
+    
+    @staticmethod
+    async def scrape_with_fallback(url: str, session: aiohttp.ClientSession, manual_info: ProductInfo = None,
+                                   cache: 'ProductCache' = None, refresh: bool = False,
+                                   limiter: 'HostLimiter' = None, flight: 'SingleFlight' = None) -> ProductInfo:
+        """Scrape product info with fallbacks, reusing cached scrapes unless refresh is set"""
+        platform = ProductScraper.detect_platform(url)
+        result = ProductScraper._manual_result(platform, manual_info)
+        
+        # Try the cache, then scraping unless the shop's circuit is open
+        scraped_info = cache.get(url) if cache is not None and not refresh else None
+        if scraped_info is None and circuit_breaker.blocked(url):
+            scraped_info = ProductScraper._while_blocked(url, platform, cache)
+        elif scraped_info is None:
+            if flight is not None:
+                # Concurrent calls for the same URL share one scrape, manual info above stays per call
+                scraped_info = await flight.do(
+                    url, lambda: ProductScraper._scrape_and_cache(url, session, platform, cache, limiter)
+                )
+            else:
+                scraped_info = await ProductScraper._scrape_and_cache(url, session, platform, cache, limiter)
+            if not scraped_info.found and circuit_breaker.blocked(url):
+                # The circuit opened during this scrape
+                scraped_info = ProductScraper._while_blocked(url, platform, cache)
+        else:
+            logger.debug("Product cache hit for %s", url)
+        
+        # Merge scraped info into the per-call result, cached records are shared
+        result.merge(scraped_info)
+        
+        # Validate result
+        if not result.found:
+            result.error = 'Could not extract product information'
+            metrics.inc('fallbacks_total', kind='placeholder_title', platform=platform)
+            result.title = platforms.get(platform).fallback_title
+        
+        return result
+    
+    @staticmethod
+    def _manual_result(platform: str, manual_info: ProductInfo = None) -> ProductInfo:
+        """Result fields with the message's manual info applied, the base scraped info is merged into"""
+        return ProductInfo(platform=platform).merge(manual_info, overwrite=True)
+    
+    @staticmethod
+    def partial_result(url: str, manual_info: ProductInfo = None) -> ProductInfo:
+        """Product info from the message alone, for a link that is not scraped, or not yet"""
+        platform = ProductScraper.detect_platform(url)
+        result = ProductScraper._manual_result(platform, manual_info)
+        if not result.found:
+            result.error = 'Not scraped'
+            result.title = platforms.get(platform).fallback_title
+        return result
+    
+    @staticmethod
+    def _while_blocked(url: str, platform: str, cache: 'ProductCache' = None) -> ProductInfo:
+        """Stale cached info for a product whose shop is not being asked, empty when there is none"""
+        stale_info = cache.get_stale(url) if cache is not None else None
+        metrics.inc('fallbacks_total', kind='breaker_stale' if stale_info else 'breaker_open', platform=platform)
+        logger.debug("Circuit open for %s, %s", url, 'serving stale info' if stale_info else 'failing fast')
+        return stale_info or ProductInfo()
+    
+    @staticmethod
+    async def _scrape_and_cache(url: str, session: aiohttp.ClientSession, platform: str,
+                                cache: 'ProductCache' = None, limiter: 'HostLimiter' = None) -> ProductInfo:
+        """Scrape within the per-host limit and cache what was found"""
+        if limiter:
+            async with limiter.limit(url):
+                scraped_info = await ProductScraper._scrape_product(url, session, platform)
+        else:
+            scraped_info = await ProductScraper._scrape_product(url, session, platform)
+        
+        # Only successful scrapes are cached so placeholders are retried
+        if cache is not None and scraped_info.found:
+            cache.set(url, platform, scraped_info)
+        return scraped_info
+    
+    @staticmethod
+    async def _scrape_product(url: str, session: aiohttp.ClientSession, platform: str) -> ProductInfo:
+        """The platform's lite representation first, the full page only when it leaves title or price out"""
+        lite_info = await ProductScraper._try_lite_fetch(url, session, platform) if LITE_FETCH else None
+        if lite_info and lite_info.title and lite_info.price:
+            return lite_info
+        
+        info = await ProductScraper._try_scraping_methods(url, session, platform)
+        if lite_info is not None:
+            metrics.inc('fallbacks_total', kind='lite_to_page', platform=platform)
+            # API values are the shop's own, they win over what the page scrape found
+            info.merge(lite_info, overwrite=True)
+        return info
+    
+    @staticmethod
+    async def _try_lite_fetch(url: str, session: aiohttp.ClientSession, platform: str) -> Optional[ProductInfo]:
+        """Fetch and read the platform's lite representation, None when the platform has none"""
+        site = platforms.get(platform)
+        lite_url = site.lite_url(url) if site.lite_kind else None
+        # Only a share of the message's time, so the page can still be fetched when the lite request hangs
+        remaining = deadline_remaining()
+        limit = LITE_FETCH_TIMEOUT if remaining is None else min(LITE_FETCH_TIMEOUT, remaining * LITE_DEADLINE_SHARE)
+        timeout = stage_timeout(limit) if limit >= DEADLINE_MIN_STAGE_SECONDS else 0.0
+        if not lite_url or not timeout:
+            return None
+        if not lite_strategy.should_try(platform):
+            metrics.inc('lite_requests_total', platform=platform, result='skipped')
+            return None
+        if not circuit_breaker.allow(lite_url, 'lite'):
+            metrics.inc('breaker_rejected_total', platform=platform)
+            return None
+        
+        info = ProductInfo()
+        result = 'miss'
+        status = retry_after = None
+        fetch_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            async with session.get(
+                lite_url,
+                headers=site.lite_headers,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                charset = response.charset or 'utf-8'
+                chunks, size = [], 0
+                if response.status == 200:
+                    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                        chunks.append(chunk)
+                        size += len(chunk)
+                        if size > LITE_MAX_BYTES:
+                            break
+                body = b''.join(chunks)
+                status, fetch_seconds = response.status, time.perf_counter() - start
+                retry_after = ProductScraper._retry_after(response)
+            
+            if len(body) > LITE_MAX_BYTES:
+                result = 'too_large'
+            elif body:
+                if site.lite_kind == 'json':
+                    info = ProductScraper._lite_fields(site.parse_lite(json.loads(body)))
+                else:
+                    info = await extraction_pool.extract(body.decode(charset, errors='replace'), platform, lite_url)
+                
+                if info.title and info.price:
+                    result = 'ok'
+                elif info.found:
+                    result = 'partial'
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Lite fetch failed for {lite_url}: {e!r}")
+            result = 'deadline' if isinstance(e, asyncio.TimeoutError) and timeout < LITE_FETCH_TIMEOUT else 'error'
+        
+        seconds = fetch_seconds or time.perf_counter() - start
+        if result != 'deadline' or seconds >= circuit_breaker.slow_seconds:
+            # A request cut short by the message's deadline before it was slow says nothing about the shop
+            circuit_breaker.record(lite_url, status, seconds, retry_after, tier='lite')
+        if result != 'deadline':
+            lite_strategy.record(platform, result == 'ok')
+        metrics.observe('stage_seconds', time.perf_counter() - start, stage='lite_fetch', platform=platform)
+        metrics.inc('lite_requests_total', platform=platform, result=result)
+        return info
+    
+    @staticmethod
+    def _lite_fields(raw: Dict[str, Any]) -> ProductInfo:
+        """Checked info fields from a platform's parse_lite() output, brand/gender/quantity completed as for pages"""
+        info = ProductInfo()
+        title = raw.get('title')
+        if isinstance(title, str) and 5 < len(title.strip()) < 200:
+            info.title = ProductScraper._clean_title(title)
+        
+        info.price = ProductScraper._parse_price(raw.get('price'))
+        
+        brand = raw.get('brand')
+        ProductScraper._fill_from_title(info, {}, brand.strip() if isinstance(brand, str) else '')
+        
+        gender = raw.get('gender')
+        if not info.gender and isinstance(gender, str) and gender.strip():
+            info.gender = gender.strip()
+        return info
+    
+    @staticmethod
+    async def _try_scraping_methods(url: str, session: aiohttp.ClientSession, platform: str) -> ProductInfo:
+        """Try the header variants, the one that has worked best for this platform/domain first"""
+        info = ProductInfo()
+        
+        variants = header_strategy.order(url, platform)
+        if header_strategy.should_race(url, platform):
+            metrics.inc('fallbacks_total', kind='header_race', platform=platform)
+            rounds = [variants[:2]] + [[variant] for variant in variants[2:]]
+        else:
+            rounds = [[variant] for variant in variants]
+        
+        for i, round_variants in enumerate(rounds):
+            if i:
+                metrics.inc('fallbacks_total', kind='header_retry', platform=platform)
+            
+            if len(round_variants) > 1:
+                results = await ProductScraper._race_variants(url, session, platform, round_variants)
+            else:
+                results = [await ProductScraper._scrape_variant(url, session, platform, round_variants[0])]
+            
+            for extracted_info in results:
+                info.merge(extracted_info)
+            
+            if info.found:
+                logger.debug("Extracted %s data with %s headers", platform, '/'.join(round_variants))
+                break
+        
+        return info
+    
+    @staticmethod
+    async def _race_variants(url: str, session: aiohttp.ClientSession, platform: str,
+                             variants: List[str]) -> List[ProductInfo]:
+        """Request with several variants at once, stopping at the first that finds the product"""
+        tasks = [
+            asyncio.create_task(ProductScraper._scrape_variant(url, session, platform, variant))
+            for variant in variants
+        ]
+        results = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                extracted_info = await next_done
+                results.append(extracted_info)
+                if extracted_info.found:
+                    break
+        finally:
+            # The slower request is abandoned, not counted as a failure
+            for task in tasks:
+                task.cancel()
+        return results
+    
+    @staticmethod
+    async def _scrape_variant(url: str, session: aiohttp.ClientSession, platform: str, variant: str) -> ProductInfo:
+        """Fetch and extract a page with one header variant, recording the outcome in header_strategy"""
+        timeout = stage_timeout(SCRAPE_TIMEOUT)
+        if not timeout:
+            metrics.inc('scrape_requests_total', platform=platform, variant=variant, result='deadline')
+            return ProductInfo()
+        if not circuit_breaker.allow(url):
+            metrics.inc('breaker_rejected_total', platform=platform)
+            return ProductInfo()
+        
+        logger.debug("Scraping %s with %s headers", platform, variant)
+        extracted_info = ProductInfo()
+        # Status once the response is in, None after a network error or timeout
+        status = retry_after = None
+        fetch_seconds = 0.0
+        timed_out = False
+        start = time.perf_counter()
+        try:
+            async with session.get(
+                url, 
+                headers=SCRAPE_HEADER_VARIANTS[variant], 
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                
+                if response.status == 200:
+                    if STREAMING_FETCH:
+                        html = await ProductScraper._read_page(response, platform)
+                    else:
+                        html = await response.text()
+                    status, fetch_seconds = 200, time.perf_counter() - start
+                    metrics.observe('stage_seconds', fetch_seconds, stage='fetch', platform=platform)
+                    
+                    if len(html) > 1000:
+                        extracted_info = await extraction_pool.extract(html, platform, url)
+                else:
+                    status, fetch_seconds = response.status, time.perf_counter() - start
+                    retry_after = ProductScraper._retry_after(response)
+                    logger.warning(f"HTTP {response.status} for {url}")
+                    metrics.inc('errors_total', stage='fetch', platform=platform)
+                    
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            logger.warning(f"Scraping with {variant} headers failed: {e!r}")
+            metrics.inc('errors_total', stage='fetch', platform=platform)
+        
+        seconds = time.perf_counter() - start
+        success = extracted_info.found
+        if timed_out and timeout < SCRAPE_TIMEOUT and seconds < circuit_breaker.slow_seconds:
+            # Cut short by the message's deadline before it was slow, which says nothing about the shop or the variant
+            metrics.inc('scrape_requests_total', platform=platform, variant=variant, result='deadline')
+            return extracted_info
+        circuit_breaker.record(url, status, fetch_seconds or seconds, retry_after)
+        header_strategy.record(url, platform, variant, success, seconds)
+        metrics.inc('scrape_requests_total', platform=platform, variant=variant, result='ok' if success else 'miss')
+        return extracted_info
+    
+    @staticmethod
+    def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        """Seconds a 429/503 response asks to wait, when it says so in seconds"""
+        if response.status not in (429, 503):
+            return None
+        try:
+            return float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            return None
+    
+    @staticmethod
+    async def _read_page(response: aiohttp.ClientResponse, platform: str) -> str:
+        """Read a page in chunks, stopping once title and price are seen or the byte budget is spent"""
+        site = platforms.get(platform)
+        budget = site.byte_budget
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        
+        parts = []
+        received = 0
+        reason = 'end of page'
+        has_title = has_price = found = False
+        tail = ''
+        
+        async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+            received += len(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            
+            # Read one chunk past the point the fields were seen so their elements are complete
+            if found:
+                reason = 'fields found'
+                break
+            # A regex scan, not a parse, so it stays cheap on the event loop even for pages read to the budget
+            window = tail + text
+            has_title = has_title or site.title_marker.search(window) is not None
+            has_price = has_price or site.price_marker.search(window) is not None
+            found = has_title and has_price
+            tail = window[-MARKER_OVERLAP:]
+            
+            if received >= budget:
+                reason = 'byte budget'
+                break
+        
+        parts.append(decoder.decode(b'', final=True))
+        logger.debug("Read %d bytes of %s page (%s)", received, platform, reason)
+        return ''.join(parts)
+    
+    @staticmethod
+    def _timed_extract(html: str, platform: str, url: str = '') -> Tuple[Dict[str, Any], Dict[str, str], float]:
+        """Run _extract_from_html where it runs, returning its info as to_dict(), field sources and run time"""
+        start = time.perf_counter()
+        sources: Dict[str, str] = {}
+        info = ProductScraper._extract_from_html(html, platform, url, sources)
+        return info.to_dict(), sources, time.perf_counter() - start
+    
+    @staticmethod
+    def _extract_from_html(html: str, platform: str, url: str = '', sources: Dict[str, str] = None) -> ProductInfo:
+        """Extract product info from HTML, noting the stage each field came from in sources"""
+        doc = HtmlDocument(html)
+        site = platforms.get(platform)
+        info = ProductInfo()
+        sources = {} if sources is None else sources
+        
+        # Structured data first: JSON-LD, meta tags and embedded state JSON
+        structured = ProductScraper._extract_structured_data(html)
+        
+        if structured.get('title'):
+            cleaned_title = ProductScraper._clean_title(structured['title'])
+            if cleaned_title:
+                info.title = cleaned_title
+                sources['title'] = structured['title_source']
+        
+        # Title extraction
+        for selector in site.title_rules:
+            if info.title:
+                break
+            try:
+                for text in doc.select_texts(selector):
+                    if text and len(text) > 5 and len(text) < 200:
+                        cleaned_title = ProductScraper._clean_title(text)
+                        if cleaned_title:
+                            info.title = cleaned_title
+                            break
+                
+                if info.title:
+                    sources['title'] = 'selector'
+                    break
+            except:
+                continue
+        
+        # Price extraction
+        if structured.get('price'):
+            info.price = structured['price']
+            sources['price'] = structured['price_source']
+        
+        # Then selector-based extraction
+        if not info.price:
+            for selector in site.price_rules:
+                try:
+                    for text in doc.select_texts(selector):
+                        price_match = Rules.NUMBER.search(text)
+                        if price_match:
+                            price_num = int(price_match.group(1).replace(',', ''))
+                            if 10 <= price_num <= 1000000:
+                                info.price = str(price_num)
+                                break
+                    if info.price:
+                        sources['price'] = 'selector'
+                        break
                 except:
                     continue
         
-        # Fallback to regex patterns
-        if not info.get('price'):
-            for pattern in price_patterns:
-                matches = re.findall(pattern, html, re.IGNORECASE)
-                for match in matches:
+        # Last resort: regex over the whole document, stopping at the first valid match
+        if not info.price:
+            for pattern in Rules.PAGE_PRICE:
+                for match in pattern.finditer(html):
                     try:
-                        price_num = int(match.replace(',', ''))
+                        price_num = int(match.group(1).replace(',', ''))
                         if 10 <= price_num <= 1000000:
-                            info['price'] = str(price_num)
+                            info.price = str(price_num)
                             break
                     except:
                         continue
-                if info.get('price'):
+                if info.price:
+                    sources['price'] = 'regex'
                     break
         
         # Platform-specific extractions
-        if platform == 'meesho':
-            # Extract sizes
-            size_patterns = [
-                r'\b(XS|S|M|L|XL|XXL|XXXL|2XL|3XL)\b',
-                r'\bSize[:\s]+(XS|S|M|L|XL|XXL|XXXL|2XL|3XL)\b'
-            ]
-            sizes = set()
-            for pattern in size_patterns:
-                matches = re.findall(pattern, html, re.IGNORECASE)
-                for match in matches:
-                    sizes.add(match.upper())
-                    if len(sizes) >= 5:
-                        break
-            
-            if sizes:
-                info['sizes'] = sorted(list(sizes))
-            
-            # Extract PIN
-            pin_matches = re.findall(r'\b([1-9]\d{5})\b', html)
-            for pin in pin_matches[:3]:
-                if pin.startswith(tuple('123456789')):
-                    info['pin'] = pin
-                    break
+        site.extract_extras(html, structured, info, sources)
         
-        # Extract brand from title
-        if info.get('title'):
-            title_lower = info['title'].lower()
-            for brand in KNOWN_BRANDS:
-                if brand.lower() in title_lower:
-                    info['brand'] = brand
-                    break
+        ProductScraper._fill_from_title(info, sources, structured.get('brand', ''))
+        return info
+    
+    @staticmethod
+    def _fill_from_title(info: ProductInfo, sources: Dict[str, str], structured_brand: str = ''):
+        """Brand, gender and quantity from the title, the brand falling back to a structured one"""
+        # Extract brand from title, then from structured data
+        if info.title:
+            brand = brand_matcher.best(info.title)
+            if brand:
+                info.brand = brand
+                sources['brand'] = 'title'
+        
+        if not info.brand and structured_brand:
+            info.brand = structured_brand
+            sources['brand'] = 'json_ld'
         
         # Extract gender from title
-        if info.get('title'):
-            title_lower = info['title'].lower()
-            for gender, patterns in GENDER_KEYWORDS.items():
-                for pattern in patterns:
-                    if re.search(pattern, title_lower):
-                        info['gender'] = gender
-                        break
-                if info.get('gender'):
+        if info.title:
+            title_lower = info.title.lower()
+            for gender, pattern in Rules.GENDER_EXACT:
+                if pattern.search(title_lower):
+                    info.gender = gender
                     break
         
         # Extract quantity from title
-        if info.get('title'):
-            for pattern in QUANTITY_PATTERNS:
-                match = re.search(pattern, info['title'], re.IGNORECASE)
+        if info.title:
+            for pattern in Rules.QUANTITY:
+                match = pattern.search(info.title)
                 if match:
                     if len(match.groups()) > 0:
-                        info['quantity'] = match.group(1)
+                        info.quantity = match.group(1)
                     else:
-                        info['quantity'] = match.group(0).strip()
+                        info.quantity = match.group(0).strip()
                     break
+    
+    @staticmethod
+    def _extract_structured_data(html: str) -> Dict[str, Any]:
+        """Read title, price and brand from JSON-LD, meta tags and embedded state JSON"""
+        data = {}
+        head_end = html.find('</head>')
+        head = html[:head_end] if head_end != -1 else html[:HEAD_SCAN_CHARS]
+        
+        # JSON-LD Product / Offer blocks
+        for match in JSON_LD_RE.finditer(html):
+            try:
+                product = ProductScraper._find_json_ld_product(json.loads(match.group(1)))
+            except ValueError:
+                continue
+            if not product:
+                continue
+            
+            name = product.get('name')
+            if isinstance(name, str) and 5 < len(name.strip()) < 200:
+                data['title'] = name.strip()
+                data['title_source'] = 'json_ld'
+            
+            brand = product.get('brand')
+            if isinstance(brand, dict):
+                brand = brand.get('name')
+            if isinstance(brand, str) and brand.strip():
+                data['brand'] = brand.strip()
+            
+            offers = product.get('offers')
+            for offer in offers if isinstance(offers, list) else [offers]:
+                if isinstance(offer, dict):
+                    price = ProductScraper._parse_price(offer.get('price') or offer.get('lowPrice'))
+                    if price:
+                        data['price'] = price
+                        data['price_source'] = 'json_ld'
+                        break
+            break
+        
+        # og: / product: price meta tags
+        if not data.get('price'):
+            for tag in META_TAG_RE.finditer(head):
+                attrs = {name.lower(): a or b for name, a, b in META_ATTR_RE.findall(tag.group(0))}
+                if (attrs.get('property') or attrs.get('name')) in META_PRICE_PROPERTIES:
+                    price = ProductScraper._parse_price(attrs.get('content'))
+                    if price:
+                        data['price'] = price
+                        data['price_source'] = 'meta'
+                        break
         
-        return info
+        # Embedded state JSON (__NEXT_DATA__, window.__INITIAL_STATE__)
+        state_match = NEXT_DATA_RE.search(html) or INITIAL_STATE_RE.search(html)
+        if state_match:
+            data['state_text'] = state_match.group(1)
+            if not data.get('price'):
+                try:
+                    price = ProductScraper._find_state_price(json.loads(state_match.group(1)))
+                except ValueError:
+                    price = ''
+                if price:
+                    data['price'] = price
+                    data['price_source'] = 'state_json'
+        
+        return data
+    
+    @staticmethod
+    def _find_json_ld_product(node: Any) -> Optional[Dict[str, Any]]:
+        """Find the Product object in a JSON-LD document"""
+        if isinstance(node, list):
+            for item in node:
+                product = ProductScraper._find_json_ld_product(item)
+                if product:
+                    return product
+            return None
+        
+        if not isinstance(node, dict):
+            return None
+        
+        types = node.get('@type')
+        if types == 'Product' or (isinstance(types, list) and 'Product' in types):
+            return node
+        return ProductScraper._find_json_ld_product(node.get('@graph'))
+    
+    @staticmethod
+    def _find_state_price(state: Any) -> str:
+        """Breadth-first search of embedded state JSON for the shallowest price field"""
+        queue = [state]
+        visited = 0
+        while queue and visited < STATE_JSON_MAX_NODES:
+            next_queue = []
+            for node in queue:
+                visited += 1
+                if isinstance(node, dict):
+                    for key in STATE_PRICE_KEYS:
+                        value = node.get(key)
+                        if isinstance(value, dict):
+                            value = value.get('value') or value.get('amount') or value.get('decimalValue')
+                        price = ProductScraper._parse_price(value)
+                        if price:
+                            return price
+                    next_queue.extend(v for v in node.values() if isinstance(v, (dict, list)))
+                elif isinstance(node, list):
+                    next_queue.extend(v for v in node if isinstance(v, (dict, list)))
+            queue = next_queue
+        return ''
+    
+    @staticmethod
+    def _parse_price(value: Any) -> str:
+        """Normalise a structured price value, rejecting implausible ones"""
+        if isinstance(value, bool) or value is None:
+            return ''
+        try:
+            price_num = int(float(str(value).replace(',', '').strip()))
+        except ValueError:
+            return ''
+        return str(price_num) if 10 <= price_num <= 1000000 else ''
     
     @staticmethod
     def _clean_title(title: str) -> str:
@@ -970,41 +2224,16 @@ class ProductScraper:
         if not title:
             return ''
         
-        noise_patterns = [
-            r'\s*-\s*Amazon\.in.*$',
-            r'\s*:\s*Amazon\.in.*$',
-            r'\s*\|\s*Flipkart\.com.*$',
-            r'\s*-\s*Buy.*$',
-            r'\s*\|\s*Buy.*$',
-            r'Buy\s+.*?online.*?at.*?price.*?$',
-            r'Shop\s+.*?online.*?$',
-            r'\s*\|\s*Myntra.*$',
-            r'\s*-\s*Meesho.*$',
-            r'\s*\|\s*.*\.com.*$',
-            r'\s*-\s*.*\.in.*$',
-            r'MRP.*?₹.*?\d+',
-            r'Price.*?₹.*?\d+',
-            r'₹\d+.*?off',
-            r'\d+%.*?off',
-            r'discount.*?\d+',
-            r'save.*?₹.*?\d+'
-        ]
-        
         clean = title
+        noise_patterns = Rules.TITLE_NOISE if '\n' not in clean else Rules.TITLE_NOISE_EACH
         for pattern in noise_patterns:
-            clean = re.sub(pattern, '', clean, flags=re.IGNORECASE)
+            clean = pattern.sub('', clean)
 
         # Remove extra whitespace
         clean = ' '.join(clean.split())
 
-        promo_words = {
-            "deal", "offer", "sale", "special", "discount", "free",
-            "limited", "new", "buy", "shop", "trending", "exclusive",
-            "best", "lowest", "original", "authentic", "genuine", "brand", "hot"
-        }
-
         words = clean.split()
-        filtered_words = [w for w in words if w.lower() not in promo_words and not re.match(r'^\W+$', w)]
+        filtered_words = [w for w in words if w.lower() not in Rules.PROMO_WORDS and not Rules.NON_WORD.match(w)]
 
         # Remove duplicates while preserving order
         seen = set()
@@ -1024,7 +2253,7 @@ class DealFormatter:
     """Formats product information into a deal structure."""
 
     @staticmethod
-    def format_deal(product_info: Dict[str, Any], clean_url: str, platform: str = '') -> str:
+    def format_deal(product_info: ProductInfo, clean_url: str, platform: str = '') -> str:
         """Format product info into deal structure"""
         
         if not platform:
@@ -1034,14 +2263,14 @@ class DealFormatter:
         line_components = []
         
         # Brand (if available and not in title)
-        brand = product_info.get('brand', '').strip()
-        title = product_info.get('title', '').strip()
+        brand = product_info.brand.strip()
+        title = product_info.title.strip()
         
         if brand and brand.lower() not in title.lower():
             line_components.append(brand)
         
         # Gender
-        gender = product_info.get('gender', '').strip()
+        gender = product_info.gender.strip()
         if gender: # Only append if gender is found
             line_components.append(gender)
         
@@ -1075,7 +2304,7 @@ class DealFormatter:
             line_components.append('Product Deal')
         
         # Price
-        price = product_info.get('price', '').strip()
+        price = product_info.price.strip()
         if price:
             line_components.append(f"@{price} rs")
         
@@ -1092,47 +2321,944 @@ class DealFormatter:
         # Third line: empty
         lines.append('')
         
-        # Meesho-specific info
-        if platform == 'meesho' or 'meesho' in clean_url.lower():
-            # Size info
-            sizes = product_info.get('sizes', [])
-            if sizes:
-                if len(sizes) >= 5:
-                    lines.append('Size - All')
-                else:
-                    lines.append(f"Size - {', '.join(sizes)}")
-            else:
-                lines.append('Size - All')
-            
-            # PIN info
-            pin = product_info.get('pin', '110001')
-            lines.append(f"Pin - {pin}")
-            
-            # Empty line
-            lines.append('')
+        # Platform-specific info (Meesho sizes and PIN)
+        lines.extend(platforms.get(platform).deal_lines(product_info))
         
         # Channel tag
         lines.append('@reviewcheckk')
         
         return '\n'.join(lines)
 
-class DealBot:
-    """Main bot class"""
+class TTLCache:
+    """In-memory LRU cache with per-entry expiry"""
     
-    def __init__(self):
-        self.session = None
-        self.processed_messages = set()
-        self.processing_lock = asyncio.Lock()
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
     
-    async def initialize(self):
-        """Initialize session"""
-        if not self.session:
-            connector = aiohttp.TCPConnector(
-                limit=30,
-                limit_per_host=10,
-                ttl_dns_cache=300,
-                use_dns_cache=True
-            )
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a live entry and mark it recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used ones past max_entries"""
+        self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove an entry"""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else default
+    
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SqliteStore:
+    """Small key/value table in SQLite with expiry, used to keep caches across restarts"""
+    
+    def __init__(self, path: str, table: str):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self.prune()
+    
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (value, expires_at) for a live key"""
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+    
+    def set(self, key: str, value: str, expires_at: float):
+        """Insert or replace a key"""
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+    
+    def set_many(self, rows: List[Tuple[str, str, float]]):
+        """Insert or replace (key, value, expires_at) rows in one transaction"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+                    rows
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    
+    def recent(self, limit: int) -> List[Tuple[str, str, float]]:
+        """Return up to limit live rows, the longest-lived last"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT key, value, expires_at FROM {self.table} WHERE expires_at > ? '
+                'ORDER BY expires_at DESC LIMIT ?',
+                (time.time(), limit)
+            ).fetchall()
+        rows.reverse()
+        return rows
+    
+    def delete(self, key: str):
+        """Remove a key"""
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+    
+    def prune(self):
+        """Drop expired rows"""
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE expires_at <= ?', (time.time(),))
+    
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
+
+class Deduplicator:
+    """Seen message ids and recently posted products per chat, bounded by TTL and LRU with optional SQLite backing"""
+    
+    def __init__(self, message_ttl: float = DEDUP_MESSAGE_TTL, content_window: float = DEDUP_CONTENT_WINDOW,
+                 max_entries: int = DEDUP_MAX_ENTRIES, db_path: Optional[str] = DEDUP_DB_PATH):
+        self.memory = TTLCache(max_entries, message_ttl)
+        self.content_window = content_window
+        self.store = SqliteStore(db_path, 'seen') if db_path else None
+        self._pending: List[Tuple[str, str, float]] = []
+        self._last_flush = time.monotonic()
+        self._last_prune = time.monotonic()
+        self.duplicate_messages = 0
+        self.duplicate_content = 0
+        
+        if self.store:
+            now = time.time()
+            for key, _, expires_at in self.store.recent(max_entries):
+                self.memory.set(key, True, ttl=expires_at - now)
+            logger.info(f"Loaded {len(self.memory)} dedup entries")
+    
+    def _check_and_mark(self, key: str, ttl: float) -> bool:
+        """Record key as seen, returns whether it already was"""
+        if self.memory.get(key) is not None:
+            return True
+        self.memory.set(key, True, ttl=ttl)
+        if self.store:
+            self._pending.append((key, '1', time.time() + ttl))
+        return False
+    
+    def is_duplicate_message(self, chat_id: int, message_id: int) -> bool:
+        """Whether this message was seen already, marking it seen"""
+        duplicate = self._check_and_mark(f"m:{chat_id}:{message_id}", self.memory.ttl)
+        self.duplicate_messages += duplicate
+        return duplicate
+    
+    def is_duplicate_content(self, chat_id: int, canonical_url: str) -> bool:
+        """Whether this product was posted in the chat within the window, marking it posted"""
+        if not self.content_window:
+            return False
+        duplicate = self._check_and_mark(f"c:{chat_id}:{canonical_url}", self.content_window)
+        self.duplicate_content += duplicate
+        return duplicate
+    
+    def forget_content(self, chat_id: int, canonical_url: str):
+        """Unmark a product is_duplicate_content marked posted, when its deal did not go out after all"""
+        if not self.content_window:
+            return
+        key = f"c:{chat_id}:{canonical_url}"
+        self.memory.pop(key)
+        if self.store:
+            # An already expired row replaces the pending or persisted one
+            self._pending.append((key, '1', time.time()))
+    
+    async def flush(self, force: bool = False):
+        """Write pending entries to SQLite once enough have piled up or waited long enough"""
+        if not self.store or not self._pending:
+            return
+        if (not force and len(self._pending) < DEDUP_FLUSH_BATCH
+                and time.monotonic() - self._last_flush < DEDUP_FLUSH_INTERVAL):
+            return
+        
+        batch, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        try:
+            await asyncio.to_thread(self.store.set_many, batch)
+            if time.monotonic() - self._last_prune > 3600:
+                self._last_prune = time.monotonic()
+                await asyncio.to_thread(self.store.prune)
+        except Exception as e:
+            logger.warning(f"Failed to persist {len(batch)} dedup entries: {e}")
+    
+    async def close(self):
+        """Flush pending entries and close the backing store"""
+        if self.store:
+            await self.flush(force=True)
+            self.store.close()
+            self.store = None
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers of the same key"""
+    
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.shared = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn for key, or wait for the call already running for it"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            # Run as its own task so a cancelled caller does not cancel it for the others
+            future = asyncio.ensure_future(self._run_unbounded(fn))
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        return await asyncio.shield(future)
+    
+    @staticmethod
+    async def _run_unbounded(fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn without the deadline of the caller that started it, every caller's wait_for bounds its own wait"""
+        current_deadline.set(None)
+        return await fn()
+    
+    def _finish(self, key: str, future: asyncio.Future):
+        """Forget a finished call"""
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            future.exception()
+    
+    def __len__(self) -> int:
+        return len(self._calls)
+
+class ResolvedUrlCache:
+    """Shortlink to final URL cache with TTL, LRU memory, optional SQLite backing and single-flight"""
+    
+    def __init__(self, ttl: float = URL_CACHE_TTL, max_entries: int = URL_CACHE_MAX_ENTRIES,
+                 db_path: Optional[str] = URL_CACHE_DB_PATH):
+        self.memory = TTLCache(max_entries, ttl)
+        self.store = SqliteStore(db_path, 'resolved_urls') if db_path else None
+        self.flight = SingleFlight()
+        self.disk_hits = 0
+    
+    async def resolve(self, url: str, resolver: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached final URL, or resolve it once for all concurrent callers"""
+        cached = self.memory.get(url)
+        if cached:
+            return cached
+        return await self.flight.do(url, lambda: self._resolve_uncached(url, resolver))
+    
+    async def _resolve_uncached(self, url: str, resolver: Callable[[], Awaitable[str]]) -> str:
+        """Check the disk store, then the network"""
+        if self.store:
+            row = await asyncio.to_thread(self.store.get, url)
+            if row:
+                final_url, expires_at = row
+                self.memory.set(url, final_url, ttl=expires_at - time.time())
+                self.disk_hits += 1
+                return final_url
+        
+        final_url = await resolver()
+        
+        # Failed resolutions come back unchanged and are not cached
+        if final_url and final_url != url:
+            self.memory.set(url, final_url)
+            if self.store:
+                await asyncio.to_thread(self.store.set, url, final_url, time.time() + self.memory.ttl)
+        return final_url
+    
+    def close(self):
+        """Close the backing store"""
+        if self.store:
+            self.store.close()
+            self.store = None
+
+class ProductCache:
+    """Scraped product info keyed by canonical URL, with a TTL per platform"""
+    
+    def __init__(self, max_entries: int = PRODUCT_CACHE_MAX_ENTRIES, ttls: Dict[str, float] = None,
+                 stale_ttl: float = PRODUCT_CACHE_STALE_TTL):
+        self.ttls = ttls or PRODUCT_CACHE_TTLS
+        self.stale_ttl = stale_ttl
+        self.memory = TTLCache(max_entries, self.ttls['generic'])
+        # The same entries for stale_ttl past their freshness, for when the shop cannot be asked
+        self.stale = TTLCache(max_entries, self.ttls['generic'] + stale_ttl)
+    
+    def get(self, url: str) -> Optional[ProductInfo]:
+        """Return fresh scraped info for a canonical URL"""
+        return self.memory.get(url)
+    
+    def get_stale(self, url: str) -> Optional[ProductInfo]:
+        """Return scraped info for a canonical URL that may be past its TTL"""
+        return self.stale.get(url)
+    
+    def set(self, url: str, platform: str, info: ProductInfo):
+        """Store scraped info with its platform's TTL, callers merge from it and never change it"""
+        ttl = self.ttls.get(platform, self.ttls['generic'])
+        self.memory.set(url, info, ttl=ttl)
+        if self.stale_ttl:
+            self.stale.set(url, info, ttl=ttl + self.stale_ttl)
+    
+    def invalidate(self, url: str):
+        """Drop a product so the next request scrapes it again"""
+        self.memory.pop(url)
+        self.stale.pop(url)
+    
+    @property
+    def hits(self) -> int:
+        return self.memory.hits
+    
+    @property
+    def misses(self) -> int:
+        return self.memory.misses
+    
+    def __len__(self) -> int:
+        return len(self.memory)
+
+class ExtractionPool:
+    """Runs HTML extraction off the event loop in a bounded process or thread pool"""
+    
+    def __init__(self, mode: str = EXTRACTION_EXECUTOR, workers: int = EXTRACTION_WORKERS,
+                 max_pending: int = EXTRACTION_MAX_PENDING):
+        self.mode = mode
+        self.workers = workers
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor: Optional[Executor] = None
+        self.inline_seconds = 0.0
+        self.completed = 0
+    
+    def _get_executor(self) -> Executor:
+        """Start the pool on first use"""
+        if self._executor is None:
+            if self.mode == 'process':
+                try:
+                    # spawn avoids forking a process that already runs aiohttp and SQLite threads
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                except (OSError, NotImplementedError, ImportError) as e:
+                    logger.warning(f"Process pool unavailable ({e}), using threads for extraction")
+                    self.mode = 'thread'
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='extract')
+        return self._executor
+    
+    async def extract(self, html: str, platform: str, url: str = '') -> ProductInfo:
+        """Extract product info, waiting for a free slot when the pool is saturated"""
+        start = time.perf_counter()
+        if self.mode == 'inline':
+            try:
+                data, sources, parse_seconds = ProductScraper._timed_extract(html, platform, url)
+            finally:
+                self.inline_seconds += time.perf_counter() - start
+                self.completed += 1
+        else:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                try:
+                    data, sources, parse_seconds = await loop.run_in_executor(
+                        self._get_executor(), ProductScraper._timed_extract, html, platform, url
+                    )
+                except BrokenProcessPool:
+                    logger.error("Extraction process pool broke, restarting it")
+                    self._executor = None
+                    data, sources, parse_seconds = await loop.run_in_executor(
+                        self._get_executor(), ProductScraper._timed_extract, html, platform, url
+                    )
+                finally:
+                    self.completed += 1
+        
+        # Stage stats are recorded here because workers cannot update this process's counters
+        extraction_stats.record(sources)
+        metrics.observe('stage_seconds', parse_seconds, stage='parse', platform=platform)
+        metrics.observe('stage_seconds', max(0.0, time.perf_counter() - start - parse_seconds),
+                        stage='parse_queue', platform=platform)
+        return ProductInfo.from_dict(data)
+    
+    def shutdown(self):
+        """Stop the pool"""
+        if self._executor is not None:
+            # Queued work is cancelled, so waiting only covers extractions already running and the manager thread,
+            # which would otherwise still hold the pool's pipes when concurrent.futures cleans up at exit
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+extraction_pool = ExtractionPool()
+
+class LoopLagMonitor:
+    """Measures how long the event loop is blocked by sleeping and timing the overshoot"""
+    
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, log_interval: float = LOOP_LAG_LOG_INTERVAL):
+        self.interval = interval
+        self.log_interval = log_interval
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start probing the running loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        last_log = time.monotonic()
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            self.blocked_seconds += lag
+            self.max_lag = max(self.max_lag, lag)
+            self.samples += 1
+            
+            if start - last_log >= self.log_interval:
+                logger.info(
+                    f"Event loop lag: max {self.max_lag * 1000:.1f} ms, "
+                    f"mean {self.mean_lag * 1000:.1f} ms, blocked {self.blocked_seconds:.2f} s total"
+                )
+                last_log = start
+    
+    @property
+    def mean_lag(self) -> float:
+        return self.blocked_seconds / self.samples if self.samples else 0.0
+    
+    async def stop(self):
+        """Stop probing"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+class ChatDispatcher:
+    """Per-chat ordered dispatcher with a global in-flight cap"""
+    
+    def __init__(self, max_in_flight: int = MAX_CONCURRENT_MESSAGES):
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._in_flight = 0
+    
+    def submit(self, chat_id: int, job: Callable[[], Awaitable[None]]) -> int:
+        """Queue a job for a chat, returns the chat's queue depth"""
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[chat_id] = queue
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        
+        queue.put_nowait(job)
+        depth = queue.qsize()
+        if depth >= CHAT_QUEUE_WARN_DEPTH:
+            logger.warning(f"Chat {chat_id} queue depth is {depth}")
+        return depth
+    
+    async def _worker(self, chat_id: int, queue: asyncio.Queue):
+        """Run a chat's jobs one at a time, in arrival order"""
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=CHAT_WORKER_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    # No await between the check and the removal, so submit() cannot race us
+                    del self._queues[chat_id]
+                    del self._workers[chat_id]
+                    return
+                continue
+            
+            try:
+                async with self._semaphore:
+                    self._in_flight += 1
+                    try:
+                        await job()
+                    finally:
+                        self._in_flight -= 1
+            except Exception as e:
+                logger.error(f"Error in chat {chat_id} worker: {e}")
+            finally:
+                queue.task_done()
+    
+    def queue_depth(self, chat_id: int) -> int:
+        """Number of messages waiting in a chat's queue"""
+        queue = self._queues.get(chat_id)
+        return queue.qsize() if queue else 0
+    
+    def queue_depths(self) -> Dict[int, int]:
+        """Waiting messages per active chat"""
+        return {chat_id: queue.qsize() for chat_id, queue in self._queues.items()}
+    
+    @property
+    def in_flight(self) -> int:
+        """Number of messages currently being processed"""
+        return self._in_flight
+    
+    async def shutdown(self):
+        """Cancel all chat workers"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+
+class HostLimiter:
+    """Per-host concurrency limit for pipeline stages, like TCPConnector's limit_per_host"""
+    
+    def __init__(self, limit_per_host: int = LINK_LIMIT_PER_HOST):
+        self.limit_per_host = limit_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+    
+    def limit(self, url: str) -> asyncio.Semaphore:
+        """Semaphore guarding work against the URL's host"""
+        host = urlparse(url).netloc.lower()
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit_per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if one is available now"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def consume(self):
+        """Take one token, callers check delay() first"""
+        self._refill()
+        self.tokens -= 1
+    
+    def pause(self, seconds: float):
+        """Hold back the next token for at least seconds"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+class OutboundScheduler:
+    """Paces outgoing messages with token buckets per chat and globally, one send in flight per chat"""
+    
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, max_retries: int = SEND_MAX_RETRIES,
+                 log_every: int = 500):
+        self.max_retries = max_retries
+        self.log_every = log_every
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, asyncio.PriorityQueue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._gate: Optional[asyncio.Task] = None
+        self._seq = itertools.count()
+        self.sent = 0
+        self.edited = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retry_after = 0
+        self.latencies: deque = deque(maxlen=1000)
+    
+    async def send(self, bot, chat_id: int, text: str, priority: int = SEND_PRIORITY_NORMAL, **kwargs):
+        """Queue a message for a chat and wait until it is sent, lower priority values go first"""
+        return await self._enqueue(bot, 'send_message', chat_id, text, priority, kwargs)
+    
+    async def edit(self, bot, chat_id: int, message_id: int, text: str, priority: int = SEND_PRIORITY_NORMAL,
+                   **kwargs):
+        """Queue an edit of a sent message, paced and ordered with the chat's sends"""
+        return await self._enqueue(bot, 'edit_message_text', chat_id, text, priority,
+                                   dict(kwargs, message_id=message_id))
+    
+    async def _enqueue(self, bot, method: str, chat_id: int, text: str, priority: int, kwargs: Dict[str, Any]):
+        """Queue a Bot API call for the chat's worker and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.PriorityQueue()
+            self._queues[chat_id] = queue
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        
+        queue.put_nowait((priority, next(self._seq), time.monotonic(), bot, method, text, kwargs, future))
+        return await future
+    
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        """Per-chat bucket, groups and channels (negative ids) get Telegram's stricter limit"""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(SEND_GROUP_RATE, SEND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+    
+    async def _worker(self, chat_id: int, queue: asyncio.PriorityQueue):
+        """Send a chat's messages one at a time, most urgent first"""
+        bucket = self._bucket(chat_id)
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=CHAT_WORKER_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    # The bucket goes too, an idle chat has refilled it anyway
+                    del self._queues[chat_id]
+                    del self._workers[chat_id]
+                    self._buckets.pop(chat_id, None)
+                    return
+                continue
+            
+            priority, _, queued_at, bot, method, text, kwargs, future = item
+            try:
+                if not future.done():
+                    message = await self._deliver(bot, chat_id, bucket, priority, method, text, kwargs)
+                    self.latencies.append(time.monotonic() - queued_at)
+                    if not future.done():
+                        future.set_result(message)
+            except Exception as e:
+                self.failed += 1
+                metrics.inc('errors_total', stage='send', platform='all')
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                queue.task_done()
+    
+    async def _deliver(self, bot, chat_id: int, bucket: TokenBucket, priority: int, method: str, text: str,
+                       kwargs: Dict[str, Any]):
+        """Call once both buckets allow it, waiting out RetryAfter up to max_retries times"""
+        retries = 0
+        waited = False
+        while True:
+            wait = bucket.delay()
+            if wait:
+                waited = True
+                await asyncio.sleep(wait)
+                continue
+            if await self._acquire_global(priority):
+                waited = True
+            bucket.consume()
+            
+            try:
+                with metrics.time('stage_seconds', stage='send', platform='all'):
+                    message = await getattr(bot, method)(chat_id=chat_id, text=text, **kwargs)
+                if method == 'edit_message_text':
+                    self.edited += 1
+                else:
+                    self.sent += 1
+                    if self.sent % self.log_every == 0:
+                        logger.info(f"Outbound sends: {self.stats()}")
+                self.throttled += waited
+                return message
+            except RetryAfter as e:
+                self.retry_after += 1
+                retries += 1
+                if retries > self.max_retries:
+                    raise
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                logger.warning(f"Telegram asked to wait {delay}s before sending to chat {chat_id}")
+                bucket.pause(delay)
+    
+    async def _acquire_global(self, priority: int) -> bool:
+        """Take a global token, waiting in priority order when there is none. Returns whether it waited"""
+        if not self._waiters and not self.global_bucket.delay():
+            self.global_bucket.consume()
+            return False
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._gate is None or self._gate.done():
+            self._gate = asyncio.create_task(self._release_waiters())
+        await future
+        return True
+    
+    async def _release_waiters(self):
+        """Hand out global tokens to waiters as they refill"""
+        while self._waiters:
+            wait = self.global_bucket.delay()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.global_bucket.consume()
+                future.set_result(None)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters and recent send latency percentiles in seconds"""
+        latencies = sorted(self.latencies)
+        
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+        
+        return {
+            'sent': self.sent,
+            'edited': self.edited,
+            'failed': self.failed,
+            'throttled': self.throttled,
+            'retry_after': self.retry_after,
+            'queued': sum(queue.qsize() for queue in self._queues.values()),
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95)
+        }
+    
+    async def shutdown(self, drain_timeout: float = 10):
+        """Give queued messages a chance to go out, then stop the workers"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in list(self._queues.values()))),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping queued messages on shutdown: {self.stats()}")
+        
+        tasks = list(self._workers.values())
+        if self._gate:
+            tasks.append(self._gate)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+        self._waiters.clear()
+        self._gate = None
+
+send_scheduler = OutboundScheduler()
+
+class MetricsServer:
+    """Local HTTP endpoint serving the metrics registry at /metrics"""
+    
+    def __init__(self, listen: str = METRICS_LISTEN, port: int = METRICS_PORT):
+        self.listen = listen
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self._started = False
+    
+    async def start(self):
+        """Start listening, once, a port already in use only costs the endpoint"""
+        if self._started:
+            return
+        self._started = True
+        
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.listen, self.port).start()
+            logger.info(f"Metrics at http://{self.listen}:{self.port}/metrics")
+        except OSError as e:
+            logger.warning(f"Metrics endpoint disabled, cannot listen on {self.listen}:{self.port}: {e}")
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        """Render the registry"""
+        return web.Response(text=metrics.render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    
+    async def stop(self):
+        """Stop listening"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+class WebhookServer:
+    """HTTP listener for Telegram webhook updates, queued and fed to the application by a few workers"""
+    
+    def __init__(self, application: Application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET_TOKEN,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: List[asyncio.Task] = []
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+    
+    async def start(self):
+        """Start the workers and the HTTP listener"""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Webhook listening on {self.listen}:{self.port}{self.path}")
+    
+    async def stop(self, drain_timeout: float = 10):
+        """Stop accepting updates, let queued ones finish and stop the workers"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.queue.qsize()} queued updates on shutdown")
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        """Validate and queue one update, answering right away"""
+        if self.secret_token:
+            token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token, self.secret_token):
+                logger.warning(f"Rejected webhook request from {request.remote}: bad secret token")
+                return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400)
+        
+        self.received += 1
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram redelivers on non-2xx answers, so nothing is lost while we catch up
+            self.rejected += 1
+            logger.warning(f"Webhook queue full ({self.queue.qsize()}), asking Telegram to retry")
+            return web.Response(status=503)
+        
+        return web.Response()
+    
+    async def _worker(self):
+        """Feed queued updates to the application"""
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                logger.error(f"Failed to process update {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+class DealBot:
+    """Main bot class"""
+    
+    def __init__(self, dedup: Optional[Deduplicator] = None):
+        self.session = None
+        self.dedup = dedup or Deduplicator()
+        self.dispatcher = ChatDispatcher()
+        self.host_limiter = HostLimiter()
+        self.url_cache = ResolvedUrlCache()
+        self.product_cache = ProductCache()
+        self.scrape_flight = SingleFlight()
+        # Replies being delivered after their message's dispatcher slot was freed
+        self.deliveries: set = set()
+        self.loop_monitor = LoopLagMonitor()
+        self.metrics_server = MetricsServer() if METRICS_PORT else None
+        self._register_metrics()
+    
+    def _register_metrics(self):
+        """Expose counters the bot's components already keep"""
+        metrics.collector('cache_requests_total', 'counter', 'Cache lookups by cache and result', lambda: {
+            (('cache', 'product'), ('result', 'hit')): self.product_cache.hits,
+            (('cache', 'product'), ('result', 'miss')): self.product_cache.misses,
+            (('cache', 'url'), ('result', 'hit')): self.url_cache.memory.hits,
+            (('cache', 'url'), ('result', 'miss')): self.url_cache.memory.misses,
+            (('cache', 'url'), ('result', 'disk_hit')): self.url_cache.disk_hits
+        })
+        metrics.collector('coalesced_total', 'counter', 'Requests that joined an in-flight call', lambda: {
+            (('call', 'scrape'),): self.scrape_flight.shared,
+            (('call', 'unshorten'),): self.url_cache.flight.shared
+        })
+        metrics.collector('duplicates_total', 'counter', 'Skipped duplicates by kind', lambda: {
+            (('kind', 'message'),): self.dedup.duplicate_messages,
+            (('kind', 'content'),): self.dedup.duplicate_content
+        })
+        metrics.collector('extraction_fields_total', 'counter', 'Fields found per extraction stage', lambda: {
+            (('field', field), ('stage', stage)): count for (field, stage), count in extraction_stats.hits.items()
+        })
+        metrics.collector('extraction_pages_total', 'counter', 'Pages run through extraction',
+                          lambda: extraction_stats.pages)
+        metrics.collector('sends_total', 'counter', 'Outgoing messages by outcome', lambda: {
+            (('result', 'sent'),): send_scheduler.sent,
+            (('result', 'edited'),): send_scheduler.edited,
+            (('result', 'failed'),): send_scheduler.failed,
+            (('result', 'throttled'),): send_scheduler.throttled,
+            (('result', 'retry_after'),): send_scheduler.retry_after
+        })
+        metrics.collector('send_queue_depth', 'gauge', 'Messages waiting to be sent',
+                          lambda: send_scheduler.stats()['queued'])
+        metrics.collector('chat_queue_depth', 'gauge', 'Incoming messages waiting across chats',
+                          lambda: sum(self.dispatcher.queue_depths().values()))
+        metrics.collector('messages_in_flight', 'gauge', 'Messages being processed',
+                          lambda: self.dispatcher.in_flight)
+        metrics.collector('loop_lag_max_seconds', 'gauge', 'Longest event loop stall seen',
+                          lambda: self.loop_monitor.max_lag)
+        metrics.collector('header_success_ratio', 'gauge', 'Smoothed scrape success rate by header variant', lambda: {
+            (('platform', platform), ('variant', variant)): rate
+            for (platform, variant), rate in header_strategy.success_rates().items()
+        })
+        metrics.collector('breaker_state', 'gauge', 'Circuits not closed: 1 half-open, 2 open', lambda: {
+            (('domain', domain), ('tier', tier)): state for (domain, tier), state in circuit_breaker.states().items()
+        })
+        metrics.collector('log_records_dropped_total', 'counter', 'Log records dropped with the log queue full',
+                          lambda: log_pipeline.dropped)
+    
+    async def initialize(self):
+        """Initialize session"""
+        self.loop_monitor.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if not self.session:
+            connector = aiohttp.TCPConnector(
+                limit=CONNECTOR_LIMIT,
+                limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+                use_dns_cache=True
+            )
             timeout = aiohttp.ClientTimeout(total=30, connect=10)
             self.session = aiohttp.ClientSession(
                 connector=connector,
@@ -1142,118 +3268,425 @@ class DealBot:
     
     async def cleanup(self):
         """Cleanup resources"""
+        await self.dispatcher.shutdown()
+        if self.deliveries:
+            # Edits are queued only once their placeholder is delivered, the scheduler is still there for them
+            await asyncio.wait(self.deliveries, timeout=10)
+        await send_scheduler.shutdown()
+        await self.loop_monitor.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        extraction_pool.shutdown()
+        self.url_cache.close()
+        await self.dedup.close()
         if self.session:
             await self.session.close()
             self.session = None
     
     async def process_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Process incoming messages"""
-        async with self.processing_lock:
-            try:
-                message = update.message or update.channel_post
-                if not message:
-                    return
-                
-                # Prevent duplicate processing
-                message_id = f"{message.chat_id}_{message.message_id}"
-                if message_id in self.processed_messages:
-                    return
-                
-                self.processed_messages.add(message_id)
-                
-                # Memory management
-                if len(self.processed_messages) > 200:
-                    old_messages = list(self.processed_messages)[:100]
-                    for old_msg in old_messages:
-                        self.processed_messages.discard(old_msg)
-                
-                await self.initialize()
-                
-                # Extract text
-                text = message.text or message.caption or ''
-                if not text or len(text.strip()) < 5:
-                    return
-                
-                logger.info(f"Processing message: {text[:100]}...")
-                
-                # Extract links
+        """Queue incoming messages, in order per chat and concurrently across chats"""
+        message = update.message or update.channel_post
+        if not message:
+            return
+        
+        # Prevent duplicate processing
+        message_id = f"{message.chat_id}_{message.message_id}"
+        if self.dedup.is_duplicate_message(message.chat_id, message.message_id):
+            logger.info("Skipping duplicate message %s", message_id)
+            return
+        await self.dedup.flush()
+        
+        # The deadline runs from here, time queued behind the chat's earlier messages counts
+        deadline = time.monotonic() + MESSAGE_DEADLINE if MESSAGE_DEADLINE else None
+        depth = self.dispatcher.submit(
+            message.chat_id,
+            lambda: self._handle_message(update, context, message, deadline)
+        )
+        logger.debug("Queued message %s (chat queue depth %d)", message_id, depth)
+    
+    async def _handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message,
+                              deadline: Optional[float] = None):
+        """Run the deal pipeline for one message"""
+        try:
+            await self.initialize()
+            
+            # Extract text
+            text = message.text or message.caption or ''
+            if not text or len(text.strip()) < 5:
+                return
+            
+            logger.info("Processing message: %s...", text[:100])
+            
+            # Extract links
+            with metrics.time('stage_seconds', stage='extract_links', platform='all'):
                 links = SmartLinkProcessor.extract_all_links(text)
-                
-                if not links:
-                    logger.info("No links found")
-                    return
-                
-                logger.info(f"Found {len(links)} links")
-                
-                # Process each link
-                results = []
-                for i, url in enumerate(links):
-                    try:
-                        logger.info(f"Processing link {i+1}/{len(links)}: {url}")
-                        
-                        # Unshorten if needed
-                        if SmartLinkProcessor.is_shortened_url(url):
-                            logger.info(f"Unshortening URL: {url}")
-                            url = await SmartLinkProcessor.unshorten_url_aggressive(url, self.session)
-                            logger.info(f"Unshortened to: {url}")
-                        
-                        # Clean URL
-                        clean_url = SmartLinkProcessor.clean_affiliate_url_aggressive(url)
-                        logger.info(f"Cleaned URL: {clean_url}")
-                        
-                        # Extract manual info
-                        manual_info = MessageParser.extract_manual_info(text)
-                        logger.info(f"Manual info: {manual_info}")
-                        
-                        # Scrape product info
-                        product_info = await ProductScraper.scrape_with_fallback(
-                            clean_url, 
-                            self.session, 
-                            manual_info
-                        )
-                        logger.info(f"Product info: {product_info}")
-                        
-                        # Detect platform
-                        platform = ProductScraper.detect_platform(clean_url)
-                        
-                        # Format message
-                        formatted_message = DealFormatter.format_deal(product_info, clean_url, platform)
-                        
-                        results.append(formatted_message)
-                        
-                        # Brief delay
-                        if len(links) > 1 and i < len(links) - 1:
-                            await asyncio.sleep(1)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing link {url}: {str(e)}")
-                        error_msg = f"Product Deal\n{url}\n\n@reviewcheckk"
-                        results.append(error_msg)
-                        continue
-                
-                # Send results
-                for result in results:
-                    try:
-                        await safe_send_message(
-                            update, 
-                            context, 
-                            result, 
-                            disable_web_page_preview=True
-                        )
-                        
-                        if len(results) > 1:
-                            await asyncio.sleep(0.5)
-                    except Exception as e:
-                        logger.error(f"Failed to send result: {e}")
-                        continue
-                        
+            
+            if not links:
+                logger.debug("No links found")
+                return
+            
+            logger.info("Found %d links", len(links))
+            
+            # A group gets one message per 1 / SEND_GROUP_RATE seconds and an edit costs as much as a send,
+            # placeholders would only push its finished deals back
+            if PROGRESSIVE_REPLY and message.chat_id > 0:
+                await self._reply_progressively(update, context, links, text, message.chat_id, deadline)
+                return
+            
+            # Process links concurrently, results keep the original order
+            results = await self._process_links(links, text, message.chat_id, deadline)
+            results = [result for result in results if result]
+            
+            # Queue the results and free the dispatcher slot, the scheduler paces them and keeps their order
+            for result in results:
+                self._deliver(safe_send_message(update, context, result, disable_web_page_preview=True))
+                    
+        except Exception as e:
+            logger.error(f"Error in process_message: {str(e)}")
+            try:
+                error_msg = "❌ Error processing message\n\n@reviewcheckk"
+                await safe_send_message(update, context, error_msg, priority=SEND_PRIORITY_LOW)
+            except:
+                pass
+
+    def _deliver(self, coro: Awaitable[Any]) -> asyncio.Future:
+        """Run a send or edit in its own task, so no dispatcher slot waits out the chat's pacing"""
+        # Tasks take their first step, which queues the call with the scheduler, in creation order
+        task = asyncio.ensure_future(coro)
+        self.deliveries.add(task)
+        task.add_done_callback(self.deliveries.discard)
+        return task
+    
+    async def _process_links(self, links: List[str], text: str, chat_id: int,
+                             deadline: Optional[float] = None) -> List[Optional[str]]:
+        """Run links through the pipeline concurrently, returning results in link order by the deadline"""
+        _, tasks = self._start_links(links, text, chat_id, deadline)
+        return await asyncio.gather(*tasks)
+    
+    def _start_links(self, links: List[str], text: str, chat_id: int,
+                     deadline: Optional[float] = None) -> Tuple[ProductInfo, List[asyncio.Task]]:
+        """Start a task per link, returning the message's manual info and the tasks in link order"""
+        # Manual info comes from the message text, so it is the same for every link
+        with metrics.time('stage_seconds', stage='manual_parse', platform='all'):
+            manual_info = MessageParser.extract_manual_info(text)
+        log_payload("Manual info", manual_info)
+        
+        semaphore = asyncio.Semaphore(LINK_CONCURRENCY)
+        
+        async def run(i: int, url: str) -> str:
+            async with semaphore:
+                logger.info("Processing link %d/%d: %s", i + 1, len(links), url)
+                return await self._process_link(url, manual_info, chat_id)
+        
+        # Tasks copy the context they are created in, deadline included
+        token = current_deadline.set(deadline)
+        try:
+            return manual_info, [asyncio.ensure_future(run(i, url)) for i, url in enumerate(links)]
+        finally:
+            current_deadline.reset(token)
+    
+    async def _reply_progressively(self, update: Update, context: ContextTypes.DEFAULT_TYPE, links: List[str],
+                                   text: str, chat_id: int, deadline: Optional[float] = None):
+        """Reply in link order at once, with placeholders for unfinished links that are edited as they finish"""
+        manual_info, tasks = self._start_links(links, text, chat_id, deadline)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait(tasks, timeout=PROGRESSIVE_REPLY_AFTER)
+            finished = [task.done() for task in tasks]
+            
+            # Results and placeholders are queued in link order, the scheduler keeps that order per chat
+            replies = [
+                (i, task.result() if done else self._placeholder(links[i], manual_info))
+                for i, (task, done) in enumerate(zip(tasks, finished))
+            ]
+            sends = {
+                i: self._deliver(safe_send_message(update, context, reply, disable_web_page_preview=True))
+                for i, reply in replies if reply
+            }
+            self._deliver(self._observe_first_reply(start, list(sends.values())))
+            
+            # Scraping holds the slot, the edits wait for their placeholders without it
+            unfinished = [i for i, done in enumerate(finished) if not done]
+            if unfinished:
+                await asyncio.wait([tasks[i] for i in unfinished])
+            for i in unfinished:
+                self._deliver(self._finish_placeholder(update, context, tasks[i], sends.get(i)))
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    async def _observe_first_reply(start: float, sends: List[asyncio.Future]):
+        """Record the time until a message's first replies were delivered"""
+        if sends:
+            await asyncio.wait(sends)
+        metrics.observe('stage_seconds', time.perf_counter() - start, stage='first_reply', platform='all')
+    
+    def _placeholder(self, url: str, manual_info: ProductInfo) -> str:
+        """Deal text from the link and the message's own info, sent while the link is scraped"""
+        resolved = url
+        if SmartLinkProcessor.is_shortened_url(url):
+            # The affiliate shortlink stays out of the chat, its final URL goes in if it is cached already
+            resolved = self.url_cache.memory.get(url)
+        clean_url = SmartLinkProcessor.clean_affiliate_url_aggressive(resolved) if resolved else ''
+        platform = ProductScraper.detect_platform(clean_url or url)
+        product_info = ProductScraper.partial_result(clean_url or url, manual_info)
+        lines = DealFormatter.format_deal(product_info, clean_url, platform).split('\n')
+        if not clean_url:
+            # The URL line comes with the edit, once the link is resolved
+            del lines[1]
+        lines.append(PROGRESSIVE_PLACEHOLDER_NOTE)
+        return '\n'.join(lines)
+    
+    async def _finish_placeholder(self, update: Update, context: ContextTypes.DEFAULT_TYPE, task: asyncio.Task,
+                                  send: Optional[asyncio.Future]):
+        """Edit a placeholder into its link's result once the link is done and the placeholder delivered"""
+        result = await task
+        placeholder = await send if send is not None else None
+        if placeholder is None:
+            # The placeholder did not go out, the result is sent on its own
+            if result:
+                await safe_send_message(update, context, result, disable_web_page_preview=True)
+            return
+        if not result:
+            # The chat already had this product, the placeholder goes
+            try:
+                await context.bot.delete_message(chat_id=placeholder.chat_id, message_id=placeholder.message_id)
             except Exception as e:
-                logger.error(f"Error in process_message: {str(e)}")
+                logger.warning(f"Failed to delete placeholder: {e}")
+            return
+        await safe_edit_message(update, context, placeholder, result, disable_web_page_preview=True)
+    
+    async def _unshorten(self, url: str) -> str:
+        """Resolve a shortlink over the network, within the per-host limit"""
+        async with self.host_limiter.limit(url):
+            return await SmartLinkProcessor.unshorten_url_aggressive(url, self.session)
+    
+    async def _process_link(self, url: str, manual_info: ProductInfo, chat_id: int) -> Optional[str]:
+        """Unshorten, clean, scrape and format a single link, None when the chat just had it"""
+        link_start = time.perf_counter()
+        platform = 'unknown'
+        marked_url = None
+        posted = False
+        try:
+            # Unshorten if needed
+            if SmartLinkProcessor.is_shortened_url(url):
+                logger.debug("Unshortening URL: %s", url)
+                start = time.perf_counter()
                 try:
-                    error_msg = "❌ Error processing message\n\n@reviewcheckk"
-                    await safe_send_message(update, context, error_msg)
-                except:
-                    pass
+                    # Stages fit their own timeouts in, wait_for stops whatever overruns
+                    url = await asyncio.wait_for(self.url_cache.resolve(url, lambda: self._unshorten(url)),
+                                                 deadline_remaining())
+                except asyncio.TimeoutError:
+                    logger.info("Out of time unshortening %s, replying with manual info", url)
+                    metrics.inc('fallbacks_total', kind='deadline', platform=ProductScraper.detect_platform(url))
+                    return DealFormatter.format_deal(ProductScraper.partial_result(url, manual_info), url,
+                                                     ProductScraper.detect_platform(url))
+                metrics.observe('stage_seconds', time.perf_counter() - start,
+                                stage='unshorten', platform=ProductScraper.detect_platform(url))
+                logger.info("Unshortened to: %s", url)
+            
+            # Clean URL
+            platform = ProductScraper.detect_platform(url)
+            with metrics.time('stage_seconds', stage='clean', platform=platform):
+                clean_url = SmartLinkProcessor.clean_affiliate_url_aggressive(url)
+            logger.debug("Cleaned URL: %s", clean_url)
+            
+            if self.dedup.is_duplicate_content(chat_id, clean_url):
+                logger.info("Skipping %s, already posted in chat %s recently", clean_url, chat_id)
+                return None
+            marked_url = clean_url
+            
+            # Scrape product info
+            try:
+                product_info = await asyncio.wait_for(ProductScraper.scrape_with_fallback(
+                    clean_url, 
+                    self.session, 
+                    manual_info,
+                    cache=self.product_cache,
+                    limiter=self.host_limiter,
+                    flight=self.scrape_flight
+                ), deadline_remaining())
+            except asyncio.TimeoutError:
+                logger.info("Out of time scraping %s, replying with manual info", clean_url)
+                metrics.inc('fallbacks_total', kind='deadline', platform=platform)
+                product_info = ProductScraper.partial_result(clean_url, manual_info)
+            else:
+                # Placeholders are not the product's deal, a repost within the window gets scraped again
+                posted = not product_info.error
+            log_payload("Product info for %s", product_info, clean_url)
+            
+            # Detect platform
+            platform = ProductScraper.detect_platform(clean_url)
+            
+            # Format message
+            with metrics.time('stage_seconds', stage='format', platform=platform):
+                result = DealFormatter.format_deal(product_info, clean_url, platform)
+            metrics.observe('stage_seconds', time.perf_counter() - link_start, stage='link', platform=platform)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error processing link {url}: {str(e)}")
+            metrics.inc('errors_total', stage='link', platform=platform)
+            return f"Product Deal\n{url}\n\n@reviewcheckk"
+        finally:
+            if marked_url and not posted:
+                self.dedup.forget_content(chat_id, marked_url)
+
+class BulkRunner:
+    """Runs a file of messages through the deal pipeline, writing results in input order with resumable checkpoints"""
+    
+    def __init__(self, bot: 'DealBot', output_path: str, checkpoint_path: Optional[str] = None,
+                 concurrency: int = BULK_CONCURRENCY, window: int = BULK_REORDER_WINDOW,
+                 checkpoint_every: int = BULK_CHECKPOINT_EVERY):
+        self.bot = bot
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.window = max(window, concurrency)
+        self.checkpoint_every = checkpoint_every
+        self.position = 0
+        self.messages = 0
+        self.links = 0
+        self.failed = 0
+        self._output = None
+        self._started = 0.0
+        self._resumed_messages = 0
+    
+    @staticmethod
+    def read_messages(path: str, input_format: str, start: int = 0):
+        """Yield (position, record) from a JSONL or CSV file, lazily, skipping positions before start
+        
+        The position is the line number in JSONL and the row number in CSV, so
+        a checkpoint can skip ahead without parsing what was already done.
+        """
+        with open(path, newline='', encoding='utf-8') as source:
+            if input_format == 'csv':
+                for position, row in enumerate(csv.DictReader(source)):
+                    if position >= start:
+                        yield position, row
+                return
+            for position, line in enumerate(source):
+                if position < start or not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = {'error': f"invalid JSON: {e}"}
+                if not isinstance(record, dict):
+                    record = {'text': str(record)}
+                yield position, record
+    
+    def _load_checkpoint(self, input_path: str) -> Tuple[int, int]:
+        """(next input position, output bytes to keep) from a checkpoint of the same input, else a fresh start"""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return 0, 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}")
+            return 0, 0
+        if checkpoint.get('input') != os.path.abspath(input_path):
+            logger.warning(f"Checkpoint {self.checkpoint_path} is for {checkpoint.get('input')}, starting over")
+            return 0, 0
+        self.messages = checkpoint.get('messages', 0)
+        self.links = checkpoint.get('links', 0)
+        self.failed = checkpoint.get('failed', 0)
+        return checkpoint['position'], checkpoint['output_bytes']
+    
+    def _save_checkpoint(self, input_path: str):
+        """Flush the output and record how far it got, atomically"""
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        checkpoint = {
+            'input': os.path.abspath(input_path),
+            'position': self.position,
+            'output_bytes': self._output.tell(),
+            'messages': self.messages,
+            'links': self.links,
+            'failed': self.failed,
+            'updated': time.time()
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+    
+    async def _process(self, position: int, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract, unshorten, clean, scrape and format the links of one message"""
+        result = {'position': position, 'id': record.get('id'), 'links': [], 'results': []}
+        if record.get('error'):
+            result['error'] = record['error']
+            return result
+        
+        text = record.get('text') or record.get('caption') or ''
+        async with self.semaphore:
+            try:
+                with metrics.time('stage_seconds', stage='extract_links', platform='all'):
+                    links = SmartLinkProcessor.extract_all_links(text)
+                result['links'] = links
+                if links:
+                    chat_id = record.get('chat_id') or 0
+                    result['results'] = await self.bot._process_links(links, text, chat_id)
+            except Exception as e:
+                logger.error(f"Bulk message at {position} failed: {e}")
+                result['error'] = str(e)
+        return result
+    
+    def _write(self, result: Dict[str, Any]):
+        """Append one result line and move the checkpoint position past it"""
+        self._output.write(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.position = result['position'] + 1
+        self.messages += 1
+        self.links += len(result['links'])
+        self.failed += 'error' in result
+    
+    async def run(self, input_path: str, input_format: str = 'jsonl', resume: bool = True) -> Dict[str, Any]:
+        """Process every message after the checkpoint, returns totals"""
+        start, keep_bytes = self._load_checkpoint(input_path) if resume else (0, 0)
+        if start:
+            logger.info(f"Resuming {input_path} at position {start} ({self.messages} messages already written)")
+        
+        # Anything past the checkpoint was written by a run that did not get to record it, and is redone
+        self._output = open(self.output_path, 'ab')
+        self._output.truncate(keep_bytes)
+        self._output.seek(keep_bytes)
+        self.position = start
+        self._started = time.monotonic()
+        self._resumed_messages = self.messages
+        
+        pending = deque()
+        since_checkpoint = 0
+        try:
+            for position, record in self.read_messages(input_path, input_format, start):
+                if len(pending) >= self.window:
+                    self._write(await pending.popleft())
+                    since_checkpoint += 1
+                    if since_checkpoint >= self.checkpoint_every:
+                        self._save_checkpoint(input_path)
+                        self._log_progress()
+                        since_checkpoint = 0
+                pending.append(asyncio.ensure_future(self._process(position, record)))
+            while pending:
+                self._write(await pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+            self._save_checkpoint(input_path)
+            self._output.close()
+        
+        self._log_progress()
+        return {'messages': self.messages, 'links': self.links, 'failed': self.failed}
+    
+    def _log_progress(self):
+        """One line with totals and this run's rate"""
+        elapsed = time.monotonic() - self._started
+        logger.info(
+            "Bulk: %d messages, %d links, %d failed, position %d (%.1f messages/s this run)",
+            self.messages, self.links, self.failed, self.position,
+            (self.messages - self._resumed_messages) / elapsed if elapsed else 0.0
+        )
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle start command"""
@@ -1272,7 +3705,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🔗 Send any product link and get perfectly formatted deals!\n\n"
         "@reviewcheckk"
     )
-    await safe_send_message(update, context, msg, parse_mode=ParseMode.MARKDOWN)
+    await safe_send_message(update, context, msg, priority=SEND_PRIORITY_HIGH, parse_mode=ParseMode.MARKDOWN)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
@@ -1283,91 +3716,200 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await safe_send_message(
                 update, 
                 context, 
-                "❌ Sorry, an error occurred. Please try again.\n\n@reviewcheckk"
+                "❌ Sorry, an error occurred. Please try again.\n\n@reviewcheckk",
+                priority=SEND_PRIORITY_LOW
             )
     except:
         pass
 
-async def safe_send_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
-    """Safe message sending"""
+async def safe_send_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str,
+                            priority: int = SEND_PRIORITY_NORMAL, **kwargs):
+    """Safe message sending through the outbound scheduler"""
     if not update or not update.effective_chat:
         logger.error("Invalid update or chat")
         return
     
+    chat_id = update.effective_chat.id
     try:
         # Ensure text length limit
         if len(text) > 4096:
             text = text[:4090] + "..."
         
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=text,
-            **kwargs
-        )
-        logger.info("Message sent successfully")
+        message = await send_scheduler.send(context.bot, chat_id, text, priority, **kwargs)
+        logger.debug("Message sent successfully")
+        return message
+        
+    except RetryAfter as e:
+        # Still rate limited after the retries, a fallback message would only add to it
+        logger.error(f"Dropped message to chat {chat_id}, rate limited: {e}")
         
     except Exception as e:
         logger.error(f"Failed to send message: {e}")
         
         try:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="❌ Error processing request\n\n@reviewcheckk"
+            await send_scheduler.send(
+                context.bot,
+                chat_id,
+                "❌ Error processing request\n\n@reviewcheckk",
+                SEND_PRIORITY_LOW
             )
         except Exception as e2:
             logger.error(f"Failed to send fallback message: {e2}")
 
+async def safe_edit_message(update: Update, context: ContextTypes.DEFAULT_TYPE, message, text: str,
+                            priority: int = SEND_PRIORITY_NORMAL, **kwargs):
+    """Edit a sent message through the outbound scheduler, sending the text anew if the edit fails"""
+    if len(text) > 4096:
+        text = text[:4090] + "..."
+    if text == message.text:
+        return message
+    
+    try:
+        return await send_scheduler.edit(context.bot, message.chat_id, message.message_id, text, priority, **kwargs)
+    except RetryAfter as e:
+        logger.error(f"Dropped edit in chat {message.chat_id}, rate limited: {e}")
+    except Exception as e:
+        # Deleted or too old to edit, the result still has to reach the chat
+        logger.warning(f"Failed to edit message {message.message_id}, sending instead: {e}")
+        return await safe_send_message(update, context, text, priority, **kwargs)
+
+def build_application(bot: DealBot) -> Application:
+    """Create the Telegram application with the bot's handlers"""
+    async def stop(application: Application):
+        print("\n🛑 Shutting down bot...")
+        await bot.cleanup()
+    
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .connect_timeout(30)
+        .read_timeout(30)
+        .write_timeout(30)
+        .pool_timeout(30)
+    )
+    if RUN_MODE == 'webhook':
+        # Updates arrive through WebhookServer, there is nothing to poll
+        builder = builder.updater(None)
+    else:
+        # run_polling installs its own SIGINT/SIGTERM handlers and calls this once it has stopped,
+        # before shutdown() closes the HTTP client queued sends still go out through
+        builder = builder.post_stop(stop)
+    application = builder.build()
+    
+    # Add handlers
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(MessageHandler(
+        filters.TEXT | filters.CAPTION, 
+        bot.process_message
+    ))
+    
+    # Add error handler
+    application.add_error_handler(error_handler)
+    
+    return application
+
+async def run_webhook(application: Application, bot: DealBot):
+    """Serve webhook updates until SIGINT or SIGTERM"""
+    # The listener is public, updates without Telegram's secret header must be refused
+    secret_token = WEBHOOK_SECRET_TOKEN
+    if not secret_token:
+        if not WEBHOOK_URL:
+            raise RuntimeError("WEBHOOK_SECRET_TOKEN must be set when the webhook is registered outside the bot")
+        secret_token = secrets.token_urlsafe(32)
+        logger.info("Generated a webhook secret token for this run")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    server = WebhookServer(application, secret_token=secret_token)
+    await application.initialize()
+    try:
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=DROP_PENDING_UPDATES
+            )
+        await application.start()
+        await server.start()
+        await stop.wait()
+        print("\n🛑 Shutting down bot...")
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await bot.cleanup()
+        await application.shutdown()
+
+async def run_bulk(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run a message file through a DealBot that only writes results, no Telegram involved"""
+    # Reformatting history: every post gets its result, and the live bot's dedup state is left alone
+    bot = DealBot(dedup=Deduplicator(content_window=0, db_path=None))
+    bot.metrics_server = None
+    runner = BulkRunner(bot, args.output, args.checkpoint, concurrency=args.concurrency)
+    
+    await bot.initialize()
+    try:
+        return await runner.run(args.input, args.format, resume=not args.restart)
+    finally:
+        await bot.cleanup()
+
+def bulk_main(argv: List[str]) -> int:
+    """Command line for bulk mode, returns the exit status"""
+    parser = argparse.ArgumentParser(
+        prog='bot.py bulk',
+        description='Format every deal in a JSONL or CSV file of messages, resuming where a previous run stopped'
+    )
+    parser.add_argument('input', help="messages, JSONL objects or CSV rows with a 'text' column and optional 'id'")
+    parser.add_argument('-o', '--output', required=True, help='results, one JSON line per message in input order')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='input format, by default from the extension')
+    parser.add_argument('--checkpoint', help='checkpoint file, OUTPUT.checkpoint by default')
+    parser.add_argument('--concurrency', type=int, default=BULK_CONCURRENCY, help='messages processed at once')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from the top')
+    args = parser.parse_args(argv)
+    args.format = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    
+    try:
+        totals = asyncio.run(run_bulk(args))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped, run the same command again to resume")
+        return 130
+    print(f"✅ {totals['messages']} messages, {totals['links']} links, {totals['failed']} failed -> {args.output}")
+    return 1 if totals['failed'] else 0
+
 def main():
     """Main function"""
+    if sys.argv[1:2] == ['bulk']:
+        sys.exit(bulk_main(sys.argv[2:]))
+    
     print("🚀 Starting Deal Bot v2.0...")
+    if not BOT_TOKEN:
+        print("❌ BOT_TOKEN is not set")
+        sys.exit(1)
     
     try:
-        # Create application
-        application = (
-            Application.builder()
-            .token(BOT_TOKEN)
-            .connect_timeout(30)
-            .read_timeout(30)
-            .write_timeout(30)
-            .pool_timeout(30)
-            .build()
-        )
-        
         # Initialize bot
         bot = DealBot()
-        
-        # Add handlers
-        application.add_handler(CommandHandler("start", start_command))
-        application.add_handler(MessageHandler(
-            filters.TEXT | filters.CAPTION, 
-            bot.process_message
-        ))
-        
-        # Add error handler
-        application.add_error_handler(error_handler)
-        
-        # Setup cleanup
-        import signal
-        import sys
-        
-        def signal_handler(sig, frame):
-            print("\n🛑 Shutting down bot...")
-            asyncio.create_task(bot.cleanup())
-            sys.exit(0)
-        
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        application = build_application(bot)
         
         # Start bot
-        print(f"✅ Bot @{BOT_USERNAME} is running...")
+        print(f"✅ Bot @{BOT_USERNAME} is running ({RUN_MODE})...")
         print("📡 Monitoring all channels, groups, and DMs")
         print("🔗 Processing product links with enhanced accuracy")
         print("📝 Strict deal format compliance enabled")
         
-        # Run bot
+        if RUN_MODE == 'webhook':
+            asyncio.run(run_webhook(application, bot))
+            return
+        
+        # Run bot, build_application hooked bot.cleanup() to its stop
         application.run_polling(
             allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
+            drop_pending_updates=DROP_PENDING_UPDATES
         )
         
     except Exception as e: